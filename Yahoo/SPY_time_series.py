@@ -9,7 +9,13 @@ import pandas as pd, pickle, sys, itertools, string, sys, re, datetime, time, sh
 import os.path
 from os import path
 import sqlite3
-from sqlalchemy import create_engine
+
+# Shared, pooled database engine lives with the feature engineering scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'feature-engineering'))
+import dbConnection
+import dataframeHandling as dfhandle
+import columnarStore
+import price_downloader
 
 
 
@@ -26,12 +32,16 @@ def pull_spy_list():
 
 #load table to postgres DB
 def load_table(file_name,table_name):
-    engine = create_engine("postgresql://postgres:dfdk#418!@@35.237.73.115/postgres")
     df=pd.read_csv(file_name)
+    load_frame(df, table_name)
+
+#load an in-memory frame to the database or parquet store
+def load_frame(df,table_name):
     df['Sno']=df.index
     df['symbol']=df[' Symbol']
     columns = ['Sno','date_of_transaction', 'High', 'Low', 'Open', 'Close', 'Volume', 'Adj Close','symbol','Year','Month','Week','Day','Dayofweek','Dayofyear','Is_month_end','Is_month_start','Is_quarter_end','Is_quarter_start','Is_year_end','Is_year_start','Elapsed'] 
-    df[columns].to_sql(table_name,engine, if_exists='append',index=False)
+    # The database, or the parquet store when STORAGE_BACKEND=parquet
+    dfhandle.load_table(df[columns], table_name)
 
 def save_to_database():
     DBPATH='Data/capstone.db'
@@ -40,7 +50,9 @@ def save_to_database():
     df.to_sql('stock_price', cnx)   
 
 def find_max_date():
-    engine = create_engine("postgresql://postgres:dfdk#418!@@35.237.73.115/postgres")
+    if dfhandle.use_parquet():
+        return columnarStore.find_max_date('spy_stock_price', 'date_of_transaction')
+    engine = dbConnection.get_engine()
     df=pd.read_sql_query('select max(date_of_transaction) as date_of_transaction from spy_stock_price',con=engine)
     last_pulled_date=df['date_of_transaction'].max()
 
@@ -96,11 +108,20 @@ def add_datepart(df, fldname, drop=True, time=False, errors="raise"):
 
 
 
-def main():
+def print_timings(timings):
+    print("Timing breakdown:")
+    for step, seconds in timings:
+        print("  {:<20} {:0.3f} seconds".format(step, seconds))
+    print("  {:<20} {:0.3f} seconds".format('total', sum(seconds for _, seconds in timings)))
 
-    
-    
-    count=0
+
+def main(write_csv=False):
+    """
+    Download new SPY prices, add the date parts and load them into
+    spy_stock_price, handing the frame from step to step in memory;
+    write_csv additionally saves the intermediate csv files as artifacts
+    """
+    timings = []
     last_pulled_date=find_max_date()
 
 
@@ -108,52 +129,55 @@ def main():
     last_pulled_date2=datetime.date(int(last_pulled_date.split('-')[0]),int(last_pulled_date.split('-')[1]),int(last_pulled_date.split('-')[2]))+ datetime.timedelta(days=1)
 
     #print (last_pulled_date2)
-    exists = os.path.isfile('Data/basic_spy_stock_price.csv')
-
-    
-
-    if exists:
-        os.remove('Data/basic_spy_stock_price.csv')
-  
     lst=["SPY"]
 
-    for v in lst:
-        stock = data.DataReader(name=v.replace('.','-'),data_source="yahoo", start=last_pulled_date2, end=dt.datetime.now())
-        stock['Symbol']=v
-        exists = os.path.isfile('Data/basic_spy_stock_price.csv')
+    start = time.time()
+    stock, failures = price_downloader.download_prices(lst, start=last_pulled_date2, end=dt.datetime.now())
+    timings.append(('download', time.time() - start))
 
-        if exists:
-            
-            stock.to_csv(r'Data/basic_spy_stock_price.csv', header=False, index=True, mode='a', sep=',')
-        else:
-            
-            stock.to_csv(r'Data/basic_spy_stock_price.csv', header=True, index=True, mode='a', sep=',')
-        count=count+1
+    # Nothing to load: SPY failed every retry (reported above), or no new trading days yet
+    if stock.empty:
+        print("No SPY prices downloaded since {} ({} failed); nothing to load"
+              .format(last_pulled_date2, len(failures)))
+        print_timings(timings)
+        sys.exit(1 if failures else 0)
 
-    df = pd.read_csv('Data/basic_spy_stock_price.csv')
+    if write_csv:
+        start = time.time()
+        stock.to_csv(r'Data/basic_spy_stock_price.csv', header=True, index=True, sep=',')
+        timings.append(('basic csv artifact', time.time() - start))
+
+    start = time.time()
+    df = stock.reset_index()
     print( df['Date'].min(), df['Date'].max())
     df.columns = ['date_of_transaction', 'High', 'Low', 'Open', 'Close', 'Volume', 'Adj Close',' Symbol']
     print(df.head())
     add_datepart(df, 'date_of_transaction')
     df.columns = ['date_of_transaction', 'High', 'Low', 'Open', 'Close', 'Volume', 'Adj Close',' Symbol','Year','Month','Week','Day','Dayofweek','Dayofyear','Is_month_end','Is_month_start','Is_quarter_end','Is_quarter_start','Is_year_end','Is_year_start','Elapsed'] 
-    df.reset_index()
-    df.columns = ['date_of_transaction', 'High', 'Low', 'Open', 'Close', 'Volume', 'Adj Close',' Symbol','Year','Month','Week','Day','Dayofweek','Dayofyear','Is_month_end','Is_month_start','Is_quarter_end','Is_quarter_start','Is_year_end','Is_year_start','Elapsed'] 
+
+    # Keep the date key as the same text the csv round-trip used to store
+    df['date_of_transaction'] = df['date_of_transaction'].dt.strftime('%Y-%m-%d')
+    timings.append(('add_datepart', time.time() - start))
     
     print(df.head())
 
-    exists = os.path.isfile('Data/spy_stock_price.csv')
-
-    if exists:
-        os.remove('Data/spy_stock_price.csv')
+    if write_csv:
+        start = time.time()
+        df.to_csv(r'Data/spy_stock_price.csv', header=True, index=True, sep=',')
+        timings.append(('spy csv artifact', time.time() - start))
     
+    #Saving to postgres
+    start = time.time()
+    load_frame(df,'spy_stock_price')
+    timings.append(('database load', time.time() - start))
 
-    df.to_csv(r'Data/spy_stock_price.csv', header=True, index=True, mode='a', sep=',')
-    
-    #Saving to sqlite
-    load_table('Data/spy_stock_price.csv','spy_stock_price')
+    if not write_csv:
+        print("In-memory hand-off: skipped writing and re-reading basic_spy_stock_price.csv and spy_stock_price.csv")
+    print_timings(timings)
+    dbConnection.print_stats()
 
 ##############################
 ##Execution
 ##############################
 if __name__ == '__main__':
-    main()
+    main(write_csv='-csv' in sys.argv)
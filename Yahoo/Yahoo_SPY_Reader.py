@@ -9,7 +9,13 @@ import pandas as pd, pickle, sys, itertools, string, sys, re, datetime, time, sh
 import os.path
 from os import path
 import sqlite3
-from sqlalchemy import create_engine
+
+# Shared, pooled database engine lives with the feature engineering scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'feature-engineering'))
+import dbConnection
+import dataframeHandling as dfhandle
+import columnarStore
+import price_downloader
 
 
 
@@ -27,12 +33,16 @@ def pull_spy_list():
 
 #loading table to postgres db
 def load_table(file_name,table_name):
-    engine = create_engine("postgresql://postgres:dfdk#418!@@35.237.73.115/postgres")
     df=pd.read_csv(file_name)
+    load_frame(df, table_name)
+
+#loading an in-memory frame to the database or parquet store
+def load_frame(df,table_name):
     df['sno']=df.index
     #df['symbol']=df[' Symbol']
     columns = ['sno','date_of_transaction', 'High', 'Low', 'Open', 'Close', 'Volume', 'AdjClose','Symbol','Year','Month','Week','Day','Dayofweek','Dayofyear','Is_month_end','Is_month_start','Is_quarter_end','Is_quarter_start','Is_year_end','Is_year_start','Elapsed'] 
-    df[columns].to_sql(table_name,engine, if_exists='append',index=False)
+    # The database, or the parquet store when STORAGE_BACKEND=parquet
+    dfhandle.load_table(df[columns], table_name)
 
 
 
@@ -44,8 +54,9 @@ def save_to_database():
 
 #Finding the max date
 def find_max_date():
-
-    engine = create_engine("postgresql://postgres:dfdk#418!@@35.237.73.115/postgres")
+    if dfhandle.use_parquet():
+        return columnarStore.find_max_date('stock_price', 'date_of_transaction')
+    engine = dbConnection.get_engine()
     df=pd.read_sql_query('select max(date_of_transaction) as date_of_transaction from stock_price',con=engine)
     last_pulled_date=df['date_of_transaction'].max()    
 
@@ -101,17 +112,20 @@ def add_datepart(df, fldname, drop=True, time=False, errors="raise"):
 
 
 
-def main():
+def print_timings(timings):
+    print("Timing breakdown:")
+    for step, seconds in timings:
+        print("  {:<20} {:0.3f} seconds".format(step, seconds))
+    print("  {:<20} {:0.3f} seconds".format('total', sum(seconds for _, seconds in timings)))
 
-    
 
-    basic_stock_exists = os.path.isfile('Data/basic_stock_price.csv')
-    
-    
-        
-    if basic_stock_exists:
-        os.remove('Data/basic_stock_price.csv')
-    
+def main(write_csv=False):
+    """
+    Download new prices, add the date parts and load them into stock_price.
+    Frames are handed from step to step in memory; write_csv additionally
+    saves basic_stock_price.csv and stock_price.csv as side artifacts
+    """
+    timings = []
 
     #Saving SPY List to a csv file
     #with atomic_overwrite("spy_list.csv") as f:
@@ -140,39 +154,52 @@ def main():
     print (last_pulled_date2)
     
 
-    for v in df['Symbol']:
-        stock = data.DataReader(name=v.replace('.','-'),data_source="yahoo", start=last_pulled_date2, end=dt.datetime.now())
-        stock['Symbol']=v
-        exists = os.path.isfile('Data/basic_stock_price.csv')
-        if exists:
-            
-            stock.to_csv(r'Data/basic_stock_price.csv', header=False, index=True, mode='a', sep=',')
-        else:
-            
-            stock.to_csv(r'Data/basic_stock_price.csv', header=True, index=True, mode='a', sep=',')
-        count=count+1
-
-    df = pd.read_csv('Data/basic_stock_price.csv')
+    # Pull every symbol concurrently (rate limited, with retries)
+    start = time.time()
+    stocks, failures = price_downloader.download_prices(df['Symbol'].tolist(), start=last_pulled_date2,
+                                                        end=dt.datetime.now())
+    timings.append(('download', time.time() - start))
+
+    # Nothing to load: every symbol failed (reported above), or no new trading days yet
+    if stocks.empty:
+        print("No prices downloaded for {} symbols since {} ({} failed); nothing to load"
+              .format(len(df), last_pulled_date2, len(failures)))
+        print_timings(timings)
+        sys.exit(1 if failures else 0)
+
+    if write_csv:
+        start = time.time()
+        stocks.to_csv(r'Data/basic_stock_price.csv', header=True, index=True, sep=',')
+        timings.append(('basic csv artifact', time.time() - start))
+
+    start = time.time()
+    df = stocks.reset_index()
     #print( df['date_of_transaction'].min(), df['Date'].max())
     df.columns = ['date_of_transaction', 'High', 'Low', 'Open', 'Close', 'Volume', 'AdjClose','Symbol']
     print(df.head())
     add_datepart(df, 'date_of_transaction')
     df.columns = ['date_of_transaction', 'High', 'Low', 'Open', 'Close', 'Volume', 'AdjClose','Symbol','Year','Month','Week','Day','Dayofweek','Dayofyear','Is_month_end','Is_month_start','Is_quarter_end','Is_quarter_start','Is_year_end','Is_year_start','Elapsed'] 
-    
-    print(df.head())
 
-    stock_price_exists = os.path.isfile('Data/stock_price.csv')
-    
-    
-        
-    if stock_price_exists:
-        os.remove('Data/stock_price.csv')
+    # Keep the date key as the same text the csv round-trip used to store
+    df['date_of_transaction'] = df['date_of_transaction'].dt.strftime('%Y-%m-%d')
+    timings.append(('add_datepart', time.time() - start))
     
+    print(df.head())
 
-    df.to_csv(r'Data/stock_price.csv', header=True, index=True, mode='a', sep=',')
+    if write_csv:
+        start = time.time()
+        df.to_csv(r'Data/stock_price.csv', header=True, index=True, sep=',')
+        timings.append(('stock csv artifact', time.time() - start))
     
     #Saving to postgres
-    load_table('Data/stock_price.csv','stock_price')
+    start = time.time()
+    load_frame(df,'stock_price')
+    timings.append(('database load', time.time() - start))
+
+    if not write_csv:
+        print("In-memory hand-off: skipped writing and re-reading basic_stock_price.csv and stock_price.csv")
+    print_timings(timings)
+    dbConnection.print_stats()
 
     #Saving to sqlite
     #save_to_database()
@@ -181,4 +208,4 @@ def main():
 ##Execution
 ##############################
 if __name__ == '__main__':
-    main()
+    main(write_csv='-csv' in sys.argv)
@@ -0,0 +1,122 @@
+"""
+Concurrent price downloader for the Yahoo ingestion scripts. Symbols are pulled
+on a bounded thread pool behind a shared token-bucket rate limiter, failed
+requests are retried with exponential backoff, and every downloaded frame is
+gathered in memory so the caller can write the result once.
+
+The data source is any callable fetch(symbol, start, end) returning a
+DataFrame, so the downloader can be exercised against a local stub instead of
+the Yahoo API.
+"""
+
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+
+
+MAX_WORKERS = 8
+REQUESTS_PER_SECOND = 5.0
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 1.0
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket: refills at `rate` tokens per second up to
+    `capacity`; acquire() blocks until a token is available
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def yahoo_fetch(symbol, start, end):
+    """
+    Default data source: daily prices for one symbol from Yahoo! Finance
+    """
+    from pandas_datareader import data
+    return data.DataReader(name=symbol.replace('.', '-'), data_source="yahoo", start=start, end=end)
+
+
+def fetch_with_retries(fetch, symbol, start, end, limiter, max_retries=MAX_RETRIES,
+                       backoff=BACKOFF_SECONDS):
+    """
+    Call fetch for one symbol, retrying failures with exponential backoff
+    (backoff * 2^attempt plus jitter). The last error is raised once the
+    retries are exhausted
+    """
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            return fetch(symbol, start, end)
+        except Exception:
+            if attempt >= max_retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random() / 2))
+            attempt += 1
+
+
+def download_prices(symbols, start, end, fetch=yahoo_fetch, max_workers=MAX_WORKERS,
+                    requests_per_second=REQUESTS_PER_SECOND, max_retries=MAX_RETRIES,
+                    backoff=BACKOFF_SECONDS):
+    """
+    Download prices for every symbol concurrently. At most max_workers requests
+    are in flight and all workers share one rate limiter.
+    Returns (prices, failures): the downloaded frames stacked in symbol order
+    with a 'Symbol' column, and a dict of symbol -> error for the symbols that
+    failed every retry
+    """
+    limiter = TokenBucket(requests_per_second)
+    frames = {}
+    failures = {}
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_with_retries, fetch, symbol, start, end, limiter,
+                                   max_retries, backoff): symbol
+                   for symbol in symbols}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                stock = future.result()
+            except Exception as err:
+                failures[symbol] = repr(err)
+                continue
+            stock = stock.copy()
+            stock['Symbol'] = symbol
+            frames[symbol] = stock
+
+    ordered = [frames[symbol] for symbol in symbols if symbol in frames]
+    prices = pd.concat(ordered) if ordered else pd.DataFrame()
+
+    print("Downloaded {} of {} symbols in {:0.3f} seconds"
+          .format(len(frames), len(symbols), time.time() - start_time))
+    print_failure_report(failures)
+    return prices, failures
+
+
+def print_failure_report(failures):
+    if not failures:
+        return
+    print("{} symbols failed after retries:".format(len(failures)))
+    for symbol in sorted(failures):
+        print("  {}: {}".format(symbol, failures[symbol]))
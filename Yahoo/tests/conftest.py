@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+The Yahoo scripts import each other by module name; put the Yahoo
+directory on the path for the tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
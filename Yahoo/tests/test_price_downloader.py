@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+The concurrent downloader against a local stub data source
+"""
+import threading
+import time
+import pandas as pd
+import pytest
+import price_downloader
+
+
+class FakeClock(object):
+    """
+    Stands in for the time module: sleep advances the clock instead of waiting
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def stub_prices(symbol, start, end):
+    dates = pd.bdate_range(start, end)
+    return pd.DataFrame({'AdjClose':[float(len(symbol))] * len(dates)},
+                        index=pd.Index(dates, name='Date'))
+
+
+def unlimited():
+    return dict(requests_per_second=10**6, max_retries=0, backoff=0)
+
+
+def test_requests_in_flight_stay_within_max_workers():
+    lock = threading.Lock()
+    counts = {'in_flight':0, 'most':0}
+
+    def fetch(symbol, start, end):
+        with lock:
+            counts['in_flight'] += 1
+            counts['most'] = max(counts['most'], counts['in_flight'])
+        time.sleep(0.01)
+        with lock:
+            counts['in_flight'] -= 1
+        return stub_prices(symbol, start, end)
+
+    symbols = ['S{}'.format(i) for i in range(24)]
+    prices, failures = price_downloader.download_prices(symbols, '2019-04-01', '2019-04-05',
+                                                        fetch=fetch, max_workers=3, **unlimited())
+    assert counts['most'] == 3
+    assert not failures
+    assert prices.shape[0] == 24 * 5
+
+
+def test_token_bucket_rate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(price_downloader, 'time', clock)
+    # A rate of 4 keeps the fake clock's arithmetic exact
+    bucket = price_downloader.TokenBucket(4, capacity=2)
+
+    # The full bucket allows a burst of capacity requests, then one every 1/rate seconds
+    for _ in range(2):
+        bucket.acquire()
+    assert clock.now == 0
+    for _ in range(10):
+        bucket.acquire()
+    assert clock.now == pytest.approx(2.5)
+
+
+def test_retries_back_off_exponentially(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(price_downloader, 'time', clock)
+    monkeypatch.setattr(price_downloader.random, 'random', lambda: 0.0)
+    limiter = price_downloader.TokenBucket(10**6)
+    calls = []
+
+    def flaky(symbol, start, end):
+        calls.append(symbol)
+        if len(calls) <= 3:
+            raise IOError('rate limited')
+        return stub_prices(symbol, start, end)
+
+    prices = price_downloader.fetch_with_retries(flaky, 'AAA', '2019-04-01', '2019-04-05',
+                                                 limiter, max_retries=4, backoff=0.5)
+    assert len(calls) == 4
+    assert clock.sleeps == [0.5, 1.0, 2.0]
+    assert prices.shape[0] == 5
+
+    calls[:] = []
+    clock.sleeps[:] = []
+    with pytest.raises(IOError):
+        price_downloader.fetch_with_retries(flaky, 'AAA', '2019-04-01', '2019-04-05',
+                                            limiter, max_retries=2, backoff=0.5)
+    assert len(calls) == 3
+    assert clock.sleeps == [0.5, 1.0]
+
+
+def test_failure_report(capsys):
+    def fetch(symbol, start, end):
+        if symbol.startswith('BAD'):
+            raise ValueError('no data for ' + symbol)
+        return stub_prices(symbol, start, end)
+
+    prices, failures = price_downloader.download_prices(['AAA', 'BAD1', 'BBB', 'BAD2'],
+                                                        '2019-04-01', '2019-04-05', fetch=fetch,
+                                                        **unlimited())
+    assert sorted(failures) == ['BAD1', 'BAD2']
+    assert 'no data for BAD1' in failures['BAD1']
+    out = capsys.readouterr().out
+    assert "Downloaded 2 of 4 symbols" in out
+    assert "2 symbols failed after retries:" in out
+    assert out.index("BAD1:") < out.index("BAD2:")
+    assert sorted(prices['Symbol'].unique()) == ['AAA', 'BBB']
+
+    prices, failures = price_downloader.download_prices(['BAD1'], '2019-04-01', '2019-04-05',
+                                                        fetch=fetch, **unlimited())
+    assert prices.empty
+    assert list(failures) == ['BAD1']
+
+
+def test_prices_come_back_in_symbol_order():
+    symbols = ['S{}'.format(i) for i in range(8)]
+
+    def fetch(symbol, start, end):
+        # The first symbols finish last
+        time.sleep(0.002 * (len(symbols) - symbols.index(symbol)))
+        return stub_prices(symbol, start, end)
+
+    prices, _ = price_downloader.download_prices(symbols, '2019-04-01', '2019-04-05',
+                                                 fetch=fetch, max_workers=4, **unlimited())
+    assert prices['Symbol'].drop_duplicates().tolist() == symbols
+    assert (prices.groupby('Symbol', sort=False).size() == 5).all()
@@ -0,0 +1,274 @@
+"""
+Timing benchmarks for the feature engineering pipeline. Each benchmark runs the
+original implementation and its replacement on the data-test sample, checks
+that both produce the same values, and reports the speedup. To run the program
+the data-test/Head_stock_prices_and_returns.csv.zip sample must be in place.
+The percent change benchmark is also run on a synthetic panel of n_tickers
+stocks over n_years of trading days:
+
+    python benchmarks.py [n_tickers] [n_years]
+"""
+
+
+import sys
+import time
+import zipfile
+import importlib
+import tracemalloc
+import numpy as np
+import pandas as pd
+from taIndicators import momentum, panel
+import dataframeHandling as dfhandle
+import price_returns
+import incrementalFeatures as incremental
+from taIndicators import volatility as vol
+
+
+TEST_SAMPLE_ZIP = "data-test/Head_stock_prices_and_returns.csv.zip"
+TEST_SAMPLE_FILE = "Head_stock_prices_and_returns.csv"
+SYNTHETIC_TICKERS = 500
+SYNTHETIC_YEARS = 10
+
+
+def load_test_sample():
+    """
+    Read the zipped data-test sample (the archive also carries macOS
+    metadata, so the csv member is opened explicitly)
+    """
+    with zipfile.ZipFile(TEST_SAMPLE_ZIP) as archive:
+        with archive.open(TEST_SAMPLE_FILE) as f:
+            df = pd.read_csv(f)
+    df['date_of_transaction'] = df['Date']
+    return df
+
+
+def synthetic_price_panel(n_tickers=SYNTHETIC_TICKERS, n_years=SYNTHETIC_YEARS, seed=0):
+    """
+    Random-walk prices for n_tickers over n_years of trading days, in the
+    date by date row order the daily price loads append them
+    """
+    rng = np.random.RandomState(seed)
+    n_days = n_years * momentum.YEARLY_TRADING_DAYS
+    dates = pd.bdate_range(momentum.START_DATE, periods=n_days).strftime('%Y-%m-%d')
+    symbols = ['T{:04d}'.format(i) for i in range(n_tickers)]
+    close = 50 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, size=(n_days, n_tickers)), axis=0))
+    df = pd.DataFrame({'Symbol': np.tile(symbols, n_days),
+                       'Date': np.repeat(dates, n_tickers),
+                       'AdjClose': close.ravel()})
+    for col, period in panel.PERCENT_CHANGE_PERIODS:
+        change = np.full(close.shape, np.nan)
+        change[period:] = close[period:] / close[:-period] - 1
+        df[col] = change.ravel()
+    for col in ('Open', 'High', 'Low', 'Close'):
+        df[col] = df['AdjClose']
+    df['Volume'] = rng.randint(10**5, 10**7, size=df.shape[0]).astype(float)
+    df['date_of_transaction'] = df['Date']
+    return df
+
+
+def time_call(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+
+def measure(func, *args):
+    """
+    Run func(*args) twice: once timed, once under tracemalloc (which slows it
+    down). Returns its result, wall seconds and peak traced MB
+    """
+    result, seconds = time_call(func, *args)
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def report(name, old_seconds, new_seconds):
+    print("{}: {:0.3f}s -> {:0.3f}s ({:0.1f}x faster)"
+          .format(name, old_seconds, new_seconds, old_seconds / max(new_seconds, 1e-9)))
+
+
+def report_memory(name, old, new):
+    (old_seconds, old_peak), (new_seconds, new_peak) = old, new
+    print("{}: {:0.3f}s -> {:0.3f}s ({:0.1f}x faster), peak memory {:0.1f}MB -> {:0.1f}MB"
+          .format(name, old_seconds, new_seconds, old_seconds / max(new_seconds, 1e-9),
+                  old_peak, new_peak))
+
+
+def benchmark_return_rankings(basic_df):
+    """
+    Per date / per symbol ranking loop vs the batched date x symbol rank matrix
+    """
+    df = dfhandle.add_columns_to_df(basic_df, ['RSI', 'Volatility', 'Sharp_Ratio'])
+    ticker_list = df.index.get_level_values(0).unique().tolist()
+    date_list = sorted(df.index.get_level_values(1).unique().tolist())
+
+    (old_yearly, old_monthly), old_seconds = time_call(
+        momentum.get_daily_adjusted_stock_return_rankings_by_date, df.copy(), ticker_list, date_list)
+    (new_yearly, new_monthly), new_seconds = time_call(
+        momentum.get_daily_adjusted_stock_return_rankings, df.copy(), ticker_list, date_list)
+
+    for period, old, new in (("Yearly", old_yearly, new_yearly), ("Monthly", old_monthly, new_monthly)):
+        rank_period = period + "_Return_Rank"
+        old = old.sort_values(by=['Date', 'Symbol']).reset_index(drop=True)
+        assert np.allclose(old[rank_period].astype(float), new[rank_period].astype(float), equal_nan=True)
+
+    report("Daily return rankings", old_seconds, new_seconds)
+
+
+def benchmark_percent_changes(basic_df):
+    """
+    Per symbol .loc percent change loop vs the single pass over the sorted panel
+    """
+    new_columns = [col for col, period in panel.PERCENT_CHANGE_PERIODS]
+    df = dfhandle.add_columns_to_df(basic_df.drop(columns=new_columns, errors='ignore'), new_columns)
+    # Float placeholders, which the .loc writes of the loop need under current pandas
+    df[new_columns] = df[new_columns].astype(float)
+
+    def by_symbol(df):
+        for symbol, mrow in df.groupby(level=0):
+            df = price_returns.get_daily_percent_change(df, symbol)
+        return df
+
+    old, old_seconds = time_call(by_symbol, df.copy())
+    new, new_seconds = time_call(panel.add_percent_changes, df.copy())
+
+    old = panel.sort_panel(old)
+    assert old.index.equals(new.index)
+    for col in new_columns:
+        assert np.allclose(old[col].astype(float), new[col], equal_nan=True), col
+
+    report("Percent changes (" + str(df.shape[0]) + " rows)", old_seconds, new_seconds)
+
+
+def benchmark_momentum_indicators(basic_df):
+    """
+    Per symbol RSI / volatility loop vs the panel indicator engine, with
+    talib (when installed) and with the NumPy RSI
+    """
+    new_columns = ['RSI', 'Volatility', 'Sharp_Ratio']
+    df = dfhandle.add_columns_to_df(basic_df, new_columns)
+    df[new_columns] = df[new_columns].astype(float)
+
+    def by_symbol(df):
+        for symbol in df.index.get_level_values(0).unique():
+            df = momentum.get_stock_rsi_daily(df, symbol)
+            df = vol.get_stock_volatility(df, symbol)
+        return df
+
+    engines = [("NumPy RSI", False)]
+    if panel.RSI is not None:
+        old, old_seconds = time_call(by_symbol, df.copy())
+        old = panel.sort_panel(old)
+        engines.insert(0, ("talib RSI", True))
+    for name, use_talib in engines:
+        new, new_seconds = time_call(panel.add_momentum_indicators, df.copy(), use_talib)
+        if panel.RSI is None:
+            print("RSI, volatility, Sharpe ratio (" + name + "): " +
+                  "{:0.3f}s, talib is not installed for the comparison".format(new_seconds))
+            continue
+        for col in new_columns:
+            assert np.allclose(old[col], new[col], rtol=1e-9, atol=1e-9, equal_nan=True), col
+        report("RSI, volatility, Sharpe ratio (" + name + ", " + str(df.shape[0]) + " rows)",
+               old_seconds, new_seconds)
+
+
+def benchmark_momentum_merges(basic_df):
+    """
+    Per symbol merge loops of feature-gen (monthly into yearly rankings, then
+    the SPY trailing return) vs the keyed joins on (Symbol, Date) and date.
+    The monthly return of the symbol with the longest history stands in for SPY's
+    """
+    feature_gen = importlib.import_module('feature-gen')
+    basic_df = basic_df.copy()
+    basic_df['ticker'] = basic_df['Symbol']
+    basic_df['sno'] = np.arange(basic_df.shape[0])
+    df = dfhandle.add_columns_to_df(basic_df, ['RSI', 'Volatility', 'Sharp_Ratio'])
+    df = panel.add_momentum_indicators(df)
+    ticker_list = df.index.get_level_values(0).unique().tolist()
+    date_list = sorted(df.index.get_level_values(1).unique().tolist())
+    df_yearly, df_monthly = momentum.get_daily_adjusted_stock_return_rankings(df, ticker_list, date_list)
+
+    old, old_seconds, old_peak = measure(
+        lambda: feature_gen.clean_and_merge_monthly_and_yearly_dfs_by_symbol(
+            df_yearly.copy(), df_monthly.copy(), ticker_list))
+    new, new_seconds, new_peak = measure(
+        lambda: feature_gen.clean_and_merge_monthly_and_yearly_dfs(df_yearly.copy(), df_monthly.copy()))
+    assert old.index.equals(new.index) and old.columns.equals(new.columns)
+    pd.testing.assert_frame_equal(old, new, check_dtype=False)
+    report_memory("Monthly/yearly ranking merge (" + str(new.shape[0]) + " rows)",
+                  (old_seconds, old_peak), (new_seconds, new_peak))
+
+    final_df = new.reset_index().set_index(['ticker_x', 'date_of_transaction'])
+    spy = df.loc[df.index.get_level_values(0).value_counts().idxmax()].reset_index()
+    spy_trailing_month_return = pd.DataFrame({'date_of_transaction': spy['date_of_transaction'],
+                                              'SPY_Trailing_Month_Return': spy['Pct_Change_Monthly']})
+
+    old, old_seconds, old_peak = measure(
+        lambda: feature_gen.merge_spy_trailing_month_return_by_symbol(
+            final_df.copy(), spy_trailing_month_return))
+    new, new_seconds, new_peak = measure(
+        feature_gen.merge_spy_trailing_month_return, final_df, spy_trailing_month_return)
+
+    # The positional merge only lines up for symbols trading on every SPY date
+    old_spy = old['SPY_Trailing_Month_Return'].to_numpy(dtype=float)
+    new_spy = new['SPY_Trailing_Month_Return'].to_numpy(dtype=float)
+    aligned = (old['date_of_transaction_x'] == old['date_of_transaction_y']).to_numpy()
+    assert (old['ticker_x'].to_numpy() == new['ticker_x'].to_numpy()).all()
+    assert np.allclose(old_spy[aligned], new_spy[aligned], equal_nan=True)
+    report_memory("SPY trailing return merge (" + str(new.shape[0]) + " rows, " +
+                  str((~aligned).sum()) + " rows realigned by date)",
+                  (old_seconds, old_peak), (new_seconds, new_peak))
+
+
+def benchmark_incremental_day(basic_df):
+    """
+    Recomputing percent changes, RSI and volatility over the whole history to
+    add the last trading day vs appending that day to the per ticker state
+    """
+    last_date = basic_df['date_of_transaction'].max()
+    history = basic_df[basic_df['date_of_transaction'] < last_date]
+    state = incremental.FeatureState()
+    incremental.compute_features(state, history)
+
+    def full_history(basic_df):
+        df = dfhandle.add_columns_to_df(basic_df, [])
+        return panel.add_momentum_indicators(panel.add_percent_changes(df))
+
+    old, old_seconds = time_call(full_history, basic_df)
+    new, new_seconds = time_call(incremental.compute_features, state,
+                                 basic_df[basic_df['date_of_transaction'] == last_date])
+
+    old = old.xs(last_date, level=1).sort_index()
+    new = new.set_index('Symbol').sort_index()
+    for col in ('Pct_Change_Daily', 'Pct_Change_Monthly', 'Pct_Change_Yearly', 'RSI',
+                'Volatility', 'Sharp_Ratio'):
+        assert np.allclose(old[col], new[col], rtol=1e-9, atol=1e-9, equal_nan=True), col
+
+    report("Adding one trading day (" + str(new.shape[0]) + " tickers, " +
+           str(basic_df.shape[0]) + " rows of history)", old_seconds, new_seconds)
+
+
+###############################
+# Main Method
+###############################
+if __name__ == '__main__':
+    sample_df = load_test_sample()
+    print("Benchmarking on " + TEST_SAMPLE_ZIP + " (" + str(sample_df.shape[0]) + " rows)")
+    benchmark_return_rankings(sample_df)
+    benchmark_percent_changes(sample_df)
+    benchmark_momentum_indicators(sample_df)
+    benchmark_momentum_merges(sample_df)
+    benchmark_incremental_day(sample_df)
+
+    n_tickers = int(sys.argv[1]) if len(sys.argv) > 1 else SYNTHETIC_TICKERS
+    n_years = int(sys.argv[2]) if len(sys.argv) > 2 else SYNTHETIC_YEARS
+    print("Benchmarking on a synthetic panel of " + str(n_tickers) + " tickers x " +
+          str(n_years) + " years")
+    synthetic_df = synthetic_price_panel(n_tickers, n_years)
+    benchmark_percent_changes(synthetic_df)
+    benchmark_momentum_indicators(synthetic_df)
+    benchmark_momentum_merges(synthetic_df)
+    benchmark_incremental_day(synthetic_df)
@@ -0,0 +1,163 @@
+"""
+Local columnar storage for the price, feature and SimFin tables. Each table is a
+directory of Parquet files under STORE_ROOT, hive-partitioned by year of its date
+column (and optionally by ticker), so a read can:
+    - project only the columns it needs,
+    - push a date-range predicate down to the partition and row-group level,
+    - get typed columns back (dates as datetime64, floats as float64) without
+      re-parsing text the way the csv hand-offs do.
+
+The store root is taken from the PARQUET_STORE environment variable (default
+data/parquet under the repository root, so the feature engineering, SimFin and
+modeling scripts share one store whichever directory they run from). pyarrow is
+only needed when the store is used.
+"""
+
+
+import os
+import shutil
+import uuid
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+    ds = None
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STORE_ROOT = os.path.join(REPO_ROOT, 'data', 'parquet')
+PARTITION_YEAR = 'partition_year'
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for the parquet storage backend (pip install pyarrow)")
+
+
+def get_store_root():
+    return os.environ.get('PARQUET_STORE', DEFAULT_STORE_ROOT)
+
+
+def get_table_path(table_name):
+    return os.path.join(get_store_root(), table_name)
+
+
+def table_exists(table_name):
+    return os.path.isdir(get_table_path(table_name))
+
+
+def write_dataset(df, table_name, date_column='date_of_transaction', ticker_column=None,
+                  if_exists='append'):
+    """
+    Write df as a parquet dataset partitioned by year of date_column (and by
+    ticker_column when given). The date column is stored typed; text dates are
+    parsed once here rather than on every load. if_exists follows to_sql:
+    'append' adds new files next to the existing ones, 'replace' rewrites the table
+    """
+    _require_pyarrow()
+    path = get_table_path(table_name)
+    if if_exists == 'replace' and os.path.isdir(path):
+        shutil.rmtree(path)
+
+    df = df.reset_index(drop=True)
+    partition_cols = []
+    if date_column is not None:
+        df[date_column] = pd.to_datetime(df[date_column])
+        df[PARTITION_YEAR] = df[date_column].dt.year
+        partition_cols.append(PARTITION_YEAR)
+    if ticker_column is not None:
+        partition_cols.append(ticker_column)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    ds.write_dataset(table, path, format='parquet',
+                     partitioning=partition_cols or None, partitioning_flavor='hive',
+                     basename_template='part-' + uuid.uuid4().hex + '-{i}.parquet',
+                     existing_data_behavior='overwrite_or_ignore')
+
+
+def _open_dataset(table_name):
+    _require_pyarrow()
+    return ds.dataset(get_table_path(table_name), format='parquet', partitioning='hive')
+
+
+def _date_filter(dataset, date_column, start=None, end=None, include_start=True):
+    """
+    Predicate on date_column between start and end (inclusive, unless
+    include_start is False), also pruning the year partitions
+    """
+    expression = None
+    has_year = PARTITION_YEAR in dataset.schema.names
+    if start is not None:
+        start = pd.Timestamp(start)
+        field = ds.field(date_column)
+        expression = (field >= start) if include_start else (field > start)
+        if has_year:
+            expression = expression & (ds.field(PARTITION_YEAR) >= start.year)
+    if end is not None:
+        end = pd.Timestamp(end)
+        upper = ds.field(date_column) <= end
+        if has_year:
+            upper = upper & (ds.field(PARTITION_YEAR) <= end.year)
+        expression = upper if expression is None else expression & upper
+    return expression
+
+
+def get_warmup_start(table_name, max_date, lookback, date_column='date_of_transaction'):
+    """
+    The lookback-th latest trading day on or before max_date (max_date itself
+    when there is no history), read from the date column only
+    """
+    dataset = _open_dataset(table_name)
+    dates = dataset.to_table(columns=[date_column],
+                             filter=_date_filter(dataset, date_column, end=max_date)).column(0)
+    dates = pd.Series(dates.to_pandas()).drop_duplicates().sort_values()
+    if dates.empty:
+        return pd.Timestamp(max_date)
+    return dates.iloc[-lookback:].iloc[0]
+
+
+def read_dataset(table_name, columns=None, max_date=None, lookback=0, date_column='date_of_transaction',
+                 start=None, end=None):
+    """
+    Read a parquet table with column projection and date predicate pushdown.
+    max_date/lookback behave as in dataframeHandling.read_table (rows after
+    max_date plus a warm-up window of `lookback` trading days); start/end
+    select an explicit inclusive date range instead
+    """
+    dataset = _open_dataset(table_name)
+    include_start = True
+    if max_date is not None:
+        if lookback > 0:
+            start = get_warmup_start(table_name, max_date, lookback, date_column)
+        else:
+            start, include_start = max_date, False
+    expression = None
+    if date_column in dataset.schema.names:
+        expression = _date_filter(dataset, date_column, start, end, include_start)
+
+    if columns is None:
+        columns = [col for col in dataset.schema.names if col != PARTITION_YEAR]
+    df = dataset.to_table(columns=list(columns), filter=expression).to_pandas()
+
+    # Partition keys come back as dictionaries; restore plain values
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(str)
+    if date_column in df.columns:
+        df.sort_values(date_column, kind='mergesort', inplace=True)
+        df.reset_index(drop=True, inplace=True)
+    return df
+
+
+def find_max_date(table_name, date_column):
+    """
+    Latest value of date_column as YYYY-MM-DD text (None for an empty table)
+    """
+    dataset = _open_dataset(table_name)
+    dates = dataset.to_table(columns=[date_column]).column(0).to_pandas()
+    if dates.empty:
+        return None
+    return pd.Timestamp(dates.max()).strftime('%Y-%m-%d')
@@ -1,7 +1,32 @@
+import io
+import os
+import time
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import text
+import dbConnection
+import columnarStore
 import datetime as dt
 
+
+BULK_CHUNKSIZE = 50000
+SQLITE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def use_parquet():
+    """
+    STORAGE_BACKEND=parquet switches the table reads and writes below from
+    the database to the local columnar store
+    """
+    return os.environ.get('STORAGE_BACKEND', 'database') == 'parquet'
+
+
+def get_date_column(columns):
+    for col in ('date_of_transaction', 'Date', 'date'):
+        if col in columns:
+            return col
+    return None
+
+
 def get_dataframe_from_csv(file):
     try:
         df = pd.read_csv(file)
@@ -27,36 +52,130 @@ def add_columns_to_df(basic_df, columns):
     return new_df
 
 def replace_table(df,table_name):
-    engine = create_engine("postgresql://postgres:dfdk#418!@@35.237.73.115/postgres")
+    if use_parquet():
+        columnarStore.write_dataset(df, table_name, date_column=get_date_column(df.columns), if_exists='replace')
+        return
+    engine = dbConnection.get_engine()
     #df=pd.read_csv(file_name)
     #df['Sno']=df.index
     #df['symbol']=df[' Symbol']
     #columns = ['Sno','date_of_transaction', 'High', 'Low', 'Open', 'Close', 'Volume', 'Adj Close','symbol','Year','Month','Week','Day','Dayofweek','Dayofyear','Is_month_end','Is_month_start','Is_quarter_end','Is_quarter_start','Is_year_end','Is_year_start','Elapsed'] 
-    df.to_sql(table_name,engine, if_exists='replace',index=False)
-
-def read_table(table_name,max_date):
-    engine = create_engine("postgresql://postgres:dfdk#418!@@35.237.73.115/postgres")
-    #max_date2=dt.date(int(max_date.split('-')[0]),int(max_date.split('-')[1]),int(max_date.split('-')[2]))
-    #sqlstr = ("'select * from ' + table_name +' where  date_of_transaction >' %s ", max_date2)
-    
-    df=pd.read_sql_query( 'select * from ' + table_name,con=engine)
-    #print(df.head())
-    #delta_records=df['date_of_transaction']>max_date
-    return df
+    bulk_load(df, table_name, if_exists='replace', engine=engine)
 
+def build_delta_query(table_name, max_date=None, columns=None, lookback=0, date_column='date_of_transaction'):
+    """
+    Build the select statement for read_table. Only the requested columns are
+    projected and, when max_date is given, only rows after max_date are read,
+    plus a warm-up window of the last `lookback` trading days up to max_date
+    for indicators (rolling means, yearly returns) that need history
+    """
+    quote = dbConnection.get_engine().dialect.identifier_preparer.quote
+    date_col = quote(date_column)
+    if columns:
+        select_cols = ', '.join(quote(col) for col in columns)
+    else:
+        select_cols = '*'
+    sql = 'select ' + select_cols + ' from ' + table_name
+    params = {}
 
+    if max_date is not None:
+        params['max_date'] = max_date
+        if lookback > 0:
+            # lookback-th latest trading day on or before max_date; fall back to max_date for empty history
+            params['lookback'] = int(lookback)
+            sql += (' where ' + date_col + ' >= coalesce((select min(warmup.d) from'
+                    ' (select distinct ' + date_col + ' as d from ' + table_name +
+                    ' where ' + date_col + ' <= :max_date order by d desc limit :lookback) as warmup),'
+                    ' :max_date)')
+        else:
+            sql += ' where ' + date_col + ' > :max_date'
+    return sql, params
 
-def find_max_date():
 
-    engine = create_engine("postgresql://postgres:dfdk#418!@@35.237.73.115/postgres")
+def read_table(table_name, max_date=None, columns=None, lookback=0, date_column='date_of_transaction'):
+    """
+    Read a table with the date predicate and column projection pushed down to
+    SQL (see build_delta_query), or to the parquet files when the columnar
+    store is the backend. max_date=None reads the full history
+    """
+    if use_parquet():
+        return columnarStore.read_dataset(table_name, columns, max_date, lookback, date_column)
+    engine = dbConnection.get_engine()
+    sql, params = build_delta_query(table_name, max_date, columns, lookback, date_column)
+    df=pd.read_sql_query(text(sql), con=engine, params=params)
+    return df
+
+
+def find_max_date():
+    if use_parquet():
+        return columnarStore.find_max_date('momentum_features', 'Date')
+    engine = dbConnection.get_engine()
     df=pd.read_sql_query('select max("Date") as date_of_transaction from momentum_features',con=engine)
     last_pulled_date=df["date_of_transaction"].max()  
     return last_pulled_date
 
 def load_table(df,table_name):
-    engine = create_engine("postgresql://postgres:dfdk#418!@@35.237.73.115/postgres")
+    if use_parquet():
+        columnarStore.write_dataset(df, table_name, date_column=get_date_column(df.columns), if_exists='append')
+        return
+    engine = dbConnection.get_engine()
     #df=pd.read_csv(file_name)
     #df['sno']=df.index
     #df['symbol']=df[' Symbol']
     #columns = ['sno','date_of_transaction', 'High', 'Low', 'Open', 'Close', 'Volume', 'AdjClose','Symbol','Year','Month','Week','Day','Dayofweek','Dayofyear','Is_month_end','Is_month_start','Is_quarter_end','Is_quarter_start','Is_year_end','Is_year_start','Elapsed'] 
-    df.to_sql(table_name,engine, if_exists='append',index=False)
\ No newline at end of file
+    bulk_load(df, table_name, if_exists='append', engine=engine)
+
+
+def _copy_chunk(conn, chunk, table_name, columns):
+    """
+    Stream one chunk into PostgreSQL through COPY ... FROM STDIN as csv
+    """
+    buffer = io.StringIO()
+    chunk.to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    sql = 'COPY ' + table_name + ' (' + ', '.join(columns) + ") FROM STDIN WITH (FORMAT csv)"
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+
+def _insert_chunk(conn, chunk, table_name, columns):
+    """
+    executemany fallback for databases without COPY (SQLite)
+    """
+    params = ['p' + str(i) for i in range(len(columns))]
+    sql = ('insert into ' + table_name + ' (' + ', '.join(columns) + ') values (' +
+           ', '.join(':' + p for p in params) + ')')
+    chunk = chunk.copy()
+    for col in chunk.columns[[pd.api.types.is_datetime64_any_dtype(dtype) for dtype in chunk.dtypes]]:
+        # sqlite3 cannot bind Timestamps; store the text SQLAlchemy's DATETIME reads back
+        chunk[col] = chunk[col].dt.strftime(SQLITE_DATETIME_FORMAT)
+    values = chunk.astype(object).where(chunk.notnull(), None)
+    records = [dict(zip(params, row)) for row in values.itertuples(index=False, name=None)]
+    conn.execute(text(sql), records)
+
+
+def bulk_load(df, table_name, if_exists='append', chunksize=BULK_CHUNKSIZE, engine=None):
+    """
+    Write df to table_name in chunks of `chunksize` rows inside a single
+    transaction: COPY on PostgreSQL, batched executemany elsewhere. The table
+    is created (append) or recreated (replace) from the frame's dtypes, as
+    DataFrame.to_sql would, and the write throughput is reported
+    """
+    if engine is None:
+        engine = dbConnection.get_engine()
+    quote = engine.dialect.identifier_preparer.quote
+    columns = [quote(str(col)) for col in df.columns]
+    write_chunk = _copy_chunk if engine.dialect.name == 'postgresql' else _insert_chunk
+
+    start = time.time()
+    with engine.begin() as conn:
+        df.head(0).to_sql(table_name, conn, if_exists=if_exists, index=False)
+        for i in range(0, df.shape[0], chunksize):
+            write_chunk(conn, df.iloc[i:i + chunksize], table_name, columns)
+    elapsed = time.time() - start
+
+    print("Wrote {} rows to {} in {:0.3f} seconds ({:0.0f} rows/sec)"
+          .format(df.shape[0], table_name, elapsed, df.shape[0] / max(elapsed, 1e-9)))
\ No newline at end of file
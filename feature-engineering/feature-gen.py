@@ -12,33 +12,60 @@ George Krug
 
 import pandas as pd
 import time
-from taIndicators import momentum, basic, volatility as vol
+from taIndicators import momentum, basic, panel
 import dataframeHandling as dfhandle
+import price_returns
+import incrementalFeatures as incremental
+import dbConnection
 import sys
 
 
+MONTHLY_DUPLICATE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume', 'AdjClose', 'Pct_Change_Daily',
+                             'Pct_Change_Monthly', 'Pct_Change_Yearly', 'RSI', 'Volatility', 'Sharp_Ratio']
+
+
 def clean_and_merge_monthly_and_yearly_dfs(df_yearly, df_monthly):
+    """
+    Add the monthly return rankings to the yearly in one join on (Symbol, Date),
+    indexed by symbol and date in symbol order
+    """
+    # Drop duplicate columns to isolate monthly rankings
+    df_monthly = df_monthly.drop(columns=MONTHLY_DUPLICATE_COLUMNS, errors='ignore')
+
+    final_df = pd.merge(df_yearly, df_monthly, on=['Symbol', 'Date'], how='inner')
+    final_df.sort_values(by=['Symbol', 'Date'], kind='mergesort', inplace=True)
+
+    # Adjusted index before converted or stored
+    final_df['date_of_transaction'] = final_df['Date']
+    final_df.set_index(['Symbol', 'Date'], inplace=True)
+    final_df.drop(columns=['Yearly_Return', 'Monthly_Return'], errors='ignore', inplace=True)
+
+    return final_df
+
+
+def clean_and_merge_monthly_and_yearly_dfs_by_symbol(df_yearly, df_monthly, ticker_list):
+    """
+    Original per symbol merge, growing final_df one symbol at a time (with
+    pd.concat in place of the removed DataFrame.append); kept as the
+    reference for benchmarks and checks
+    """
     # Convert to single index on Symbol
     df_yearly.set_index(['Symbol'], inplace=True)
     df_monthly.set_index(['Symbol'], inplace=True)
 
     # Drop duplicate columns to isolate monthly rankings
     try:
-        df_monthly.drop(
-            columns=['Open', 'High', 'Low', 'Close', 'Volume', 'AdjClose', 'Pct_Change_Daily', 'Pct_Change_Monthly',
-                     'Pct_Change_Yearly', 'RSI', 'Volatility', 'Sharp_Ratio'], inplace=True)
+        df_monthly.drop(columns=MONTHLY_DUPLICATE_COLUMNS, inplace=True)
     except Exception as err:
         pass
 
-    # Declare Final Dataframe to be stored
-    global final_df
     final_df = pd.DataFrame()
 
     # Loop symbol rows in dataframe and merge to add the monthly return rankings to the yearly
     for symbol in ticker_list:
         tmp = pd.merge(df_yearly.loc[symbol], df_monthly.loc[symbol], on='Date', how='inner')
         tmp['Symbol'] = symbol
-        final_df = final_df.append(tmp)
+        final_df = pd.concat([final_df, tmp])
 
     # Adjusted index before converted or stored
     try:
@@ -53,6 +80,30 @@ def clean_and_merge_monthly_and_yearly_dfs(df_yearly, df_monthly):
     return final_df
 
 
+def merge_spy_trailing_month_return(final_df, spy_trailing_month_return):
+    """
+    Join the SPY trailing monthly return to every symbol's rows on the
+    trading date (date_of_transaction)
+    """
+    return pd.merge(final_df.reset_index(), spy_trailing_month_return,
+                    on='date_of_transaction', how='left')
+
+
+def merge_spy_trailing_month_return_by_symbol(final_df, spy_trailing_month_return):
+    """
+    Original SPY merge, pairing each symbol's rows with the SPY rows by
+    position and growing spy_df one symbol at a time (with pd.concat in place
+    of the removed DataFrame.append); kept as the reference for benchmarks
+    """
+    spy_df = pd.DataFrame()
+    for symbol, r in final_df.groupby(level=0):
+        tmp = r
+        tmp.reset_index(inplace=True)
+        tick = pd.merge(tmp, spy_trailing_month_return, how='left', left_index=True, right_index=True)
+        spy_df = pd.concat([spy_df, tick])
+    return spy_df
+
+
 def get_index_lists(df, ticker_list, date_list):
     # Get Index Lists
     for symbol, mrow in df.groupby(level=0):
@@ -74,59 +125,39 @@ def handle_input_arguments():
             return "test"
         elif sys.argv[1] == "-f" and len(sys.argv) == 3:
             return "test"
+        elif sys.argv[1] == "-incremental" and len(sys.argv) == 2:
+            return "incremental"
         elif (len(sys.argv) == 2 and sys.argv[1] is not "-test") or (len(sys.argv) == 3 and sys.argv[1] != "-f") or len(sys.argv) > 3:
             print("ERROR: Improper input arguments!\nDefault Test Command:"
-                  " \n\tpython feature-gen.py -test\nCustom Test File Command:\n\tpython feature-gen.py -f <file name>")
+                  " \n\tpython feature-gen.py -test\nCustom Test File Command:\n\tpython feature-gen.py -f <file name>"
+                  "\nIncremental Update Command:\n\tpython feature-gen.py -incremental")
             return "error"
         else:
             return "live"
 
 
-###############################
-# Main Method
-###############################
-if __name__== '__main__':
-    file_path = "data/stock_prices_and_returns_3.csv"
-    test_file_path = "data-test/Head_stock_prices_and_returns.csv"
-    output_file_path = "data/momentum-features.csv"
-    test_output_file = "data-test/test-momentum.csv"
+def generate_momentum_features(max_date=None, output_file_path="data/momentum-features.csv"):
+    """
+    Compute the momentum features of the trading days after max_date (every
+    day when None). The stock_price_return table only holds the last delta,
+    so the yearly warm-up window the rolling features need is rebuilt from
+    stock_price. Returns the features of the new days and of the warm-up
+    window, indexed by ticker and date
+    """
     new_columns = ['RSI', 'Volatility', 'Sharp_Ratio']
-    ticker_list = []
-    date_list = []
-
-    # Allow custom input file for testing
-    action = handle_input_arguments()
-    if action == "test":
-        file_path = test_file_path
-        output_file_path = test_output_file
-    elif action == "error":
-        exit(1)
-
-    print("input file: " + file_path)
-    print("output file: " + output_file_path)
-
-    # convert csv to dataframe, index ticker & date, and add new featur columns
-    #basic_df = dfhandle.get_dataframe_from_csv(file_path)
-    
-    max_date=dfhandle.find_max_date()
-    print('max date '+max_date)
     start = time.time()
-    
-    basic_df=dfhandle.read_table('stock_price_return',max_date)
+
+    # New trading days plus a yearly warm-up window for the rolling features
+    basic_df = price_returns.get_price_returns(max_date, lookback=momentum.YEARLY_TRADING_DAYS)
     basic_df['Date']=basic_df['date_of_transaction']
-    end = time.time()
 
     df = dfhandle.add_columns_to_df(basic_df, new_columns)
-    basic_df['Date']=basic_df['date_of_transaction']
     # get index lists of 3d df to optimize looping
-    ticker_list, date_list = get_index_lists(df, ticker_list, date_list)
+    ticker_list, date_list = get_index_lists(df, [], [])
 
     print('Generating Momentum Features\n-------------------------------------------------------------')
     print('Updating Dataframe with RSI, Volatility, Sharp Ratio and Performance Rank columns......')
-    start = time.time()
-    for symbol in ticker_list:
-        df = momentum.get_stock_rsi_daily(df, symbol)
-        df = vol.get_stock_volatility(df, symbol)
+    df = panel.add_momentum_indicators(df)
 
     # Get Daily adjusted return rankings based on trailing monthly and yearly prices
     df_yearly, df_monthly = momentum.get_daily_adjusted_stock_return_rankings(df, ticker_list, date_list)
@@ -154,8 +185,8 @@ if __name__== '__main__':
 
 
     # if percent positive, assign 1; else assign 0
-    final_df['Pct_Change_Class'].where(final_df['Pct_Change_Class'] < 0, other=1, inplace=True)
-    final_df['Pct_Change_Class'].where(final_df['Pct_Change_Class'] > 0, other=0, inplace=True)
+    final_df['Pct_Change_Class'] = final_df['Pct_Change_Class'].where(final_df['Pct_Change_Class'] < 0, other=1)
+    final_df['Pct_Change_Class'] = final_df['Pct_Change_Class'].where(final_df['Pct_Change_Class'] > 0, other=0)
     final_df.head()
 
     # set index on symbol
@@ -197,7 +228,7 @@ if __name__== '__main__':
 
     print(final_df.head())
 
-    spy=dfhandle.read_table('spy_stock_price_return',max_date)
+    spy=dfhandle.read_table('spy_stock_price_return', max_date, lookback=momentum.YEARLY_TRADING_DAYS)
 
     #spy.drop(columns=['Unnamed: 0'], inplace=True)
 
@@ -206,8 +237,6 @@ if __name__== '__main__':
 
     spy_trailing_month_return = spy.drop(columns=['sno','Symbol', 'High', 'Low', 'Open', 'Close', 'Volume', 'AdjClose', 'ticker','Pct_Change_Daily', 'Pct_Change_Yearly'])
 
-    global spy_df
-    spy_df = pd.DataFrame()
     spy_trailing_month_return['SPY_Trailing_Month_Return'] = spy_trailing_month_return['Pct_Change_Monthly']
     spy_trailing_month_return.drop(columns=['Pct_Change_Monthly'], inplace=True)
 
@@ -216,26 +245,56 @@ if __name__== '__main__':
 
     print(final_df.info())
 
-    for symbol, r in final_df.groupby(level=0):
-        tmp = r
-        #print("Sybmol"+symbol)
-        tmp.reset_index(inplace=True)
-        tick = pd.merge(tmp, spy_trailing_month_return, how='left', left_index=True, right_index=True)
-        spy_df = spy_df.append(tick)
-    
-    
+    spy_df = merge_spy_trailing_month_return(final_df, spy_trailing_month_return)
+
     spy_df['Symbol']=spy_df['ticker_x']
-    spy_df['Date']=spy_df['date_of_transaction_x']
-    spy_df.set_index(['ticker_x', 'date_of_transaction_x'], inplace=True)
+    spy_df['Date']=spy_df['date_of_transaction']
+    spy_df.set_index(['ticker_x', 'date_of_transaction'], inplace=True)
     
 
     print(spy_df.info())
 
-    columns=['Symbol','Date','High','Low','Open','Close','Volume','AdjClose','Pct_Change_Daily','Pct_Change_Monthly','Pct_Change_Yearly','RSI','Volatility','Yearly_Return_Rank','Monthly_Return_Rank','Rolling_Yearly_Mean_Positive_Days','Rolling_Monthly_Mean_Positive_Days','Rolling_Monthly_Mean_Price','Rolling_Yearly_Mean_Price','Momentum_Quality_Monthly','Momentum_Quality_Yearly','SPY_Trailing_Month_Return']
+    print(spy_df[incremental.MOMENTUM_FEATURE_COLUMNS].head())
+    print("Process time: " + str(time.time() - start) + " seconds.")
+    return spy_df
 
-    print(spy_df[columns].head())
 
-    dfhandle.load_table(spy_df[columns],'momentum_features')
-    end = time.time()
-    print("Process time: " + str(end - start) + " seconds.")
+###############################
+# Main Method
+###############################
+if __name__== '__main__':
+    file_path = "data/stock_prices_and_returns_3.csv"
+    test_file_path = "data-test/Head_stock_prices_and_returns.csv"
+    output_file_path = "data/momentum-features.csv"
+    test_output_file = "data-test/test-momentum.csv"
+
+    # Allow custom input file for testing
+    action = handle_input_arguments()
+    if action == "test":
+        file_path = test_file_path
+        output_file_path = test_output_file
+    elif action == "error":
+        exit(1)
+    elif action == "incremental":
+        # Append only the new trading days from the per ticker feature state
+        start = time.time()
+        incremental.run_incremental()
+        print("Process time: " + str(time.time() - start) + " seconds.")
+        dbConnection.print_stats()
+        exit(0)
+
+    print("input file: " + file_path)
+    print("output file: " + output_file_path)
+
+    max_date=dfhandle.find_max_date()
+    print('max date '+str(max_date))
+    spy_df = generate_momentum_features(max_date, output_file_path)
+
+    # Only append the new trading days; the warm-up window is already in momentum_features
+    if max_date is None:
+        delta_records = spy_df['Date'].notnull()
+    else:
+        delta_records = spy_df['Date'] > max_date
+    dfhandle.load_table(spy_df.loc[delta_records, incremental.MOMENTUM_FEATURE_COLUMNS],'momentum_features')
+    dbConnection.print_stats()
     ######################################################
\ No newline at end of file
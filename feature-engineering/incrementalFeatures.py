@@ -0,0 +1,287 @@
+"""
+Incremental feature generation. price_returns.py and feature-gen.py recompute
+every percent change, RSI, volatility, rolling mean and rank over the whole
+history (or a yearly warm-up window) on each run. Here each ticker's rolling
+state is kept in a small state store instead:
+    - the last 252 adjusted closes and positive-day classes (ring buffers),
+    - the Wilder average gain and loss of the RSI,
+    - running sums of the closes and positive days over the monthly and
+      yearly windows,
+so appending a new trading day only touches one row of state per ticker,
+whatever the length of the history. Ranks are computed across the new day's
+tickers, and the SPY trailing return is joined on date.
+
+The first run (no state file) replays the full price history once to build
+the state. To run the program:
+
+    python feature-gen.py -incremental
+"""
+
+
+import os
+import numpy as np
+import pandas as pd
+from taIndicators import basic, panel
+import dataframeHandling as dfhandle
+
+
+STATE_PATH = os.path.join('data', 'feature_state.npz')
+WINDOW = basic.YEARLY_TRADING_DAYS
+STOCK_PRICE_COLUMNS = ['sno', 'date_of_transaction', 'High', 'Low', 'Open', 'Close', 'Volume',
+                       'AdjClose', 'Symbol']
+PRICE_RETURN_COLUMNS = ['sno', 'High', 'Low', 'Open', 'Close', 'Volume', 'AdjClose', 'ticker', 'Date',
+                        'Pct_Change_Daily', 'Pct_Change_Monthly', 'Pct_Change_Yearly', 'Symbol',
+                        'date_of_transaction']
+MOMENTUM_FEATURE_COLUMNS = ['Symbol', 'Date', 'High', 'Low', 'Open', 'Close', 'Volume', 'AdjClose',
+                            'Pct_Change_Daily', 'Pct_Change_Monthly', 'Pct_Change_Yearly', 'RSI',
+                            'Volatility', 'Yearly_Return_Rank', 'Monthly_Return_Rank',
+                            'Rolling_Yearly_Mean_Positive_Days', 'Rolling_Monthly_Mean_Positive_Days',
+                            'Rolling_Monthly_Mean_Price', 'Rolling_Yearly_Mean_Price',
+                            'Momentum_Quality_Monthly', 'Momentum_Quality_Yearly',
+                            'SPY_Trailing_Month_Return']
+
+
+def format_dates(dates):
+    """
+    Dates as YYYY-MM-DD text, whether read as text (database) or typed (parquet)
+    """
+    return pd.to_datetime(pd.Series(dates)).dt.strftime('%Y-%m-%d').to_numpy(dtype=object)
+
+
+def rank_descending(values):
+    """
+    Zero based descending rank (0 is the best performer), ties in row order
+    and missing values unranked, as momentum.get_return_rank_matrix
+    """
+    ranks = np.full(len(values), np.nan)
+    known = np.flatnonzero(~np.isnan(values))
+    order = known[np.argsort(-values[known], kind='mergesort')]
+    ranks[order] = np.arange(len(order))
+    return ranks
+
+
+class FeatureState(object):
+    """
+    Per ticker rolling state, one row per ticker
+    """
+
+    def __init__(self, symbols=(), **arrays):
+        n = len(symbols)
+        self.symbols = list(symbols)
+        self.rows = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.last_date = arrays.get('last_date', np.full(n, '', dtype=object)).astype(object)
+        self.n_obs = arrays.get('n_obs', np.zeros(n, dtype='int64'))
+        self.closes = arrays.get('closes', np.full((n, WINDOW), np.nan))
+        self.classes = arrays.get('classes', np.zeros((n, WINDOW)))
+        for name in ('avg_gain', 'avg_loss', 'price_sum_monthly', 'price_sum_yearly',
+                     'up_sum_monthly', 'up_sum_yearly'):
+            setattr(self, name, arrays.get(name, np.zeros(n)))
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        with np.load(path, allow_pickle=False) as store:
+            arrays = {name: store[name] for name in store.files}
+        return cls(arrays.pop('symbols').tolist(), **arrays)
+
+    def save(self, path=STATE_PATH):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        np.savez(path, symbols=np.array(self.symbols, dtype=str),
+                 last_date=self.last_date.astype(str), n_obs=self.n_obs, closes=self.closes,
+                 classes=self.classes, avg_gain=self.avg_gain, avg_loss=self.avg_loss,
+                 price_sum_monthly=self.price_sum_monthly, price_sum_yearly=self.price_sum_yearly,
+                 up_sum_monthly=self.up_sum_monthly, up_sum_yearly=self.up_sum_yearly)
+
+    def max_date(self):
+        return max(self.last_date) if self.symbols and max(self.last_date) else None
+
+    def get_rows(self, symbols):
+        """
+        State rows of symbols, adding empty state for new tickers
+        """
+        new = [symbol for symbol in symbols if symbol not in self.rows]
+        if new:
+            n = len(new)
+            self.rows.update((symbol, len(self.symbols) + i) for i, symbol in enumerate(new))
+            self.symbols.extend(new)
+            self.last_date = np.append(self.last_date, np.full(n, '', dtype=object))
+            self.n_obs = np.append(self.n_obs, np.zeros(n, dtype='int64'))
+            self.closes = np.vstack([self.closes, np.full((n, WINDOW), np.nan)])
+            self.classes = np.vstack([self.classes, np.zeros((n, WINDOW))])
+            for name in ('avg_gain', 'avg_loss', 'price_sum_monthly', 'price_sum_yearly',
+                         'up_sum_monthly', 'up_sum_yearly'):
+                setattr(self, name, np.append(getattr(self, name), np.zeros(n)))
+        return np.array([self.rows[symbol] for symbol in symbols], dtype='int64')
+
+    def lag(self, ring, rows, n_obs, days):
+        """
+        Value of ring (closes or classes) `days` trading days back, NaN where
+        the ticker has fewer observations
+        """
+        values = ring[rows, (n_obs - days) % WINDOW]
+        return np.where(n_obs >= days, values, np.nan)
+
+    def window_sum(self, rows, n_obs, close, days):
+        """
+        Sum of close and the ring's last days - 1 closes (all of them for a
+        shorter history), NaN while a missing close is in the window
+        """
+        lags = np.arange(1, days)
+        values = self.closes[rows[:, None], (n_obs[:, None] - lags) % WINDOW]
+        return close + np.where(lags <= n_obs[:, None], values, 0).sum(axis=1)
+
+    def update(self, symbols, dates, close):
+        """
+        Append one trading day (each symbol at most once) to the state.
+        Returns a dictionary of the day's feature arrays
+        """
+        rows = self.get_rows(symbols)
+        n_obs = self.n_obs[rows]
+        monthly, yearly, period = basic.MONTHLY_TRADING_DAYS, basic.YEARLY_TRADING_DAYS, panel.RSI_PERIOD
+        features = {}
+
+        # Percent changes against the closes 1, 21 and 252 days back
+        previous = self.lag(self.closes, rows, n_obs, 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            features['Pct_Change_Daily'] = close / previous - 1
+            features['Pct_Change_Monthly'] = close / self.lag(self.closes, rows, n_obs, monthly) - 1
+            features['Pct_Change_Yearly'] = close / self.lag(self.closes, rows, n_obs, yearly) - 1
+
+        # Wilder RSI: simple means of the first RSI_PERIOD changes, then smoothed.
+        # A change to or from a missing close is skipped, keeping the averages
+        change = close - previous
+        observed = ~np.isnan(change)
+        gain, loss = np.maximum(change, 0), np.maximum(-change, 0)
+        avg_gain, avg_loss = self.avg_gain[rows], self.avg_loss[rows]
+        warm_up = (n_obs >= 1) & (n_obs <= period)
+        smoothed = n_obs > period
+        avg_gain = np.where(warm_up & observed, avg_gain + gain, avg_gain)
+        avg_loss = np.where(warm_up & observed, avg_loss + loss, avg_loss)
+        avg_gain = np.where(n_obs == period, avg_gain / period, avg_gain)
+        avg_loss = np.where(n_obs == period, avg_loss / period, avg_loss)
+        avg_gain = np.where(smoothed & observed, (avg_gain * (period - 1) + gain) / period, avg_gain)
+        avg_loss = np.where(smoothed & observed, (avg_loss * (period - 1) + loss) / period, avg_loss)
+        self.avg_gain[rows], self.avg_loss[rows] = avg_gain, avg_loss
+        features['RSI'] = np.where((n_obs >= period) & ~np.isnan(close),
+                                   panel.get_rsi_from_averages(avg_gain, avg_loss), np.nan)
+
+        # Volatility of the last 21 closes, and the Sharpe style ratio
+        window = panel.VOLATILITY_WINDOW
+        recent = self.closes[rows[:, None], (n_obs[:, None] - np.arange(window - 1, 0, -1)) % WINDOW]
+        recent = np.column_stack([recent, close])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            features['Volatility'] = np.where(n_obs + 1 >= window,
+                                              recent.std(axis=1) / close * panel.VOLATILITY_SCALE,
+                                              np.nan)
+            features['Sharp_Ratio'] = features['Pct_Change_Monthly'] / features['Volatility']
+
+        # Positive day class (0 only for a negative daily change) and rolling sums
+        up = np.where(features['Pct_Change_Daily'] < 0, 0.0, 1.0)
+        for days, price_sum, up_sum in ((monthly, 'price_sum_monthly', 'up_sum_monthly'),
+                                        (yearly, 'price_sum_yearly', 'up_sum_yearly')):
+            leaving = n_obs >= days
+            prices = getattr(self, price_sum)[rows] + close - np.where(
+                leaving, self.lag(self.closes, rows, n_obs, days), 0)
+            ups = getattr(self, up_sum)[rows] + up - np.where(
+                leaving, self.lag(self.classes, rows, n_obs, days), 0)
+            # A missing close makes the running sum NaN; rebuild it from the
+            # ring buffer until the missing close has left the window
+            stale = np.isnan(prices)
+            if stale.any():
+                prices[stale] = self.window_sum(rows[stale], n_obs[stale], close[stale], days)
+            getattr(self, price_sum)[rows], getattr(self, up_sum)[rows] = prices, ups
+            full = n_obs + 1 >= days
+            period_name = 'Monthly' if days == monthly else 'Yearly'
+            features['Rolling_' + period_name + '_Mean_Price'] = np.where(full, prices / days, np.nan)
+            features['Rolling_' + period_name + '_Mean_Positive_Days'] = np.where(full, ups / days, np.nan)
+            mean_up = features['Rolling_' + period_name + '_Mean_Positive_Days']
+            features['Momentum_Quality_' + period_name] = (
+                (features['Pct_Change_' + period_name] * 100) * (mean_up - (1 - mean_up)))
+
+        # Ranks across the day's tickers
+        features['Monthly_Return_Rank'] = rank_descending(features['Pct_Change_Monthly'])
+        features['Yearly_Return_Rank'] = rank_descending(features['Pct_Change_Yearly'])
+
+        # Store the new close and class in the ring buffers
+        self.closes[rows, n_obs % WINDOW] = close
+        self.classes[rows, n_obs % WINDOW] = up
+        self.n_obs[rows] = n_obs + 1
+        self.last_date[rows] = dates
+        return features
+
+
+def compute_features(state, prices_df):
+    """
+    Append the price rows (Symbol, date_of_transaction, AdjClose, ...) newer
+    than each ticker's state to the state, one trading day at a time, and
+    return them with the price return and momentum feature columns
+    """
+    df = prices_df.copy()
+    df['Date'] = format_dates(df['date_of_transaction'])
+    df.sort_values(by=['Date', 'Symbol'], kind='mergesort', inplace=True)
+    last_date = pd.Series(state.last_date, index=state.symbols, dtype=object)
+    df = df[df['Date'] > df['Symbol'].map(last_date).fillna('').astype(str)]
+    df.reset_index(drop=True, inplace=True)
+
+    dates = df['Date'].to_numpy(dtype=object)
+    symbols = df['Symbol'].to_numpy(dtype=object)
+    close = df['AdjClose'].to_numpy(dtype=float)
+    bounds = np.append(np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]]), len(dates)) \
+        if len(dates) else np.array([0])
+
+    columns = {}
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        day = state.update(symbols[start:end], dates[start:end], close[start:end])
+        for col, values in day.items():
+            columns.setdefault(col, np.full(len(df), np.nan))[start:end] = values
+    for col, values in columns.items():
+        df[col] = values
+    df['ticker'] = df['Symbol']
+    return df
+
+
+def join_spy_trailing_month_return(features_df, spy_df):
+    """
+    Join the SPY monthly percent change to every row on the trading date
+    """
+    spy = pd.DataFrame({'Date': format_dates(spy_df['date_of_transaction']),
+                        'SPY_Trailing_Month_Return': spy_df['Pct_Change_Monthly'].values})
+    spy.drop_duplicates(subset='Date', keep='last', inplace=True)
+    return pd.merge(features_df, spy, on='Date', how='left')
+
+
+def run_incremental(state_path=STATE_PATH):
+    """
+    Read the price rows after the stored state (the full history on the first
+    run), append them to the state, write the new stock_price_return and
+    momentum_features rows, then save the state
+    """
+    max_date = dfhandle.find_max_date()
+    if os.path.exists(state_path):
+        state = FeatureState.load(state_path)
+        print("Loaded feature state of " + str(len(state.symbols)) + " tickers up to " +
+              str(state.max_date()))
+    else:
+        print("No feature state at " + state_path + "; replaying the full price history")
+        state = FeatureState()
+
+    prices_df = dfhandle.read_table('stock_price', state.max_date(), columns=STOCK_PRICE_COLUMNS)
+    features_df = compute_features(state, prices_df)
+
+    # Only rows after the last momentum_features date are new to the tables
+    if max_date is not None:
+        features_df = features_df[features_df['Date'] > format_dates([max_date])[0]]
+    print("Computed features for " + str(features_df.shape[0]) + " new rows")
+    if features_df.shape[0] == 0:
+        state.save(state_path)
+        return features_df
+
+    spy_df = dfhandle.read_table('spy_stock_price_return', max_date,
+                                 columns=['date_of_transaction', 'Pct_Change_Monthly'])
+    features_df = join_spy_trailing_month_return(features_df, spy_df)
+
+    dfhandle.replace_table(features_df[PRICE_RETURN_COLUMNS], 'stock_price_return')
+    dfhandle.load_table(features_df[MOMENTUM_FEATURE_COLUMNS], 'momentum_features')
+    state.save(state_path)
+    return features_df
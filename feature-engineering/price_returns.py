@@ -9,17 +9,21 @@ George Krug
 
 
 import pandas as pd
-from talib import RSI
 import matplotlib.pyplot as plt
 import time
 #import momentum
-from taIndicators import momentum
+from taIndicators import momentum, panel
 import dataframeHandling as dfhandle
+import dbConnection
 
 
   
 
 def get_daily_percent_change(time_series_df, ticker):
+    """
+    Original per symbol percent changes, written back with .loc; kept as
+    the reference for benchmarks and checks
+    """
     close = pd.DataFrame(momentum.get_time_series_adjusted_close(time_series_df, ticker))
     time_series_df.loc[ticker, 'Pct_Change_Daily'] = close.pct_change(1).values
     time_series_df.loc[ticker, 'Pct_Change_Monthly'] = close.pct_change(momentum.MONTHLY_TRADING_DAYS).values
@@ -27,18 +31,19 @@ def get_daily_percent_change(time_series_df, ticker):
     return time_series_df
 
 
-def get_stock_return_features():
-    file_path = "data/stock_price.csv"
-    output_file_path = "data/stock_prices_and_returns_2.csv"
-    
+def get_price_returns(max_date=None, lookback=0):
+    """
+    Read the stock prices after max_date, plus a warm-up window of the last
+    lookback trading days, and compute their daily, monthly and yearly
+    percent changes. Returns the rows in the stock_price_return layout; the
+    warm-up rows are included, the caller drops what it does not need
+    """
     bacis_columns=['sno', 'date_of_transaction','High', 'Low', 'Open', 'Close', 'Volume', 'AdjClose','Symbol','ticker','Date']
     new_columns = ['Pct_Change_Daily', 'Pct_Change_Monthly', 'Pct_Change_Yearly']
-    #basic_df = dfhandle.get_dataframe_from_csv(file_path)
-    max_date=dfhandle.find_max_date()
-    print(max_date)
     start = time.time()
 
-    basic_df=dfhandle.read_table('stock_price',max_date)
+    stock_price_columns = ['sno', 'date_of_transaction', 'High', 'Low', 'Open', 'Close', 'Volume', 'AdjClose', 'Symbol']
+    basic_df=dfhandle.read_table('stock_price', max_date, columns=stock_price_columns, lookback=lookback)
     basic_df['Date']=basic_df['date_of_transaction']
     end = time.time()
     print("Time for reading table: " + str(end - start) + " seconds.")
@@ -47,26 +52,34 @@ def get_stock_return_features():
     
     df = dfhandle.add_columns_to_df(basic_df[bacis_columns], new_columns)
 
-    start = time.time()
-    
     print("Calculating price return data....................")
-    for symbol, mrow in df.groupby(level=0):
-        print(symbol)
-        df = get_daily_percent_change(df, symbol)
-        
-
+    df = panel.add_percent_changes(df)
 
-    print("Writing to file: " + output_file_path)
-    
-    print(df.columns)
     df['Symbol']=df['ticker']
     df['date_of_transaction']=df['Date']
-    print(df.columns)
-    #new_df = df['date_of_transaction'] > '2019-04-03'
-    print(df.info())
     df.columns=['sno','High', 'Low', 'Open', 'Close', 'Volume', 'AdjClose','ticker','Date','Pct_Change_Daily', 'Pct_Change_Monthly', 'Pct_Change_Yearly','Symbol','date_of_transaction']
+    return df.reset_index(drop=True)
+
+
+def get_stock_return_features():
+    output_file_path = "data/stock_prices_and_returns_2.csv"
+    
+    #basic_df = dfhandle.get_dataframe_from_csv(file_path)
+    max_date=dfhandle.find_max_date()
+    print(max_date)
+    start = time.time()
+
+    # Only the new trading days plus a yearly warm-up window are needed for the percent changes
+    df = get_price_returns(max_date, lookback=momentum.YEARLY_TRADING_DAYS)
+
+    print("Writing to file: " + output_file_path)
+    print(df.info())
 
-    delta_records=df['date_of_transaction']>max_date
+    # Drop the warm-up window; only the delta is written
+    if max_date is None:
+        delta_records = df['date_of_transaction'].notnull()
+    else:
+        delta_records=df['date_of_transaction']>max_date
 
     dfhandle.replace_table(df[delta_records],'stock_price_return')
 
@@ -74,5 +87,7 @@ def get_stock_return_features():
     
     #df.to_csv(output_file_path, encoding='utf-8', index=True)
     print("Process time: " + str(end - start) + " seconds.")
+    dbConnection.print_stats()
 
-get_stock_return_features()
\ No newline at end of file
+if __name__ == '__main__':
+    get_stock_return_features()
@@ -5,11 +5,15 @@ including RSI and rolling price return rank (monthly and yearly)
 
 
 import pandas as pd
-from talib import RSI
 import numpy as np
 import matplotlib.pyplot as plt
 import math
 
+try:
+    from talib import RSI
+except ImportError:
+    RSI = None
+
 
 START_DATE = '2011-01-03'
 END_DATE = '2019-04-03'
@@ -75,10 +79,78 @@ def update_with_null_return_rankings(df, stocks_dict, period, date):
     return updated_daily_subset_df
 
 
+def get_return_rank_matrix(df, column):
+    """
+    Pivot a percent change column of the (Symbol, Date) indexed panel into a
+    date x symbol matrix and rank every trading day in one batched operation.
+    Ranks are zero based and descending (0 is the best performer of the day),
+    matching update_rank_dataframe; missing returns are left unranked (NaN)
+    """
+    returns = df[column].unstack(level=0)
+    return returns.rank(axis=1, method='first', ascending=False, na_option='keep') - 1
+
+
+def add_daily_return_rankings(df, periods=("Monthly", "Yearly")):
+    """
+    Compute the daily adjusted return rank for each period and write the
+    <period>_Return_Rank columns straight back to the (Symbol, Date) panel
+    """
+    for period in periods:
+        rank_matrix = get_return_rank_matrix(df, "Pct_Change_" + period)
+        ranks = rank_matrix.T.stack()
+        df[str(period) + "_Return_Rank"] = ranks.reindex(df.index).values
+    return df
+
+
+def get_period_rank_dataframe(df, period):
+    """
+    Build the per period ranking frame (Symbol, Date, panel columns,
+    <period>_Return, <period>_Return_Rank) from a panel already ranked by
+    add_daily_return_rankings, in the layout update_rank_dataframe produces
+    """
+    stock_period = str(period) + "_Return"
+    rank_period = str(period) + "_Return_Rank"
+    rank_columns = [str(p) + "_Return_Rank" for p in ("Monthly", "Yearly")]
+    date_level = df.index.names[1]
+
+    rank_df = df.drop(columns=[col for col in rank_columns if col in df.columns])
+    rank_df[stock_period] = df["Pct_Change_" + period].values
+    rank_df[rank_period] = df[rank_period].values
+    rank_df.reset_index(inplace=True)
+    if date_level != 'Date':
+        if 'Date' in rank_df.columns:
+            rank_df.drop(columns=[date_level], inplace=True)
+        else:
+            rank_df.rename(columns={date_level: 'Date'}, inplace=True)
+
+    rank_df.sort_values(by=['Date', 'Symbol'], kind='mergesort', inplace=True)
+    rank_df.reset_index(drop=True, inplace=True)
+    columns = ['Symbol', 'Date'] + [col for col in rank_df.columns if col not in ('Symbol', 'Date')]
+    return rank_df[columns]
+
+
 def get_daily_adjusted_stock_return_rankings(df, ticker_list, date_list):
     """
     The input df dataframe must contain monthly & yearly stock percent changes
-    to compute a rolling return rank updated daily
+    to compute a rolling return rank updated daily. The ranks are written back
+    to df and also returned as separate yearly and monthly frames
+    """
+    in_universe = (df.index.get_level_values(0).isin(ticker_list) &
+                   df.index.get_level_values(1).isin(date_list))
+    ranked_df = add_daily_return_rankings(df[in_universe].copy())
+    for period in ("Monthly", "Yearly"):
+        rank_period = period + "_Return_Rank"
+        df[rank_period] = ranked_df[rank_period].reindex(df.index).values
+
+    yearly_rank_df = get_period_rank_dataframe(ranked_df, "Yearly")
+    monthly_rank_df = get_period_rank_dataframe(ranked_df, "Monthly")
+    return yearly_rank_df, monthly_rank_df
+
+
+def get_daily_adjusted_stock_return_rankings_by_date(df, ticker_list, date_list):
+    """
+    Original per date / per symbol implementation of the daily adjusted
+    return rankings; kept as the reference for benchmarks and checks
     """
     global yearl_rank_df, monthly_rank_df
     yearly_rank_df = pd.DataFrame()
@@ -110,16 +182,16 @@ def get_daily_adjusted_stock_return_rankings(df, ticker_list, date_list):
 
         if len(yearly) > 0:
             daily_adjusted_rank_df = update_rank_dataframe(df, yearly, "Yearly", date)
-            yearly_rank_df = yearly_rank_df.append(daily_adjusted_rank_df)
+            yearly_rank_df = pd.concat([yearly_rank_df, daily_adjusted_rank_df])
         else:
             new_df = update_with_null_return_rankings(df, yearly_no_data, "Yearly", date)
-            yearly_rank_df = yearly_rank_df.append(new_df)
+            yearly_rank_df = pd.concat([yearly_rank_df, new_df])
         if len(monthly) > 0:
             daily_adjusted_rank_df = update_rank_dataframe(df, monthly, "Monthly", date)
-            monthly_rank_df = monthly_rank_df.append(daily_adjusted_rank_df)
+            monthly_rank_df = pd.concat([monthly_rank_df, daily_adjusted_rank_df])
         else:
             new_df = update_with_null_return_rankings(df, monthly_no_data, "Monthly", date)
-            monthly_rank_df = monthly_rank_df.append(new_df)
+            monthly_rank_df = pd.concat([monthly_rank_df, new_df])
 
     yearly_rank_df.reset_index(inplace=True)
     monthly_rank_df.reset_index(inplace=True)
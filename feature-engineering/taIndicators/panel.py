@@ -0,0 +1,175 @@
+"""
+Panel module computing indicators for every stock at once. The (Symbol, Date)
+indexed stock frame is sorted so each symbol's history is one contiguous, date
+ordered block of rows; an indicator is then a single pass over the whole
+column, with the first rows of each block masked where the look-back window
+would reach into the previous symbol's prices
+"""
+
+
+import numpy as np
+import pandas as pd
+from taIndicators import basic
+
+try:
+    from talib import RSI
+except ImportError:
+    RSI = None
+
+
+PERCENT_CHANGE_PERIODS = [('Pct_Change_Daily', 1),
+                          ('Pct_Change_Monthly', basic.MONTHLY_TRADING_DAYS),
+                          ('Pct_Change_Yearly', basic.YEARLY_TRADING_DAYS)]
+RSI_PERIOD = 20
+VOLATILITY_WINDOW = 21
+VOLATILITY_SCALE = 12
+
+
+def sort_panel(df):
+    """
+    Sort the panel by symbol, then date, so every symbol is one contiguous block
+    """
+    return df.sort_index(level=[0, 1], sort_remaining=False, kind='mergesort')
+
+
+def get_segment_positions(symbols):
+    """
+    Position of each row within its symbol's block of a sorted panel
+    (0 on the first trading day of every symbol)
+    """
+    symbols = np.asarray(symbols)
+    rows = np.arange(len(symbols))
+    if len(symbols) == 0:
+        return rows
+    block_start = np.empty(len(symbols), dtype=bool)
+    block_start[0] = True
+    block_start[1:] = symbols[1:] != symbols[:-1]
+    return rows - np.maximum.accumulate(np.where(block_start, rows, 0))
+
+
+def get_segment_starts(positions):
+    """
+    First row of every symbol's block, plus the end of the panel
+    """
+    return np.append(np.flatnonzero(positions == 0), len(positions))
+
+
+def to_position_matrix(values, positions):
+    """
+    Lay a sorted panel column out as a position x symbol matrix: column j
+    holds the j-th symbol's history from its first trading day, padded with
+    NaN after its last, so rolling and recursive indicators can run over all
+    symbols at once without crossing from one symbol into the next.
+    Returns the matrix and the symbol (column) of every row
+    """
+    symbols = np.cumsum(positions == 0) - 1
+    matrix = np.full((positions.max() + 1, symbols[-1] + 1), np.nan)
+    matrix[positions, symbols] = values
+    return matrix, symbols
+
+
+def get_rsi_from_averages(avg_gain, avg_loss):
+    """
+    RSI from Wilder average gains and losses (0 when both are zero, as talib)
+    """
+    total = avg_gain + avg_loss
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total != 0, 100 * (avg_gain / total), 0)
+
+
+def get_wilder_rsi(close, positions, period=RSI_PERIOD):
+    """
+    Pure NumPy RSI with Wilder smoothing, matching talib.RSI: the average
+    gain and loss start as the simple means of the first period changes, then
+    avg = (avg * (period - 1) + change) / period. NaN for a symbol's first
+    period rows
+    """
+    matrix, symbols = to_position_matrix(np.asarray(close, dtype=float), positions)
+    change = np.diff(matrix, axis=0)
+    gains, losses = np.maximum(change, 0), np.maximum(-change, 0)
+
+    # Row p of the matrix is the RSI after the change from p-1 to p
+    rsi = np.full(matrix.shape, np.nan)
+    if change.shape[0] >= period:
+        avg_gain = gains[:period].sum(axis=0) / period
+        avg_loss = losses[:period].sum(axis=0) / period
+        rsi[period] = get_rsi_from_averages(avg_gain, avg_loss)
+        for row in range(period + 1, matrix.shape[0]):
+            avg_gain = (avg_gain * (period - 1) + gains[row - 1]) / period
+            avg_loss = (avg_loss * (period - 1) + losses[row - 1]) / period
+            rsi[row] = get_rsi_from_averages(avg_gain, avg_loss)
+    return rsi[positions, symbols]
+
+
+def get_rsi(close, positions, period=RSI_PERIOD, use_talib=None):
+    """
+    RSI of every row: talib.RSI over each symbol's contiguous block when talib
+    is installed (or use_talib), otherwise the NumPy implementation
+    """
+    if use_talib is None:
+        use_talib = RSI is not None
+    if not use_talib:
+        return get_wilder_rsi(close, positions, period)
+
+    close = np.asarray(close, dtype=float)
+    rsi = np.full(len(close), np.nan)
+    starts = get_segment_starts(positions)
+    for start, end in zip(starts[:-1], starts[1:]):
+        rsi[start:end] = RSI(close[start:end], timeperiod=period)
+    return rsi
+
+
+def get_volatility(close, positions, window=VOLATILITY_WINDOW):
+    """
+    Rolling window (population) standard deviation of the close relative to
+    the close, scaled by VOLATILITY_SCALE as in volatility.get_stock_volatility
+    """
+    close = np.asarray(close, dtype=float)
+    matrix, symbols = to_position_matrix(close, positions)
+    rolling_std = pd.DataFrame(matrix).rolling(window).std(ddof=0).values
+    return (rolling_std[positions, symbols] / close) * VOLATILITY_SCALE
+
+
+def get_percent_change(close, positions, period):
+    """
+    period day percent change of every row, NaN for a symbol's first
+    period rows
+    """
+    close = np.asarray(close, dtype=float)
+    change = np.full(len(close), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change[period:] = close[period:] / close[:-period] - 1
+    change[positions < period] = np.nan
+    return change
+
+
+def add_percent_changes(df, periods=PERCENT_CHANGE_PERIODS):
+    """
+    Compute the daily, monthly and yearly percent changes of AdjClose for
+    every symbol of the (Symbol, Date) indexed panel in one pass. Returns the
+    panel sorted by symbol and date with the percent change columns filled
+    """
+    df = sort_panel(df)
+    positions = get_segment_positions(df.index.get_level_values(0))
+    close = df['AdjClose'].to_numpy(dtype=float)
+    for col, period in periods:
+        df[col] = get_percent_change(close, positions, period)
+    return df
+
+
+def add_momentum_indicators(df, use_talib=None):
+    """
+    Compute RSI, volatility and the Sharpe style ratio (monthly percent change
+    over volatility) for every symbol of the (Symbol, Date) indexed panel in
+    one pass. Returns the panel sorted by symbol and date with the RSI,
+    Volatility and Sharp_Ratio columns filled
+    """
+    df = sort_panel(df)
+    positions = get_segment_positions(df.index.get_level_values(0))
+    close = df['AdjClose'].to_numpy(dtype=float)
+    df['RSI'] = get_rsi(close, positions, use_talib=use_talib)
+    volatility = get_volatility(close, positions)
+    df['Volatility'] = volatility
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['Sharp_Ratio'] = df['Pct_Change_Monthly'].to_numpy(dtype=float) / volatility
+    return df
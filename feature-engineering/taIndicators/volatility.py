@@ -1,5 +1,4 @@
 import pandas as pd
-from talib import RSI
 import numpy as np
 
 
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""
+The feature scripts import each other by module name; put the
+feature-engineering directory on the path for the tests
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+@pytest.fixture
+def parquet_store(tmpdir, monkeypatch):
+    """
+    An empty parquet store as the storage backend
+    """
+    monkeypatch.setenv('STORAGE_BACKEND', 'parquet')
+    monkeypatch.setenv('PARQUET_STORE', str(tmpdir))
+    return str(tmpdir)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+bulk_load on SQLite (the executemany path) against DataFrame.to_sql
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+import dataframeHandling as dfhandle
+
+
+def price_rows():
+    return pd.DataFrame({'Symbol':['AAA', 'AAA', 'BBB'],
+                         'date_of_transaction':pd.to_datetime(['2019-04-02', '2019-04-03', None]),
+                         'AdjClose':[10.5, np.nan, 20.25],
+                         'Volume':np.array([100, 200, 300], dtype='int64')})
+
+
+def test_bulk_load_sqlite_matches_to_sql():
+    df = price_rows()
+    engine = create_engine('sqlite://')
+    dfhandle.bulk_load(df, 'stock_price', engine=engine, chunksize=2)
+    df.to_sql('expected', engine, index=False)
+
+    loaded = pd.read_sql_query('select * from stock_price', engine)
+    expected = pd.read_sql_query('select * from expected', engine)
+    pd.testing.assert_frame_equal(loaded, expected)
+    assert loaded['AdjClose'].isnull().tolist() == [False, True, False]
+    assert loaded['date_of_transaction'].isnull().tolist() == [False, False, True]
+
+    # Appends go into the same table
+    dfhandle.bulk_load(df, 'stock_price', engine=engine)
+    assert pd.read_sql_query('select count(*) as n from stock_price', engine)['n'][0] == 6
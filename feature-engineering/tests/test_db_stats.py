@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Query counters of the shared engine
+"""
+import os
+import pandas as pd
+import dbConnection
+
+
+def test_query_stats_are_running_totals(tmpdir, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    monkeypatch.setenv('DB_SQLITE_PATH', os.path.join(str(tmpdir), 'stats.db'))
+    dbConnection.dispose_engine()
+    dbConnection.reset_stats()
+    try:
+        engine = dbConnection.get_engine()
+        for i in range(200):
+            pd.read_sql_query('select ' + str(i) + ' as n', engine)
+        stats = dbConnection.get_stats()
+    finally:
+        dbConnection.dispose_engine()
+        dbConnection.reset_stats()
+
+    assert stats['queries'] == 200
+    assert 0 < stats['max_query_seconds'] <= stats['query_seconds']
+    assert stats['slowest_query'].startswith('select ')
+    assert all(not isinstance(value, list) for value in stats.values())
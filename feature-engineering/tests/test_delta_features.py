@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+A delta run of the feature generation (only the trading days after the last
+momentum_features date) against a full run, on the parquet store
+"""
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+import benchmarks
+import columnarStore
+import incrementalFeatures as incremental
+import price_returns
+
+pytest.importorskip('pyarrow')
+feature_gen = importlib.import_module('feature-gen')
+
+NEW_DAYS = 5
+
+
+def write_price_store(df):
+    """
+    Write df's prices as stock_price, and the first symbol's returns as
+    spy_stock_price_return
+    """
+    df = df.copy()
+    df['sno'] = np.arange(df.shape[0])
+    columnarStore.write_dataset(df[incremental.STOCK_PRICE_COLUMNS], 'stock_price', if_exists='replace')
+    spy = price_returns.get_price_returns()
+    columnarStore.write_dataset(spy[spy['Symbol'] == 'T0000'], 'spy_stock_price_return',
+                                if_exists='replace')
+    return sorted(df['Date'].unique())
+
+
+@pytest.fixture
+def price_store(parquet_store):
+    """
+    Two years of synthetic prices for six symbols
+    """
+    return write_price_store(benchmarks.synthetic_price_panel(n_tickers=6, n_years=2))
+
+
+def test_delta_price_returns_match_full_run(price_store):
+    max_date = price_store[-NEW_DAYS - 1]
+    full = price_returns.get_price_returns()
+    delta = price_returns.get_price_returns(max_date, lookback=benchmarks.momentum.YEARLY_TRADING_DAYS)
+
+    key = ['Symbol', 'date_of_transaction']
+    full = full[full['date_of_transaction'] > max_date].set_index(key).sort_index()
+    delta = delta[delta['date_of_transaction'] > max_date].set_index(key).sort_index()
+    pd.testing.assert_frame_equal(delta, full)
+
+
+def test_delta_momentum_features_match_full_run(price_store):
+    max_date = price_store[-NEW_DAYS - 1]
+    full = feature_gen.generate_momentum_features()
+    delta = feature_gen.generate_momentum_features(max_date)
+
+    columns = incremental.MOMENTUM_FEATURE_COLUMNS
+    full = full.loc[full['Date'] > max_date, columns].sort_index()
+    delta = delta.loc[delta['Date'] > max_date, columns].sort_index()
+    assert delta.shape[0] == 6 * NEW_DAYS
+    # RSI is recursive over a symbol's whole history; a yearly warm-up only
+    # brings the Wilder averages close to the full run's
+    pd.testing.assert_frame_equal(delta.drop(columns=['RSI']), full.drop(columns=['RSI']))
+    assert np.allclose(delta['RSI'], full['RSI'], rtol=0, atol=1e-3)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+The incremental feature state against the batch feature generation
+"""
+import importlib
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import benchmarks
+import columnarStore
+import incrementalFeatures as incremental
+from test_delta_features import write_price_store
+
+pytest.importorskip('pyarrow')
+feature_gen = importlib.import_module('feature-gen')
+
+
+def ragged_price_panel():
+    """
+    Synthetic prices where T0001 and T0002 list late (after a month and
+    after more than a year) and T0003 and T0004 miss a tenth of their days
+    """
+    df = benchmarks.synthetic_price_panel(n_tickers=6, n_years=2)
+    dates = sorted(df['Date'].unique())
+    rng = np.random.RandomState(1)
+    keep = ~((df['Symbol'] == 'T0001') & (df['Date'] < dates[30]))
+    keep &= ~((df['Symbol'] == 'T0002') & (df['Date'] < dates[300]))
+    keep &= ~(df['Symbol'].isin(['T0003', 'T0004']) & (rng.rand(df.shape[0]) < 0.1))
+    return df[keep].reset_index(drop=True)
+
+
+def batch_features():
+    features = feature_gen.generate_momentum_features()
+    features = features[incremental.MOMENTUM_FEATURE_COLUMNS].reset_index(drop=True)
+    features['Date'] = incremental.format_dates(features['Date'])
+    return features
+
+
+def incremental_features(prices, spy, resume_date, state_path):
+    """
+    Replay the prices up to resume_date, save and reload the state, then
+    append the remaining days
+    """
+    state = incremental.FeatureState()
+    first = incremental.compute_features(state, prices[prices['Date'] <= resume_date])
+    state.save(state_path)
+    state = incremental.FeatureState.load(state_path)
+    second = incremental.compute_features(state, prices)
+    features = pd.concat([first, second], ignore_index=True)
+    features = incremental.join_spy_trailing_month_return(features, spy)
+    return features[incremental.MOMENTUM_FEATURE_COLUMNS]
+
+
+def by_symbol_and_date(df):
+    return df.sort_values(['Symbol', 'Date']).set_index(['Symbol', 'Date'])
+
+
+def test_incremental_matches_batch_after_resume(parquet_store):
+    dates = write_price_store(ragged_price_panel())
+    prices = columnarStore.read_dataset('stock_price', incremental.STOCK_PRICE_COLUMNS)
+    prices['Date'] = incremental.format_dates(prices['date_of_transaction'])
+    spy = columnarStore.read_dataset('spy_stock_price_return')
+
+    expected = by_symbol_and_date(batch_features())
+    actual = by_symbol_and_date(incremental_features(
+        prices, spy, dates[400], os.path.join(parquet_store, 'feature_state.npz')))
+
+    assert actual.index.equals(expected.index)
+    numeric = expected.columns[expected.dtypes != object]
+    pd.testing.assert_frame_equal(actual[numeric].astype(float), expected[numeric].astype(float),
+                                  check_exact=False, rtol=1e-10, atol=1e-10)
+
+
+def test_incremental_state_recovers_from_missing_closes(parquet_store):
+    df = ragged_price_panel()
+    missing = (df['Symbol'] == 'T0005') & df['Date'].isin(sorted(df['Date'].unique())[100:103])
+    df.loc[missing, 'AdjClose'] = np.nan
+    dates = write_price_store(df)
+    prices = columnarStore.read_dataset('stock_price', incremental.STOCK_PRICE_COLUMNS)
+    prices['Date'] = incremental.format_dates(prices['date_of_transaction'])
+    spy = columnarStore.read_dataset('spy_stock_price_return')
+
+    # Resume while the missing closes are still in the yearly window
+    expected = by_symbol_and_date(batch_features())
+    actual = by_symbol_and_date(incremental_features(
+        prices, spy, dates[200], os.path.join(parquet_store, 'feature_state.npz')))
+
+    # Rolling means are NaN while a missing close is in their window, as in
+    # the batch run, and exact again once it has left
+    numeric = expected.columns[(expected.dtypes != object) & (expected.columns != 'RSI')]
+    pd.testing.assert_frame_equal(actual[numeric].astype(float), expected[numeric].astype(float),
+                                  check_exact=False, rtol=1e-10, atol=1e-10)
+    yearly = actual.loc['T0005', 'Rolling_Yearly_Mean_Price']
+    assert yearly.loc[dates[110]:dates[350]].isnull().all()
+    assert yearly.loc[dates[360]:].notnull().all()
+
+    # The Wilder averages skip the changes to and from the missing closes
+    rsi = actual.loc['T0005', 'RSI']
+    assert rsi.loc[dates[100]:dates[102]].isnull().all()
+    assert rsi.loc[dates[103]:].notnull().all()
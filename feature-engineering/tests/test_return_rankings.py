@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+The batched daily return rankings against the per date reference loop
+"""
+import numpy as np
+import benchmarks
+import dataframeHandling as dfhandle
+from taIndicators import momentum
+
+
+def test_rankings_match_the_reference_loop():
+    df = benchmarks.synthetic_price_panel(n_tickers=4, n_years=1)
+    dates = sorted(df['Date'].unique())
+    # A late listing: no returns for T0003 in the first quarter
+    df = df[~((df['Symbol'] == 'T0003') & (df['Date'] < dates[60]))]
+    df = dfhandle.add_columns_to_df(df, ['RSI', 'Volatility', 'Sharp_Ratio'])
+    ticker_list = df.index.get_level_values(0).unique().tolist()
+    date_list = sorted(df.index.get_level_values(1).unique().tolist())
+
+    old_yearly, old_monthly = momentum.get_daily_adjusted_stock_return_rankings_by_date(
+        df.copy(), ticker_list, date_list)
+    new_yearly, new_monthly = momentum.get_daily_adjusted_stock_return_rankings(
+        df.copy(), ticker_list, date_list)
+
+    for period, old, new in (("Yearly", old_yearly, new_yearly), ("Monthly", old_monthly, new_monthly)):
+        rank_period = period + "_Return_Rank"
+        old = old.sort_values(by=['Date', 'Symbol']).reset_index(drop=True)
+        assert old.shape[0] == new.shape[0]
+        assert np.allclose(old[rank_period].astype(float), new[rank_period].astype(float),
+                           equal_nan=True)
+    assert new_monthly['Monthly_Return_Rank'].notnull().any()
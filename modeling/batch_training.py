@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-target batch training
+
+pre_modeling_setup writes every target (kind x horizon) of the panel, while
+fit_lgbm_classifier and fit_sklearn_classifier each fit one. The batch trainer
+fits several targets of target_dict in one pass: the feature matrix is
+converted once, the split plan is built once, and every (target, split) pair
+is a job on the fold process pool, so short and long fits of different
+targets share the workers. Each job is timed, and the scores of every job are
+written to one results table (csv).
+
+The targets are modeled on the same rows -- those where every chosen target
+is known -- so that they can share the features and splits; the remaining
+rows (the most recent days, where the longest horizon has no outcome yet) are
+the holdout set.
+"""
+import time
+import numpy as np
+import pandas as pd
+from sklearn import metrics
+import fold_pool
+import modeling_funcs as mf
+
+RESULTS_PATH = "batch_results.csv"
+RESULT_COLUMNS = ['target', 'model', 'split_number', 'n_train', 'n_test', 'positive_rate',
+                  'threshold', 'auc', 'precision', 'recall', 'f1', 'accuracy', 'seconds']
+
+
+def _target_values(target_dict, key):
+    """
+    One target as floats, from a target dictionary or an open model dataset
+    """
+    values = target_dict.target(key) if hasattr(target_dict, 'target') else target_dict[key]
+    return np.asarray(values, dtype=float)
+
+
+def _target_labels(values, ema_gamma, smoothing_groups=None):
+    """
+    Classes of one target: 0/1 targets are already labeled and are kept, as
+    prepare_model_structures(labeled=True); continuous targets are smoothed
+    and labeled positive above zero
+    """
+    if np.isin(values, [0, 1]).all():
+        return values.astype('int')
+    return np.where(mf.smooth_targets(values, ema_gamma, smoothing_groups) > 0, 1, 0)
+
+
+def _fit_target_split(features, labels, holdout_features, column, split_number,
+                      train_indices, test_indices, fold_func, **kwargs):
+    """
+    Fit fold_func on one split of the target in column of labels; the
+    split's results come back with the target column and fit time
+    """
+    start = time.time()
+    fold = fold_func(features, labels[:, column], holdout_features, split_number,
+                     train_indices, test_indices, **kwargs)
+    fold['column'] = column
+    fold['seconds'] = time.time() - start
+    return fold
+
+
+def _split_scores(fold, expected):
+    """
+    Scores of one split's validation predictions, the same for every model
+    """
+    predicted, probs = fold['predicted'], fold['probs']
+    try:
+        auc = metrics.roc_auc_score(expected, probs)
+    except ValueError:
+        # A split holding a single class
+        auc = np.nan
+    return {'auc':auc,
+            'precision':metrics.precision_score(expected, predicted, average="weighted"),
+            'recall':metrics.recall_score(expected, predicted, average="weighted"),
+            'f1':metrics.f1_score(expected, predicted, average="weighted"),
+            'accuracy':metrics.accuracy_score(expected, predicted)}
+
+
+def fit_target_batch(X, target_dict, target_keys=None, model=None, label="", ema_gamma=1,
+                     n_splits=12, cv_method="ts", groups=pd.DataFrame(),
+                     threshold_search=False, smooth_by_ticker=False,
+                     holdout_method="distributed", n_jobs=1,
+                     results_path=RESULTS_PATH, **kwargs):
+    """
+    Fit a classifier for each target in target_keys (by default every target
+    of target_dict, a dictionary of arrays aligned with the rows of X or an
+    open model dataset) on one shared feature matrix and split plan.
+    model is a sci-kit learn classifier class built as model(**kwargs), or
+    None for LightGBM (kwargs, if any, replace the default parameters).
+    Continuous targets are smoothed (ema_gamma, within ticker if
+    smooth_by_ticker) and labeled positive above zero; 0/1 targets keep their
+    labels. (target, split) jobs run on n_jobs workers (-1 for all cores).
+    Returns a dictionary with the results table of every job (also written
+    to results_path, unless None), and the out of fold and holdout
+    probabilities of each target
+    """
+    start = time.time()
+    if target_keys is None:
+        target_keys = (target_dict.target_names if hasattr(target_dict, 'target_names')
+                       else [key for key in target_dict if key.startswith('target_')])
+    target_keys = list(target_keys)
+    label = label or ("LGBM Classifier" if model is None else model.__name__)
+
+    # Model the rows where every chosen target is known; hold out the rest
+    values = np.column_stack([_target_values(target_dict, key) for key in target_keys])
+    known = ~np.isnan(values).any(axis=1)
+    all_features = np.array(X)
+    features, holdout_features = all_features[known], all_features[~known]
+    feature_names = X.columns.tolist()
+    categorical_indices = [feature_names.index(c) for c in mf.CATEGORICAL_FEATURES
+                           if c in feature_names]
+    model_groups = groups[known].reset_index(drop=True) if not groups.empty else groups
+
+    # Classes for every target, after smoothing the continuous ones
+    smoothing_groups = None
+    if smooth_by_ticker and not groups.empty:
+        smoothing_groups = np.asarray(model_groups['ticker'])
+    labels = np.column_stack([_target_labels(values[known, j], ema_gamma, smoothing_groups)
+                              for j in range(len(target_keys))]).astype('int')
+
+    # One split plan for every target
+    if 'recur' in cv_method or 'window' in cv_method:
+        n_splits = 1
+    splits, _ = mf.instantiate_splits(features, n_splits, model_groups, cv_method)
+    splits = [(np.asarray(train), np.asarray(test)) for train, test in splits]
+    print("Fitting {} targets x {} splits ({} jobs) on {} rows, {} holdout rows"
+          .format(len(target_keys), len(splits), len(target_keys) * len(splits),
+                  features.shape[0], holdout_features.shape[0]))
+
+    # Every (target, split) pair is one job
+    if model is None:
+        fold_options = dict(fold_func=mf._fit_lgbm_fold, params=kwargs or None,
+                            categorical_indices=categorical_indices)
+    else:
+        fold_options = dict(fold_func=mf._fit_sklearn_fold, model=model, params=kwargs)
+    jobs = [(column, split_number, train, test)
+            for column in range(len(target_keys))
+            for split_number, (train, test) in enumerate(splits, 1)]
+    folds = fold_pool.run_jobs(_fit_target_split, jobs, features, labels, holdout_features,
+                               n_jobs=n_jobs, verbose=False, threshold_search=threshold_search,
+                               holdout_method=holdout_method, **fold_options)
+
+    # Merge the jobs by target, in split order
+    out_of_fold = np.zeros(labels.shape)
+    holdout_probs = np.zeros((holdout_features.shape[0], len(target_keys)))
+    rows = []
+    for fold in folds:
+        column, test_indices = fold['column'], fold['test_indices']
+        expected = labels[test_indices, column]
+        out_of_fold[test_indices, column] = fold['probs']
+        if holdout_method == "distributed":
+            holdout_probs[:, column] += fold['holdout_probs'] / len(splits)
+
+        row = {'target':target_keys[column], 'model':label,
+               'split_number':fold['split_number'],
+               'n_train':len(splits[fold['split_number'] - 1][0]), 'n_test':len(test_indices),
+               'positive_rate':expected.mean(), 'threshold':fold['threshold'],
+               'seconds':fold['seconds']}
+        row.update(_split_scores(fold, expected))
+        rows.append(row)
+
+    table = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    if results_path:
+        table.to_csv(results_path, index=False)
+
+    print("Batch of {} targets took {:0.3f} seconds ({:0.3f} seconds of fitting)\n"
+          .format(len(target_keys), time.time()-start, table['seconds'].sum()))
+    print(table.groupby('target', sort=False)[['auc', 'seconds']].mean())
+
+    return {'results':table,
+            'out_of_fold':pd.DataFrame(out_of_fold, columns=target_keys),
+            'holdout_probs':pd.DataFrame(holdout_probs, columns=target_keys),
+            'labels':pd.DataFrame(labels, columns=target_keys),
+            'known_rows':known}
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Timing and memory benchmarks for the pre-modeling set-up. Each benchmark runs
+the original implementation and its replacement on a synthetic ticker/date
+panel, checks that both produce the same values, and reports wall time and
+peak traced memory (tracemalloc) of each:
+
+    python benchmarks.py [n_tickers] [n_days]
+"""
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import targets
+from panel_index import PanelIndex
+
+N_TICKERS = 500
+N_DAYS = 2520
+
+
+def synthetic_target_panel(n_tickers=N_TICKERS, n_days=N_DAYS, seed=0):
+    """
+    Random-walk prices for n_tickers over n_days business days, with the
+    columns the target generator reads, sorted by ticker and date
+    """
+    rng = np.random.RandomState(seed)
+    dates = pd.bdate_range('2010-01-01', periods=n_days).strftime('%Y-%m-%d')
+    n_rows = n_tickers * n_days
+    returns = rng.normal(0.0003, 0.02, size=(n_tickers, n_days))
+    snp = 2000 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, size=n_days)))
+    return pd.DataFrame({
+        'ticker': np.repeat(['T{:04d}'.format(i) for i in range(n_tickers)], n_days),
+        'date_of_transaction': np.tile(dates, n_tickers),
+        'AdjClose': (50 * np.exp(np.cumsum(returns, axis=1))).ravel(),
+        'Monthly_Return_Rank': rng.randint(0, 500, size=n_rows).astype(float),
+        'SPY_Trailing_Month_Return': rng.normal(0.5, 4, size=n_rows),
+        'Pct_Change_Monthly': rng.normal(0.5, 6, size=n_rows),
+        'beta': rng.normal(1, 0.3, size=n_rows),
+        'snp500_close': np.tile(snp, n_tickers),
+    })
+
+
+def measure(func, *args):
+    """
+    Run func(*args) twice: once timed, once under tracemalloc (which slows it
+    down). Returns its result, wall seconds and peak traced MB
+    """
+    start = time.time()
+    result = func(*args)
+    seconds = time.time() - start
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def report(name, old, new):
+    (old_seconds, old_peak), (new_seconds, new_peak) = old, new
+    print("{}: {:0.3f}s -> {:0.3f}s ({:0.1f}x faster), peak memory {:0.1f}MB -> {:0.1f}MB"
+          .format(name, old_seconds, new_seconds, old_seconds / max(new_seconds, 1e-9),
+                  old_peak, new_peak))
+
+
+def benchmark_targets(target_gen):
+    """
+    Grouped-shift target loop vs the single-pass multi-horizon generator
+    """
+    old, old_seconds, old_peak = measure(targets.generate_targets_by_shift, target_gen)
+    new, new_seconds, new_peak = measure(
+        lambda df: targets.generate_targets(df, index=PanelIndex.from_frame(df)), target_gen)
+
+    assert sorted(old) == sorted(new)
+    for key in old:
+        assert np.allclose(np.asarray(old[key], dtype=float), np.asarray(new[key], dtype=float),
+                           rtol=1e-9, atol=1e-9, equal_nan=True), key
+
+    report("Multi-horizon targets", (old_seconds, old_peak), (new_seconds, new_peak))
+
+
+###############################
+# Main Method
+###############################
+if __name__ == '__main__':
+    n_tickers = int(sys.argv[1]) if len(sys.argv) > 1 else N_TICKERS
+    n_days = int(sys.argv[2]) if len(sys.argv) > 2 else N_DAYS
+    panel_df = synthetic_target_panel(n_tickers, n_days)
+    print("Benchmarking on a synthetic panel of {} tickers x {} days ({} rows)"
+          .format(n_tickers, n_days, panel_df.shape[0]))
+    benchmark_targets(panel_df)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Market beta computations
+
+Expanding (and optionally rolling-window) betas of each ticker's AdjClose
+against the S&P 500 close, computed from running sums rather than re-estimating
+np.cov/np.var on every prefix. All tickers are handled at once on a PanelIndex
+matrix with one column per ticker, aligned by each ticker's trading-day
+sequence, so the cost is O(n) per ticker.
+"""
+import numpy as np
+from panel_index import PanelIndex
+
+MIN_PERIODS = 21
+
+
+def _moment_sums(asset, market):
+    """
+    Inclusive running sums along axis 0 needed for covariance and variance;
+    each column is centered on its first observation first, which leaves
+    the moments unchanged but keeps the running sums well conditioned
+    """
+    x = market - market[0]
+    y = asset - asset[0]
+    return (np.cumsum(x, axis=0), np.cumsum(y, axis=0),
+            np.cumsum(x * x, axis=0), np.cumsum(x * y, axis=0))
+
+
+def beta_matrix(asset, market, min_periods=MIN_PERIODS, window=None):
+    """
+    Given (observations x tickers) matrices of asset and market closes, NaN
+    padded after each ticker's last observation, compute at observation i the
+    beta over observations [0, i-1) -- the sample covariance (ddof=1) over the
+    population variance of the market (ddof=0), as in the original per-ticker
+    loop. Rows before min_periods are NaN. With window, only the last `window`
+    observations of that prefix are used.
+    Returns a matrix of betas shaped like the inputs.
+    """
+    n_obs = asset.shape[0]
+    betas = np.full(asset.shape, np.nan)
+    if n_obs <= max(min_periods, 2):
+        return betas
+
+    sx, sy, sxx, sxy = _moment_sums(asset, market)
+
+    # Observation i uses the prefix ending at i-2 (inclusive), i.e. i-1 points
+    i = np.arange(min_periods, n_obs)
+    end = i - 2
+    count = (i - 1).astype(float)
+    moments = [s[end] for s in (sx, sy, sxx, sxy)]
+
+    if window is not None:
+        start = end - window
+        has_start = start >= 0
+        for m, s in zip(moments, (sx, sy, sxx, sxy)):
+            m[has_start] -= s[start[has_start]]
+        count = np.minimum(count, window)
+
+    count = count[:, None]
+    msx, msy, msxx, msxy = moments
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = (msxy - msx * msy / count) / (count - 1)
+        var = (msxx - msx * msx / count) / count
+        betas[min_periods:] = cov / var
+    return betas
+
+
+def compute_market_betas(df, snp, min_periods=MIN_PERIODS, window=None, index=None,
+                         price_var='AdjClose', market_var='snp500_close'):
+    """
+    Expanding (or rolling, given window) market beta for every row of the
+    ticker/date panel df (sorted by ticker and date), against the market close
+    in snp keyed by date_of_transaction. index is a PanelIndex of df to reuse.
+    Rows whose date has no market close get NaN and are left out of their
+    ticker's sequence. Returns an array aligned with the rows of df.
+    """
+    market = (snp[['date_of_transaction', market_var]]
+              .drop_duplicates('date_of_transaction')
+              .set_index('date_of_transaction')[market_var])
+    market_values = df['date_of_transaction'].map(market).values.astype(float)
+    has_market = ~np.isnan(market_values)
+
+    rows = np.flatnonzero(has_market)
+    if index is None or not has_market.all():
+        index = PanelIndex(df['ticker'].values[rows], df['date_of_transaction'].values[rows])
+
+    betas = np.full(df.shape[0], np.nan)
+    if len(rows):
+        asset = index.to_matrix(df[price_var].values[rows])
+        market_matrix = index.to_matrix(market_values[rows])
+        betas[rows] = index.from_matrix(beta_matrix(asset, market_matrix, min_periods, window))
+    return betas
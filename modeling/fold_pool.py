@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Process pool for cross-validation work
+
+Jobs are (job arguments) tuples run as func(features, targets, holdout_features,
+*job, **kwargs). The feature, target and holdout arrays are handed to each
+worker once through the pool initializer -- under fork they are inherited
+from the parent rather than pickled -- and results come back in job order, so
+callers can merge them exactly as a serial loop would. Each worker gets an
+equal share of the cores for its fits (see worker_params), so the workers'
+threaded estimators do not oversubscribe the CPU.
+"""
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Read-only arrays shared with the worker processes
+_SHARED = {}
+
+
+def _init_worker(features, targets, holdout_features, threads):
+    _SHARED['arrays'] = (features, targets, holdout_features)
+    _SHARED['threads'] = threads
+
+
+def _run_job(func, *args, **kwargs):
+    return func(*(_SHARED['arrays'] + args), **kwargs)
+
+
+def resolve_jobs(n_jobs):
+    """
+    Number of workers for n_jobs (-1 or None: all cores)
+    """
+    if n_jobs is None or n_jobs < 1:
+        return os.cpu_count() or 1
+    return n_jobs
+
+
+def worker_params(model, params):
+    """
+    params for model(**params): inside a pool worker, an estimator taking
+    n_jobs is limited to the worker's share of the cores unless params set
+    a thread count. Outside a pool params are returned as given
+    """
+    threads = _SHARED.get('threads')
+    if threads is None or 'n_jobs' in params or 'num_threads' in params:
+        return params
+    if 'n_jobs' not in model().get_params():
+        return params
+    return dict(params, n_jobs=threads)
+
+
+def run_jobs(func, jobs, features, targets, holdout_features=None, n_jobs=1, **kwargs):
+    """
+    Run func over every job, one after another or, with n_jobs > 1 (-1 for
+    all cores), on a process pool sharing the arrays read-only.
+    Returns the results in job order
+    """
+    jobs = list(jobs)
+    n_jobs = resolve_jobs(n_jobs)
+    if n_jobs == 1 or len(jobs) <= 1:
+        return [func(features, targets, holdout_features, *job, **kwargs) for job in jobs]
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    workers = min(n_jobs, len(jobs))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker,
+                             initargs=(features, targets, holdout_features, threads)) as executor:
+        futures = [executor.submit(_run_job, func, *job, **kwargs) for job in jobs]
+        return [future.result() for future in futures]
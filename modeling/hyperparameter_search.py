@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Hyperparameter search
+
+Grid or successive-halving search over a parameter grid on time-ordered
+validation splits. Under successive halving every candidate is first scored on
+the earliest (cheapest) min_splits splits, and only the best 1/factor move on
+to a factor times larger budget of splits, until one candidate is left or all
+splits are used. (candidate, split) fits run on the fold process pool.
+
+Every score is persisted to a results table (csv) keyed by (model, scoring,
+fit params, params, target, feature set, split scheme, split number), so a
+later session searching the same combination reads the score back rather than
+refitting.
+"""
+import os
+import json
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+from sklearn import metrics
+from sklearn.model_selection import ParameterGrid
+import fold_pool
+
+RESULTS_PATH = "param_search_results.csv"
+KEY_COLUMNS = ['model', 'scoring', 'fit_params', 'params', 'target', 'feature_set',
+               'split_scheme', 'split_number']
+RESULT_COLUMNS = KEY_COLUMNS + ['score', 'seconds']
+
+
+def _digest(data):
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def params_key(params):
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def callable_key(func):
+    """
+    Dotted name of a classifier class or scoring function
+    """
+    name = getattr(func, '__qualname__', None) or getattr(func, '__name__', None)
+    if name is None:
+        # e.g. a functools.partial or a scorer object
+        return repr(func)
+    return getattr(func, '__module__', '') + '.' + name
+
+
+def fit_params_key(fit_params):
+    """
+    Digest of the fit keyword arguments; arrays (e.g. sample weights) by value
+    """
+    items = [[name, target_key(value) if hasattr(value, 'shape') else value]
+             for name, value in sorted(fit_params.items())]
+    return _digest(json.dumps(items, default=str).encode('utf-8'))
+
+
+def feature_set_key(feature_names):
+    return _digest(json.dumps(list(feature_names)).encode('utf-8'))
+
+
+def target_key(targets):
+    """
+    Key for an unnamed target: a digest of its values
+    """
+    return 'sha1:' + _digest(np.ascontiguousarray(targets).tobytes())
+
+
+class SearchResults(object):
+    """
+    Persistent table of split scores; path None keeps it in memory only
+    """
+
+    def __init__(self, path=RESULTS_PATH):
+        self.path = path
+        self.scores = {}
+        if path and os.path.exists(path):
+            table = pd.read_csv(path, dtype=str, keep_default_na=False)
+            if list(table.columns) != RESULT_COLUMNS:
+                # A table from before the model, scoring and fit params were
+                # keyed: its rows can no longer be matched, keep them unkeyed
+                table = table.reindex(columns=RESULT_COLUMNS, fill_value='')
+                table.to_csv(path, index=False)
+            table['split_number'] = table['split_number'].astype(int)
+            table['score'] = pd.to_numeric(table['score'], errors='coerce')
+            for row in table.itertuples(index=False):
+                self.scores[tuple(getattr(row, col) for col in KEY_COLUMNS)] = row.score
+
+    def get(self, key):
+        return self.scores.get(key)
+
+    def add(self, rows):
+        """
+        Record rows of RESULT_COLUMNS values, appending them to the table
+        """
+        if not rows:
+            return
+        for row in rows:
+            self.scores[tuple(row[:len(KEY_COLUMNS)])] = row[len(KEY_COLUMNS)]
+        if self.path:
+            pd.DataFrame(rows, columns=RESULT_COLUMNS).to_csv(
+                self.path, mode='a', index=False, header=not os.path.exists(self.path))
+
+
+def _score_split(features, targets, _holdout, candidate, split_number, train_indices,
+                 test_indices, model, params, fit_params, scoring):
+    """
+    Fit one candidate on one split and score its validation probabilities
+    """
+    start = time.time()
+    estimator = model(**fold_pool.worker_params(model, params))
+    estimator.fit(features[train_indices], targets[train_indices], **fit_params)
+    probs = estimator.predict_proba(features[test_indices])[:, 1]
+    try:
+        score = scoring(targets[test_indices], probs)
+    except ValueError:
+        # e.g. AUC of a split holding a single class
+        score = np.nan
+    return candidate, split_number, score, time.time() - start
+
+
+def _split_budgets(n_splits, method, factor, min_splits):
+    if method == 'grid':
+        return [n_splits]
+    if method != 'halving':
+        raise ValueError("Unknown search method '{}'".format(method))
+    budgets = [min(max(min_splits, 1), n_splits)]
+    while budgets[-1] < n_splits:
+        budgets.append(min(budgets[-1] * factor, n_splits))
+    return budgets
+
+
+def search_params(model, param_grid, features, targets, splits, base_params=None,
+                  fit_params=None, method='grid', factor=3, min_splits=1, n_jobs=1,
+                  scoring=metrics.roc_auc_score, target='', feature_names=(),
+                  split_scheme='', results_path=RESULTS_PATH):
+    """
+    Search param_grid for model (a classifier class, built as
+    model(**base_params, **candidate)) over time-ordered (train, test) splits,
+    scoring validation probabilities with scoring(expected, probs).
+    method is 'grid' (every candidate on every split) or 'halving'
+    (successive halving over the splits, see module notes).
+    Returns the best candidate's parameters and a dataframe of every
+    candidate's mean score and number of splits evaluated
+    """
+    splits = [(np.asarray(train), np.asarray(test)) for train, test in splits]
+    base_params = base_params or {}
+    fit_params = fit_params or {}
+    candidates = list(ParameterGrid(param_grid))
+    merged = [dict(base_params, **candidate) for candidate in candidates]
+    keys = [params_key(params) for params in merged]
+    fit_context = (callable_key(model), callable_key(scoring), fit_params_key(fit_params))
+    context = (target, feature_set_key(feature_names), split_scheme)
+    results = SearchResults(results_path)
+
+    alive = list(range(len(candidates)))
+    budgets = _split_budgets(len(splits), method, factor, min_splits)
+    means = {}
+    for budget in budgets:
+        # Fit only the (candidate, split) pairs not already in the table
+        jobs = [(c, s + 1, splits[s][0], splits[s][1], model, merged[c])
+                for c in alive for s in range(budget)
+                if results.get(fit_context + (keys[c],) + context + (s + 1,)) is None]
+        print("Scoring {} candidates on {} splits ({} new fits)"
+              .format(len(alive), budget, len(jobs)))
+        fits = fold_pool.run_jobs(_score_split, jobs, features, targets,
+                                  n_jobs=n_jobs, fit_params=fit_params, scoring=scoring)
+        results.add([list(fit_context) + [keys[c]] + list(context) + [split_number, score, seconds]
+                     for c, split_number, score, seconds in fits])
+
+        for c in alive:
+            scores = np.array([results.get(fit_context + (keys[c],) + context + (s + 1,))
+                               for s in range(budget)], dtype=float)
+            means[c] = (np.nanmean(scores) if not np.isnan(scores).all() else -np.inf, budget)
+
+        if len(alive) == 1 or budget == budgets[-1]:
+            break
+        # Promote the best 1/factor; ties keep grid order
+        ranked = sorted(alive, key=lambda c: -means[c][0])
+        alive = sorted(ranked[:max(1, int(np.ceil(len(alive) / float(factor))))])
+
+    best = max(alive, key=lambda c: means[c][0])
+    table = pd.DataFrame({'params': [keys[c] for c in range(len(candidates))],
+                          'mean_score': [means[c][0] for c in range(len(candidates))],
+                          'n_splits': [means[c][1] for c in range(len(candidates))]})
+    table = table.sort_values(['n_splits', 'mean_score'], ascending=False).reset_index(drop=True)
+    return candidates[best], table
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-binned LightGBM datasets
+
+LightGBM bins every feature (max_bin) before it trains. The binned Dataset of a
+feature matrix is built once here, keyed by a hash of the matrix, the dataset
+parameters and the categorical columns, and kept both in memory and -- when a
+cache directory is given -- as a LightGBM binary file, so later folds, targets
+and sessions take row subsets of it instead of re-binning raw arrays. Labels,
+weights and initial scores are not part of the cache; callers set them on
+each subset.
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import lightgbm as lgb
+
+CACHE_DIR = "lgbm_cache"
+
+# Binned datasets built in this session, keyed by feature hash
+_DATASETS = {}
+
+
+def feature_hash(features, dataset_params=None, categorical_indices=None):
+    """
+    Digest of a feature matrix and everything that changes how it is binned
+    """
+    features = np.ascontiguousarray(features)
+    digest = hashlib.sha1()
+    digest.update(json.dumps([features.shape, str(features.dtype), dataset_params or {},
+                              list(categorical_indices or []), lgb.__version__],
+                             sort_keys=True).encode('utf-8'))
+    digest.update(features.tobytes())
+    return digest.hexdigest()
+
+
+def binned_dataset(features, dataset_params=None, categorical_indices=None, cache_dir=None):
+    """
+    The constructed (binned) lgb.Dataset of features: from this session's
+    cache, from <cache_dir>/<hash>.bin, or built and saved there
+    """
+    key = feature_hash(features, dataset_params, categorical_indices)
+    if key in _DATASETS:
+        return _DATASETS[key]
+
+    path = os.path.join(cache_dir, key + '.bin') if cache_dir else None
+    if path and os.path.exists(path):
+        print("Loading binned features from {}".format(path))
+        dataset = lgb.Dataset(path, params=dataset_params).construct()
+    else:
+        dataset = lgb.Dataset(features, params=dataset_params,
+                              categorical_feature=categorical_indices or 'auto',
+                              free_raw_data=True).construct()
+        if path:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            dataset.save_binary(path)
+
+    _DATASETS[key] = dataset
+    return dataset
+
+
+def clear():
+    """
+    Drop the datasets held in memory (files in cache directories are kept)
+    """
+    _DATASETS.clear()
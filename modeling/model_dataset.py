@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk model dataset
+
+A directory with one .npy file per feature column, per target and per sparse
+matrix component, plus a manifest.json describing them:
+
+    model_dataset/
+        manifest.json
+        features/<column>.npy
+        targets/<target>.npy
+        arrays/<name>.<component>.npy
+
+Numeric, boolean and datetime columns are stored as they are; text columns
+(ticker, dates stored as text) are stored as int32 codes with their
+categories kept in the manifest. Every file is opened with
+np.load(mmap_mode='r'), so a session only reads the columns and target it asks
+for, and worker processes mapping the same files share the page cache rather
+than each holding a private copy.
+"""
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+
+
+def _file_name(name):
+    return "".join(c if c.isalnum() or c in '-_.' else '_' for c in str(name))
+
+
+def _save_column(values, directory, name):
+    """
+    Save one column; returns its manifest entry
+    """
+    values = pd.Series(values)
+    stem, suffix = _file_name(name), 1
+    while os.path.exists(os.path.join(directory, stem + '.npy')):
+        stem, suffix = "{}_{}".format(_file_name(name), suffix), suffix + 1
+    entry = {'file': os.path.join(os.path.basename(directory), stem + '.npy')}
+    if values.dtype.kind in 'biufM':
+        array = values.values
+    else:
+        categorical = pd.Categorical(values)
+        array = categorical.codes.astype('int32')
+        entry['categories'] = [str(c) for c in categorical.categories]
+    entry['dtype'] = str(array.dtype)
+    np.save(os.path.join(directory, stem + '.npy'), array)
+    return entry
+
+
+def write_model_dataset(path, features, target_dict, arrays=None):
+    """
+    Write the features frame, each target in target_dict (arrays or lists
+    aligned with the rows of features) and any named scipy.sparse matrices in
+    arrays to a model dataset directory at path, replacing an existing one
+    """
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    for sub in ('features', 'targets', 'arrays'):
+        os.makedirs(os.path.join(path, sub))
+
+    manifest = {'version': FORMAT_VERSION, 'n_rows': int(features.shape[0]),
+                'features': {}, 'targets': {}, 'arrays': {}}
+    for col in features.columns:
+        manifest['features'][col] = _save_column(features[col], os.path.join(path, 'features'), col)
+    for key, values in target_dict.items():
+        values = np.asarray(values, dtype=float)
+        if values.shape[0] != features.shape[0]:
+            raise ValueError("Target {} has {} rows, features have {}"
+                             .format(key, values.shape[0], features.shape[0]))
+        manifest['targets'][key] = _save_column(values, os.path.join(path, 'targets'), key)
+
+    for key, matrix in (arrays or {}).items():
+        matrix = sparse.csr_matrix(matrix)
+        components = {}
+        for component in ('data', 'indices', 'indptr'):
+            file_name = os.path.join('arrays', _file_name(key) + '.' + component + '.npy')
+            np.save(os.path.join(path, file_name), getattr(matrix, component))
+            components[component] = file_name
+        manifest['arrays'][key] = {'format': 'csr', 'shape': list(matrix.shape),
+                                   'files': components}
+
+    with open(os.path.join(path, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+class ModelDataset(object):
+    """
+    Read side of a model dataset directory; nothing is loaded until asked for
+    """
+
+    def __init__(self, path, mmap_mode='r'):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.n_rows = self.manifest['n_rows']
+
+    @property
+    def feature_names(self):
+        return list(self.manifest['features'])
+
+    @property
+    def target_names(self):
+        return list(self.manifest['targets'])
+
+    def _load(self, entry, decode=True):
+        values = np.load(os.path.join(self.path, entry['file']), mmap_mode=self.mmap_mode)
+        if decode and 'categories' in entry:
+            return pd.Categorical.from_codes(values, entry['categories']).astype(str)
+        return values
+
+    def column(self, name, decode=True):
+        """
+        One feature column: a read-only memory map for numeric columns,
+        decoded values (or the raw int32 codes, with decode=False) for text
+        """
+        return self._load(self.manifest['features'][name], decode)
+
+    def target(self, name):
+        """
+        One target as a read-only memory map
+        """
+        return self._load(self.manifest['targets'][name])
+
+    def features(self, columns=None):
+        """
+        DataFrame of the chosen feature columns (all by default); only those
+        columns are read from disk
+        """
+        columns = self.feature_names if columns is None else list(columns)
+        return pd.DataFrame({col: np.asarray(self.column(col)) for col in columns},
+                            columns=columns)
+
+    def array(self, name):
+        """
+        A stored sparse matrix, its components memory-mapped
+        """
+        entry = self.manifest['arrays'][name]
+        data, indices, indptr = [np.load(os.path.join(self.path, entry['files'][c]),
+                                         mmap_mode=self.mmap_mode)
+                                 for c in ('data', 'indices', 'indptr')]
+        return sparse.csr_matrix((data, indices, indptr), shape=tuple(entry['shape']), copy=False)
+
+
+def open_model_dataset(path, mmap_mode='r'):
+    return ModelDataset(path, mmap_mode)
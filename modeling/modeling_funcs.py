@@ -14,6 +14,8 @@ import warnings
 import time
 import re
 import pickle
+import hashlib
+import inspect
 
 # Data structures
 import numpy as np
@@ -22,14 +24,21 @@ import pandas as pd
 # Model selection
 from sklearn.model_selection import KFold
 from sklearn.model_selection import TimeSeriesSplit
-from sklearn.model_selection import GridSearchCV
 
 # Evaluation
 from sklearn import metrics
 
+# Model dataset and parallel fold execution
+from model_dataset import open_model_dataset
+import fold_pool
+import smoothing
+import lgbm_cache
+import hyperparameter_search as hpsearch
+
 # Models
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.ensemble import GradientBoostingClassifier
+import lightgbm as lgb
 from lightgbm import LGBMClassifier
 
 warnings.filterwarnings('ignore')
@@ -44,15 +53,55 @@ def slugify(value):
     value = re.sub(r'[^\w\s-]', '', value).strip().lower()
     return re.sub(r'[-\s]+', '_', value)
 
-def prepare_model_structures(X, y, holdout, labeled=False, ema_gamma=1):
+CATEGORICAL_FEATURES = ['ticker_code']
+
+def load_model_data(path, features, target, index_columns=('ticker', 'date_of_transaction')):
+    """
+    Load only the chosen feature columns and target from a model dataset
+    directory written by pre_modeling_setup. The target is a read-only
+    memory map, so worker processes opening the same dataset share it.
+    Returns the features dataframe, the target, and a dataframe of the
+    index columns for grouping
+    """
+    dataset = open_model_dataset(path)
+    X = dataset.features(features)
+    y = dataset.target(target)
+    groups = dataset.features(index_columns)
+
+    return X, y, groups
+
+def smooth_targets(targets, gamma, groups=None):
+    """
+    EMA smoothing of a target array with a zero initial state, in one
+    filter pass (within ticker when groups, the ticker of each row, is
+    given). Returns an array of the targets' dtype; an integer target is
+    truncated elementwise as assigning into it in place would.
+    """
+    targets = np.asarray(targets)
+    if gamma == 1:
+        return targets.copy()
+    smoothed = smoothing.smooth_series(targets, gamma, groups)
+
+    return smoothed.astype(targets.dtype) if targets.dtype.kind in 'biu' else smoothed
+
+def prepare_model_structures(X, y, holdout, labeled=False, ema_gamma=1,
+                             categorical_features=CATEGORICAL_FEATURES,
+                             smoothing_groups=None):
     """
     Given a dataframe of features, a target array, and
     holdout test set; label and smooth if necessary.
+    Smoothing runs within ticker when smoothing_groups
+    (the ticker of each row) is given.
+    Integer-coded categoricals (e.g. ticker_code) listed in
+    categorical_features are kept as single code columns
+    and their positions returned for native handling.
     Returns a tuple of prepared structures for modeling
     """
 
     # Convert to NumPy arrays - store feature names
     feature_names = X.columns.tolist()
+    categorical_indices = [feature_names.index(c) for c in categorical_features
+                           if c in feature_names]
     features = np.array(X)
     holdout_features = np.array(holdout)
     targets = y.copy()
@@ -62,11 +111,7 @@ def prepare_model_structures(X, y, holdout, labeled=False, ema_gamma=1):
         orig_targets = targets.copy()
     else:
         # Compute ema smoothing of target prior to constructing classes
-        ema = 0
-        gamma_ = ema_gamma
-        for t_i, _ in enumerate(targets):
-            ema = gamma_*targets[t_i] + (1-gamma_)*ema
-            targets[t_i] = ema
+        targets = smooth_targets(targets, ema_gamma, smoothing_groups)
 
         targets_smoothed = np.array(np.where(targets > 0, 1, 0), dtype='int')
         orig_targets = np.array(np.where(y.copy() > 0, 1, 0), dtype='int')
@@ -87,7 +132,7 @@ def prepare_model_structures(X, y, holdout, labeled=False, ema_gamma=1):
     return (features, feature_names, feature_importance_values, \
             holdout_features, test_predictions, out_of_fold, \
             targets_smoothed, thresholds, predicted_out_of_fold, \
-            split_nums)
+            split_nums, categorical_indices)
 
 def benchmark_target(target, groups, grouping_var='ticker'):
     """
@@ -129,69 +174,64 @@ def benchmark_target(target, groups, grouping_var='ticker'):
     print(metrics.classification_report(target_rw, rw_class))
     print("="*79)
 
-def panel_split(n_folds, groups, grouping_var='date_of_transaction'):
+def date_order(groups, grouping_var='date_of_transaction'):
+    """
+    Index the rows of a panel by date once: a date-sorted permutation of
+    the rows, and the bounds (from searchsorted) of each date's block in it.
+    Returns the permutation, the bounds, and the number of distinct dates
+    """
+    positions, dates = pd.factorize(groups[grouping_var], sort=True)
+    order = np.argsort(positions, kind='stable')
+    bounds = np.searchsorted(positions[order], np.arange(len(dates) + 1))
+
+    return order, bounds, len(dates)
+
+def date_range_rows(order, bounds, start, end, ordered=True):
+    """
+    Rows dated within date positions [start, end): a slice of the
+    date-sorted permutation, put back in row order if ordered.
+    """
+    rows = order[bounds[start]:bounds[end]]
+
+    return np.sort(rows) if ordered else rows
+
+def panel_split(n_folds, groups, grouping_var='date_of_transaction', ordered=True):
     """
     Function to generate time series splits of a panel, provided
     a number of folds, and an indexable dataframe to create groups.
+    Folds are formed over the panel's dates and yielded as arrays of row
+    positions, in row order (or, if not ordered, as zero-copy views in
+    date order).
     Returns a generator object for compliance with sci-kit learn API.
     """
-    date_idx = (groups[[grouping_var]]
-                .drop_duplicates()
-                .sort_values(grouping_var)
-                .reset_index()
-                .rename({'index':'tsidx'}, axis=1))
-
-    by_ticker_index = groups.reset_index().rename({'index':'panel_index'}, axis=1)
-    by_ticker_index = (pd.merge(by_ticker_index, date_idx, on=grouping_var)
-                       .sort_values('panel_index')
-                       .set_index('panel_index'))
-
-    ticker_range = sorted(by_ticker_index['tsidx'].unique().tolist())
+    order, bounds, n_dates = date_order(groups, grouping_var)
 
     splits = TimeSeriesSplit(n_splits=n_folds)
 
-    for train_indices, test_indices in splits.split(ticker_range):
-        panel_train_indices = (by_ticker_index[by_ticker_index['tsidx'].isin(train_indices)]
-                               .index
-                               .tolist())
-        panel_test_indices = (by_ticker_index[by_ticker_index['tsidx'].isin(test_indices)]
-                              .index
-                              .tolist())
-        yield panel_train_indices, panel_test_indices
+    for train_dates, test_dates in splits.split(np.arange(n_dates)):
+        yield (date_range_rows(order, bounds, train_dates[0], train_dates[-1] + 1, ordered),
+               date_range_rows(order, bounds, test_dates[0], test_dates[-1] + 1, ordered))
 
 def n_day_ahead_split(indexer, train=252, test=63, window=False,
-                      grouping_var='date_of_transaction'):
+                      grouping_var='date_of_transaction', ordered=True):
     """
     Function to generate time series splits of a panel or time series, provided
     a dedicated minimum for the training sample and a dedicated testing window.
     Default is to use a minimum of a year's worth of data with the month ahead
     horizon for testing consistent with most constructed targets.
+    Panel folds are yielded as arrays of row positions, as in panel_split.
     Returns a generator object for compliance with sci-kit learn API.
     """
     if isinstance(indexer, pd.DataFrame):
-        date_idx = (indexer[[grouping_var]]
-                    .drop_duplicates()
-                    .sort_values(grouping_var)
-                    .reset_index()
-                    .rename({'index':'tsidx'}, axis=1))
-
-        by_ticker_index = indexer.reset_index().rename({'index':'panel_index'}, axis=1)
-        by_ticker_index = (pd.merge(by_ticker_index, date_idx, on=grouping_var)
-                           .sort_values('panel_index')
-                           .set_index('panel_index'))
-
-        ticker_range = sorted(by_ticker_index['tsidx'].unique().tolist())
-        buffer = max(ticker_range) % test
+        order, bounds, n_dates = date_order(indexer, grouping_var)
+        last_date = n_dates - 1
 
+        buffer = last_date % test
         end = train + buffer
         start = 0
-        while end < max(ticker_range):
-            train_indices = (by_ticker_index[by_ticker_index['tsidx'].isin(np.arange(start, end))]
-                             .index.tolist())
-            test_indices = (by_ticker_index[by_ticker_index['tsidx']
-                                            .isin(np.arange(end, (end+test)))]
-                            .index
-                            .tolist())
+        while end < last_date:
+            train_indices = date_range_rows(order, bounds, start, end, ordered)
+            test_indices = date_range_rows(order, bounds, end, min(end + test, n_dates), ordered)
 
             end += test
             if window:
@@ -204,80 +244,442 @@ def n_day_ahead_split(indexer, train=252, test=63, window=False,
         end = train + buffer
         start = 0
         while end < indexer:
-            train_indices = np.arange(start, end).tolist()
-            test_indices = np.arange(end, (end+test)).tolist()
+            train_indices = np.arange(start, end)
+            test_indices = np.arange(end, (end+test))
             end += test
             if window:
                 start += test
 
             yield train_indices, test_indices
 
+# Split plans already built, keyed by method, folds and panel dates
+_SPLIT_CACHE = {}
+SPLIT_CACHE_SIZE = 8
+
+def _split_cache_key(X, n_splits, groups, cv_method, grouping_var='date_of_transaction'):
+    key = (cv_method, n_splits, X.shape[0])
+    if cv_method.startswith('panel'):
+        dates = pd.util.hash_pandas_object(groups[grouping_var], index=False).values
+        key += (hashlib.sha1(dates.tobytes()).hexdigest(),)
+    return key
+
 def instantiate_splits(X, n_splits, groups, cv_method='ts'):
     """
-    Create one of several cross-validation split generator objects based on
-    specified validation method.
-    Returns two sets of splits for use in training and GridSearchCV.
+    Create one of several cross-validation split plans based on specified
+    validation method. Each plan is computed once as a list of (train, test)
+    index arrays and cached, so training, parameter search and later fits on
+    the same panel reuse it.
+    Returns two references to the plan for use in training and the search.
     """
+    key = _split_cache_key(X, n_splits, groups, cv_method)
+    if key in _SPLIT_CACHE:
+        splits = _SPLIT_CACHE[key]
+        return splits, splits
 
     if cv_method == "panel":
         splits = panel_split(n_folds=n_splits, groups=groups)
-        search_splits = panel_split(n_folds=n_splits, groups=groups)
     elif cv_method == "ts":
         splits = TimeSeriesSplit(n_splits=n_splits).split(X)
-        search_splits = TimeSeriesSplit(n_splits=n_splits).split(X)
     elif cv_method == "kfold":
         splits = KFold(n_splits=n_splits).split(X)
-        search_splits = KFold(n_splits=n_splits).split(X)
     elif cv_method == "tsrecur":
         splits = n_day_ahead_split(X.shape[0], window=False)
-        search_splits = n_day_ahead_split(X.shape[0], window=False)
     elif cv_method == "panelrecur":
         splits = n_day_ahead_split(indexer=groups, window=False)
-        search_splits = n_day_ahead_split(indexer=groups, window=False)
     elif cv_method == "tswindow":
         splits = n_day_ahead_split(X.shape[0], window=True)
-        search_splits = n_day_ahead_split(X.shape[0], window=True)
     elif cv_method == "panelwindow":
         splits = n_day_ahead_split(indexer=groups, window=True)
-        search_splits = n_day_ahead_split(indexer=groups, window=True)
 
-    return splits, search_splits
+    splits = list(splits)
+    if len(_SPLIT_CACHE) >= SPLIT_CACHE_SIZE:
+        _SPLIT_CACHE.clear()
+    _SPLIT_CACHE[key] = splits
+
+    return splits, splits
+
+def _safe_divide(numerator, denominator):
+    """
+    Elementwise ratio, 0 where the denominator is 0 (as sci-kit learn's
+    zero_division default)
+    """
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    ratio = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator, denominator, out=ratio, where=denominator > 0)
+    return ratio
+
+# Confusion-matrix metrics of (tp, fp, fn, tn) count arrays
+CONFUSION_METRICS = {
+    'precision': lambda tp, fp, fn, tn: _safe_divide(tp, tp + fp),
+    'recall': lambda tp, fp, fn, tn: _safe_divide(tp, tp + fn),
+    'f1': lambda tp, fp, fn, tn: _safe_divide(2*tp, 2*tp + fp + fn),
+    'accuracy': lambda tp, fp, fn, tn: _safe_divide(tp + tn, tp + fp + fn + tn),
+    'specificity': lambda tp, fp, fn, tn: _safe_divide(tn, tn + fp),
+    # Mean recall over the classes present in expected
+    'balanced_accuracy': lambda tp, fp, fn, tn: _safe_divide(_safe_divide(tp, tp + fn) + _safe_divide(tn, tn + fp),
+                                                             (tp + fn > 0).astype(int) + (tn + fp > 0)),
+    'mcc': lambda tp, fp, fn, tn: _safe_divide(tp*tn - fp*fn,
+                                               np.sqrt((tp + fp)*(tp + fn)*(tn + fp)*(tn + fn))),
+}
+
+# sci-kit learn scorers with a vectorized equivalent above
+SKLEARN_METRICS = {
+    metrics.precision_score: 'precision',
+    metrics.recall_score: 'recall',
+    metrics.f1_score: 'f1',
+    metrics.accuracy_score: 'accuracy',
+    metrics.balanced_accuracy_score: 'balanced_accuracy',
+    metrics.matthews_corrcoef: 'mcc',
+}
+
+def _is_counts_metric(metric):
+    """
+    True for a function of the (tp, fp, fn, tn) count arrays, i.e. one
+    with four required positional arguments, rather than a (y_true, y_pred)
+    sci-kit learn scorer
+    """
+    try:
+        parameters = inspect.signature(metric).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    required = [p for p in parameters
+                if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) and p.default is p.empty]
+    return len(required) == 4
+
+def threshold_confusion_counts(predicted, expected, thresholds):
+    """
+    Confusion-matrix counts of the rule predicted >= t, for every threshold
+    t at once: one sort of the predicted probabilities, cumulative counts of
+    positives along it, and a searchsorted of the thresholds.
+    Returns arrays of true positives, false positives, false negatives and
+    true negatives aligned with thresholds
+    """
+    predicted = np.asarray(predicted, dtype=float)
+    positive = np.asarray(expected) == 1
+
+    order = np.argsort(predicted, kind='mergesort')
+    positives_below = np.r_[0, np.cumsum(positive[order])]
+
+    # Number of predictions below each threshold, and positives among them
+    below = np.searchsorted(predicted[order], np.asarray(thresholds, dtype=float), side='left')
+    fn = positives_below[below]
+    tn = below - fn
+    tp = positives_below[-1] - fn
+    fp = (len(predicted) - below) - tp
+
+    return tp, fp, fn, tn
 
 def discrimination_threshold_search(predicted, expected, search_min=0.25, search_max=0.75,
-                                    metric=metrics.precision_score):
+                                    metric=metrics.precision_score, thresholds=None):
     """
     Search over a specified range of discrimination
-    thresholds and maximize relative to a specified metric.
+    thresholds (or an explicit grid of thresholds) and
+    maximize relative to a specified metric: a name in
+    CONFUSION_METRICS, a function of (tp, fp, fn, tn) count
+    arrays, or a sci-kit learn (y_true, y_pred) scorer.
+    Count metrics (including the sci-kit learn scorers in
+    SKLEARN_METRICS) are scored for every threshold at once;
+    any other scorer is called on each threshold's labels.
     Returns the optimum threshold
     """
 
-    thresholds = list(np.arange(search_min, search_max, 0.05))
-    preds = [[1 if y >= t else 0 for y in predicted] for t in thresholds]
-    scores_by_threshold = [metric(expected, p) for p in preds]
-    optimum = thresholds[scores_by_threshold.index(max(scores_by_threshold))]
+    if thresholds is None:
+        thresholds = np.arange(search_min, search_max, 0.05)
+    thresholds = np.asarray(thresholds, dtype=float)
+
+    metric = SKLEARN_METRICS.get(metric, metric)
+    if not callable(metric):
+        metric = CONFUSION_METRICS[metric]
+
+    if _is_counts_metric(metric):
+        counts = threshold_confusion_counts(predicted, expected, thresholds)
+        scores_by_threshold = metric(*counts)
+    else:
+        predicted = np.asarray(predicted)
+        scores_by_threshold = [metric(expected, (predicted >= t).astype('int'))
+                               for t in thresholds]
+    optimum = thresholds[np.argmax(scores_by_threshold)]
 
     return optimum
 
+def run_folds(fold_func, splits, features, targets, holdout_features, fold_jobs=1, **kwargs):
+    """
+    Run fold_func(features, targets, holdout_features, split_number,
+    train_indices, test_indices, **kwargs) over every split, one after
+    another or, with fold_jobs > 1 (-1 for all cores), on a process pool
+    sharing the arrays read-only.
+    Returns the fold results in split order
+    """
+    jobs = [(split_number, np.asarray(train_indices), np.asarray(test_indices))
+            for split_number, (train_indices, test_indices) in enumerate(splits, 1)]
+    return fold_pool.run_jobs(fold_func, jobs, features, targets, holdout_features,
+                              n_jobs=fold_jobs, **kwargs)
+
+def _fit_sklearn_fold(features, targets_smoothed, holdout_features, split_number,
+                      train_indices, test_indices, model, params, verbose=True,
+                      smooth_train_targets=False, ema_gamma_train=1,
+                      smoothing_groups=None, threshold_search=False,
+                      holdout_method="distributed"):
+    """
+    Train and evaluate a sci-kit learn classifier on one validation split.
+    Returns a dictionary of the split's predictions, scores and importances
+    """
+    if verbose:
+        print("Training model on validation split #{}".format(split_number))
+
+    # Train/test split
+    train_features, train_targets = features[train_indices], targets_smoothed[train_indices]
+    test_features, expected = features[test_indices], targets_smoothed[test_indices]
+
+    if smooth_train_targets:
+        train_groups = None if smoothing_groups is None else smoothing_groups[train_indices]
+        train_targets = smooth_targets(train_targets, ema_gamma_train, train_groups)
+
+    # Train the estimator; fit and store
+    estimator = model(**fold_pool.worker_params(model, params))
+    estimator.fit(train_features, train_targets)
+    probs = estimator.predict_proba(test_features)[:, 1]
+
+    # Dynamic classification threshold selection
+    if threshold_search:
+        opt_threshold = discrimination_threshold_search(probs, expected)
+    else:
+        opt_threshold = 0.5
+
+    # Make predictions
+    holdout_probs = None
+    if holdout_method == "distributed":
+        holdout_probs = estimator.predict_proba(holdout_features)[:, 1]
+
+    predicted = (probs >= opt_threshold).astype('int')
+
+    # Scores and variable importances
+    scores = {'precision':metrics.precision_score(expected, predicted, average="weighted"),
+              'recall':metrics.recall_score(expected, predicted, average="weighted"),
+              'accuracy':metrics.accuracy_score(expected, predicted),
+              'f1':metrics.f1_score(expected, predicted, average="weighted")}
+
+    importances = None
+    if model in [RandomForestClassifier, GradientBoostingClassifier]:
+        importances = estimator.feature_importances_
+
+    return {'split_number':split_number, 'test_indices':test_indices, 'probs':probs,
+            'threshold':opt_threshold, 'predicted':predicted,
+            'holdout_probs':holdout_probs, 'scores':scores, 'importances':importances}
+
+# LightGBM model used when no parameters are searched
+LGBM_DEFAULT_PARAMS = {'n_estimators':10000, 'objective':'binary',
+                       'class_weight':'balanced', 'learning_rate':0.1,
+                       'max_bin':25, 'num_leaves':25,
+                       'max_depth':2,
+                       'reg_alpha':0.1, 'reg_lambda':0.1,
+                       'subsample':0.8}
+
+# Dataset construction parameters, fixed once the data are binned
+LGBM_DATASET_PARAMS = ['max_bin', 'min_data_in_bin', 'bin_construct_sample_cnt']
+
+def _fit_lgbm_fold(features, targets_smoothed, holdout_features, split_number,
+                   train_indices, test_indices, params=None, categorical_indices=None,
+                   verbose=True, smooth_train_targets=False, ema_gamma_train=1,
+                   smoothing_groups=None, threshold_search=False,
+                   holdout_method="distributed"):
+    """
+    Train and evaluate a LightGBM classifier on one validation split.
+    Returns a dictionary of the split's predictions, scores and importances
+    """
+    if verbose:
+        print("Training model on validation split #{}".format(split_number))
+
+    # Train/test split
+    train_features, train_targets = features[train_indices], targets_smoothed[train_indices]
+    test_features, expected = features[test_indices], targets_smoothed[test_indices]
+
+    if smooth_train_targets:
+        train_groups = None if smoothing_groups is None else smoothing_groups[train_indices]
+        train_targets = smooth_targets(train_targets, ema_gamma_train, train_groups)
+
+    # Generate a bst model given the optimal parameters established in grid search
+    bst = LGBMClassifier(**fold_pool.worker_params(LGBMClassifier, params or LGBM_DEFAULT_PARAMS))
+
+    # Train the bst
+    bst.fit(train_features, train_targets, eval_metric=['auc'],
+            eval_set=[(test_features, expected), (train_features, train_targets)],
+            eval_names=['test', 'train'],
+            callbacks=[lgb.early_stopping(100, verbose=False)],
+            categorical_feature=categorical_indices or 'auto')
+
+    # Record the best iteration
+    best_iteration = bst.best_iteration_
+
+    # Make predictions
+    holdout_probs = None
+    if holdout_method == "distributed":
+        holdout_probs = bst.predict_proba(holdout_features, num_iteration=best_iteration)[:, 1]
+
+    probs = bst.predict_proba(test_features, num_iteration=best_iteration)[:, 1]
+
+    # Dynamic classification threshold selection
+    if threshold_search:
+        opt_threshold = discrimination_threshold_search(probs, expected)
+    else:
+        opt_threshold = 0.5
+
+    predicted = (probs >= opt_threshold).astype('int')
+
+    return {'split_number':split_number, 'test_indices':test_indices, 'probs':probs,
+            'threshold':opt_threshold, 'predicted':predicted,
+            'holdout_probs':holdout_probs, 'importances':bst.feature_importances_,
+            'test_score':bst.best_score_['test']['auc'],
+            'train_score':bst.best_score_['train']['auc']}
+
+def _native_lgbm_params(params):
+    """
+    Translate LGBMClassifier parameters for lgb.train.
+    Returns the booster parameters, the maximum number
+    of boosting rounds, and whether classes are balanced.
+    Early stopping watches the same metrics as
+    LGBMClassifier.fit(eval_metric='auc'): the objective's
+    binary_logloss and auc
+    """
+    params = dict(params)
+    num_rounds = params.pop('n_estimators', 100)
+    balanced = params.pop('class_weight', None) == 'balanced'
+    params.setdefault('objective', 'binary')
+    params['metric'] = ['binary_logloss', 'auc']
+    params.setdefault('verbose', -1)
+
+    return params, num_rounds, balanced
+
+def _fit_lgbm_binned(panel, features, targets_smoothed, holdout_features, splits,
+                     walk_forward=False, params=None, categorical_indices=None,
+                     verbose=True, smooth_train_targets=False, ema_gamma_train=1,
+                     smoothing_groups=None, threshold_search=False,
+                     holdout_method="distributed", early_stopping_rounds=100):
+    """
+    LightGBM training over the splits on row subsets of panel, the
+    features binned once into a LightGBM Dataset (see lgbm_cache).
+    With walk_forward (expanding, time-ordered splits) each split
+    continues boosting from the model so far rather than retraining
+    from scratch. Continuation works as init_model does -- the model
+    so far enters as each row's initial score -- but the running raw
+    scores of every row are kept up to date one split's new trees at
+    a time, instead of re-predicting the whole model each split.
+    Returns the per-split dictionaries of _fit_lgbm_fold
+    """
+    booster_params, num_rounds, balanced = _native_lgbm_params(params or LGBM_DEFAULT_PARAMS)
+
+    # Raw scores of the model so far, for every panel and holdout row
+    raw_scores = np.zeros(features.shape[0])
+    holdout_raw_scores = np.zeros(holdout_features.shape[0])
+
+    folds = []
+    for split_number, (train_indices, test_indices) in enumerate(splits, 1):
+        if verbose:
+            print("Training model on validation split #{}".format(split_number))
+
+        train_indices, test_indices = np.asarray(train_indices), np.asarray(test_indices)
+        train_targets = targets_smoothed[train_indices]
+        expected = targets_smoothed[test_indices]
+        if smooth_train_targets:
+            train_groups = None if smoothing_groups is None else smoothing_groups[train_indices]
+            train_targets = smooth_targets(train_targets, ema_gamma_train, train_groups)
+
+        # Subsets share the panel's bins; their fields are set once constructed
+        train_set = panel.subset(train_indices).construct()
+        test_set = panel.subset(test_indices).construct()
+        train_set.set_label(train_targets)
+        test_set.set_label(expected)
+        if walk_forward and split_number > 1:
+            train_set.set_init_score(raw_scores[train_indices])
+            test_set.set_init_score(raw_scores[test_indices])
+        if balanced:
+            # As class_weight='balanced': n_samples / (n_classes * class count)
+            classes, class_index, counts = np.unique(train_targets, return_inverse=True,
+                                                     return_counts=True)
+            train_set.set_weight(len(train_targets) / (len(classes) * counts[class_index]))
+
+        booster = lgb.train(booster_params, train_set, num_boost_round=num_rounds,
+                            valid_sets=[test_set, train_set], valid_names=['test', 'train'],
+                            callbacks=[lgb.early_stopping(early_stopping_rounds, verbose=False)])
+        best_iteration = booster.best_iteration
+
+        if walk_forward:
+            # Add this split's trees (up to the best iteration) to the running scores
+            raw_scores += booster.predict(features, num_iteration=best_iteration,
+                                          raw_score=True)
+            holdout_raw_scores += booster.predict(holdout_features,
+                                                  num_iteration=best_iteration, raw_score=True)
+        else:
+            raw_scores[test_indices] = booster.predict(features[test_indices],
+                                                       num_iteration=best_iteration,
+                                                       raw_score=True)
+            if holdout_method == "distributed":
+                holdout_raw_scores = booster.predict(holdout_features,
+                                                     num_iteration=best_iteration,
+                                                     raw_score=True)
+
+        # Importance of this split's trees only; earlier splits' trees are
+        # counted by their own folds
+        importances = booster.feature_importance(iteration=best_iteration)
+
+        # Make predictions
+        holdout_probs = None
+        if holdout_method == "distributed":
+            holdout_probs = 1 / (1 + np.exp(-holdout_raw_scores))
+
+        probs = 1 / (1 + np.exp(-raw_scores[test_indices]))
+
+        # Dynamic classification threshold selection
+        if threshold_search:
+            opt_threshold = discrimination_threshold_search(probs, expected)
+        else:
+            opt_threshold = 0.5
+
+        predicted = (probs >= opt_threshold).astype('int')
+
+        folds.append({'split_number':split_number, 'test_indices':test_indices, 'probs':probs,
+                      'threshold':opt_threshold, 'predicted':predicted,
+                      'holdout_probs':holdout_probs, 'importances':importances,
+                      'best_iteration':best_iteration,
+                      'test_score':booster.best_score['test']['auc'],
+                      'train_score':booster.best_score['train']['auc']})
+
+    return folds
+
 def fit_sklearn_classifier(X, y, holdout, ticker, ema_gamma, n_splits, model, label,
                            param_search=None, cv_method="ts", labeled=False,
                            groups=pd.DataFrame(), threshold_search=False,
                            smooth_train_targets=False, ema_gamma_train=1,
                            benchmarks=False, holdout_method="distributed",
-                           export=False, **kwargs):
+                           export=False, fold_jobs=1, search_method="grid",
+                           search_jobs=1, search_results=hpsearch.RESULTS_PATH,
+                           target_name="", smooth_by_ticker=False, **kwargs):
     """
     Flexible function for fitting any number of sci-kit learn
-    classifiers, with optional grid search.
+    classifiers, with optional grid search. With fold_jobs > 1
+    (-1 for all cores) the validation splits are fit in parallel
+    worker processes; results match the serial fit. The search is
+    'grid' or successive 'halving' over the splits, run on search_jobs
+    workers, with scores kept in the search_results table. Target
+    smoothing runs within ticker (groups['ticker']) if smooth_by_ticker.
     """
 
     start = time.time()
     if ('recur' or 'window') in cv_method:
         n_splits = 1
 
+    # Smooth targets within ticker, rather than across ticker boundaries
+    smoothing_groups = None
+    if smooth_by_ticker and not groups.empty:
+        smoothing_groups = np.asarray(groups['ticker'])
+
     # Prepare modeling structures - unpack
     features, feature_names, feature_importance_values, holdout_features, \
     test_predictions, out_of_fold, targets_smoothed, \
-    thresholds, predicted_out_of_fold, split_nums = \
-    prepare_model_structures(X, y, holdout, labeled, ema_gamma)
+    thresholds, predicted_out_of_fold, split_nums, categorical_indices = \
+    prepare_model_structures(X, y, holdout, labeled, ema_gamma,
+                             smoothing_groups=smoothing_groups)
 
     # Compute some baselines
     if benchmarks:
@@ -289,72 +691,47 @@ def fit_sklearn_classifier(X, y, holdout, ticker, ema_gamma, n_splits, model, la
     # Dictionary of lists for recording validation and training scores
     scores = {'precision':[], 'recall':[], 'accuracy':[], 'f1':[]}
 
-    # Perform a grid-search on the provided parameters to determine best options
+    # Search the provided parameters to determine best options
     if param_search:
-        print("Performing grid search for hyperparameter tuning")
-        gsearch = GridSearchCV(estimator=model(**kwargs),
-                               cv=search_splits,
-                               param_grid=param_search)
+        print("Performing {} search for hyperparameter tuning".format(search_method))
+        best_params, search_table = hpsearch.search_params(
+            model, param_search, features, targets_smoothed, search_splits,
+            base_params=kwargs, method=search_method, n_jobs=search_jobs,
+            target=target_name or hpsearch.target_key(targets_smoothed),
+            feature_names=feature_names, split_scheme="{}_{}".format(cv_method, n_splits),
+            results_path=search_results)
+
+    # Fit each validation split, serially or on a process pool
+    params = best_params if param_search else kwargs
+    folds = run_folds(_fit_sklearn_fold, splits, features, targets_smoothed,
+                      holdout_features, fold_jobs=fold_jobs, model=model, params=params,
+                      verbose=('recur' or 'window') not in cv_method,
+                      smooth_train_targets=smooth_train_targets,
+                      ema_gamma_train=ema_gamma_train, smoothing_groups=smoothing_groups,
+                      threshold_search=threshold_search,
+                      holdout_method=holdout_method)
+
+    # Merge the splits in order
+    for fold in folds:
+        test_indices = fold['test_indices']
+        out_of_fold[test_indices] = fold['probs']
+        split_nums[test_indices] = fold['split_number']
+        thresholds[test_indices] = fold['threshold']
+        predicted_out_of_fold[test_indices] = fold['predicted']
 
-        # Fit to extract best parameters later
-        gsearch_model = gsearch.fit(features, targets_smoothed)
-
-    split_counter = 1
-    for train_indices, test_indices in splits:
-        if ('recur' or 'window') not in cv_method:
-            print("Training model on validation split #{}".format(split_counter))
-
-        # Train/test split
-        train_features, train_targets = features[train_indices], targets_smoothed[train_indices]
-        test_features, expected = features[test_indices], targets_smoothed[test_indices]
-
-        if smooth_train_targets:
-            ema = 0
-            gamma_ = ema_gamma_train
-            for t_i, _ in enumerate(train_targets):
-                ema = gamma_*train_targets[t_i] + (1-gamma_)*ema
-                train_targets[t_i] = ema
-
-        # Generate a model given the optimal parameters established in grid search
-        if param_search:
-            estimator = model(**gsearch_model.best_params_)
-        else:
-            estimator = model(**kwargs)
-
-        # Train the estimator; fit and store
-        estimator.fit(train_features, train_targets)
-        probs = [p[1] for p in estimator.predict_proba(test_features)]
-        out_of_fold[test_indices] = probs
-        split_nums[test_indices] = split_counter
-
-        # Dynamic classification threshold selection
-        if threshold_search:
-            opt_threshold = discrimination_threshold_search(probs, expected)
-            thresholds[test_indices] = opt_threshold
-        else:
-            opt_threshold = 0.5
-            thresholds[test_indices] = opt_threshold
-
-        # Make predictions
         if holdout_method == "distributed":
-            holdout_probs = np.array([p[1] for p in estimator.predict_proba(holdout_features)])
-            test_predictions += holdout_probs / n_splits
-
-        predicted = [1 if y >= opt_threshold else 0 for y in probs]
-        predicted_out_of_fold[test_indices] = predicted
+            test_predictions += fold['holdout_probs'] / n_splits
 
         # Append scores to the tracker
-        scores['precision'].append(metrics.precision_score(expected, predicted, average="weighted"))
-        scores['recall'].append(metrics.recall_score(expected, predicted, average="weighted"))
-        scores['accuracy'].append(metrics.accuracy_score(expected, predicted))
-        scores['f1'].append(metrics.f1_score(expected, predicted, average="weighted"))
+        for key in scores:
+            scores[key].append(fold['scores'][key])
 
         # Store variable importances
-        if model in [RandomForestClassifier, GradientBoostingClassifier]:
-            feature_importance_values += estimator.feature_importances_ / n_splits
+        if fold['importances'] is not None:
+            feature_importance_values += fold['importances'] / n_splits
 
-        # Iterate counter
-        split_counter += 1
+    probs = folds[-1]['probs'] if folds else []
+    split_counter = len(folds) + 1
 
     # Adjust distributed metrics
     if ('recur' or 'window') in cv_method:
@@ -368,18 +745,18 @@ def fit_sklearn_classifier(X, y, holdout, ticker, ema_gamma, n_splits, model, la
     # Fit on full sample
     if holdout_method == "full":
         if param_search:
-            estimator = model(**gsearch_model.best_params_)
+            estimator = model(**best_params)
         else:
             estimator = model(**kwargs)
 
         estimator.fit(features, targets_smoothed)
-        holdout_probs = np.array([p[1] for p in estimator.predict_proba(holdout_features)])
+        holdout_probs = estimator.predict_proba(holdout_features)[:, 1]
         test_predictions += holdout_probs
 
     # Create a dataframe for model evaluation
     cols = ["split_number", "expected", "predicted_prob", "threshold", "predicted"]
     vals = [split_nums, targets_smoothed, out_of_fold, thresholds, predicted_out_of_fold]
-    preds = pd.DataFrame().from_items(zip(cols, vals))
+    preds = pd.DataFrame(dict(zip(cols, vals)), columns=cols)
     preds['ticker'] = ticker
     preds['model'] = label
 
@@ -394,8 +771,8 @@ def fit_sklearn_classifier(X, y, holdout, ticker, ema_gamma, n_splits, model, la
           .format(label, time.time()-start))
     print("Hyperparameters are as follows:")
     if param_search:
-        for key in gsearch_model.best_params_.keys():
-            print("{}: {}\n".format(key, gsearch_model.best_params_[key]))
+        for key in best_params.keys():
+            print("{}: {}\n".format(key, best_params[key]))
     print("Validation scores are as follows:")
     print(pd.DataFrame(scores).mean())
 
@@ -413,21 +790,46 @@ def fit_lgbm_classifier(X, y, holdout, ticker="", ema_gamma=1, n_splits=12,
                         label="LGBM Classifier", param_search=None, cv_method="ts",
                         labeled=False, groups=pd.DataFrame(), threshold_search=False,
                         ema_gamma_train=1, smooth_train_targets=False, benchmarks=False,
-                        holdout_method="distributed", export=False, **kwargs):
+                        holdout_method="distributed", export=False, fold_jobs=1,
+                        search_method="grid", search_jobs=1,
+                        search_results=hpsearch.RESULTS_PATH, target_name="",
+                        smooth_by_ticker=False, walk_forward=False, binned_cache=None,
+                        **kwargs):
     """
     Flexible function for fitting LightGBM
-    classifiers, with optional grid search.
+    classifiers, with optional grid search. With fold_jobs > 1
+    (-1 for all cores) the validation splits are fit in parallel
+    worker processes; results match the serial fit. The search is
+    'grid' or successive 'halving' over the splits, run on search_jobs
+    workers, with scores kept in the search_results table. Target
+    smoothing runs within ticker (groups['ticker']) if smooth_by_ticker.
+    With walk_forward (for the expanding 'tsrecur'/'panelrecur' splits)
+    each split continues boosting from the previous split's model.
+    With binned_cache (True, or a cache directory) the splits train on
+    row subsets of the features binned once, and the binned Dataset is
+    saved for reuse by later targets and sessions. Both run serially;
+    fold_jobs > 1 with either raises a ValueError.
     """
 
     start = time.time()
+    if walk_forward and 'recur' not in cv_method:
+        raise ValueError("walk_forward needs expanding splits ('tsrecur' or 'panelrecur')")
+    if (walk_forward or binned_cache) and fold_jobs != 1:
+        raise ValueError("walk_forward and binned_cache fit the splits serially; use fold_jobs=1")
     if 'recur' in cv_method or 'window' in cv_method:
         n_splits = 1
 
+    # Smooth targets within ticker, rather than across ticker boundaries
+    smoothing_groups = None
+    if smooth_by_ticker and not groups.empty:
+        smoothing_groups = np.asarray(groups['ticker'])
+
     # Prepare modeling structures - unpack
     features, feature_names, feature_importance_values, holdout_features, \
     test_predictions, out_of_fold, targets_smoothed, \
-    thresholds, predicted_out_of_fold, split_nums = \
-    prepare_model_structures(X, y, holdout, labeled, ema_gamma)
+    thresholds, predicted_out_of_fold, split_nums, categorical_indices = \
+    prepare_model_structures(X, y, holdout, labeled, ema_gamma,
+                             smoothing_groups=smoothing_groups)
 
     # Compute some baselines
     if benchmarks:
@@ -440,87 +842,61 @@ def fit_lgbm_classifier(X, y, holdout, ticker="", ema_gamma=1, n_splits=12,
     test_scores = []
     train_scores = []
 
-    # Perform a grid-search on the provided parameters to determine best options
+    # Search the provided parameters to determine best options
     if param_search:
-        print("Performing grid search for hyperparameter tuning")
-        gsearch = GridSearchCV(estimator=LGBMClassifier(**kwargs),
-                               cv=search_splits,
-                               param_grid=param_search)
-
-        # Fit to extract best parameters later
-        gsearch_model = gsearch.fit(features, targets_smoothed)
-
-    split_counter = 1
-    for train_indices, test_indices in splits:
-        if ('recur' or 'window') not in cv_method:
-            print("Training model on validation split #{}".format(split_counter))
-
-        # Train/test split
-        train_features, train_targets = features[train_indices], targets_smoothed[train_indices]
-        test_features, expected = features[test_indices], targets_smoothed[test_indices]
-
-        if smooth_train_targets:
-            ema = 0
-            gamma_ = ema_gamma_train
-            for t_i, _ in enumerate(train_targets):
-                ema = gamma_*train_targets[t_i] + (1-gamma_)*ema
-                train_targets[t_i] = ema
+        print("Performing {} search for hyperparameter tuning".format(search_method))
+        best_params, search_table = hpsearch.search_params(
+            LGBMClassifier, param_search, features, targets_smoothed, search_splits,
+            base_params=kwargs, fit_params={'categorical_feature':categorical_indices or 'auto'},
+            method=search_method, n_jobs=search_jobs,
+            target=target_name or hpsearch.target_key(targets_smoothed),
+            feature_names=feature_names, split_scheme="{}_{}".format(cv_method, n_splits),
+            results_path=search_results)
+
+    # Fit each validation split: on subsets of the binned panel (walking
+    # forward from the model so far, or independently), or on raw arrays,
+    # serially or on a process pool
+    params = best_params if param_search else None
+    fold_options = dict(params=params, categorical_indices=categorical_indices,
+                        verbose=('recur' or 'window') not in cv_method,
+                        smooth_train_targets=smooth_train_targets,
+                        ema_gamma_train=ema_gamma_train, smoothing_groups=smoothing_groups,
+                        threshold_search=threshold_search,
+                        holdout_method=holdout_method)
+    if walk_forward or binned_cache:
+        booster_params = _native_lgbm_params(params or LGBM_DEFAULT_PARAMS)[0]
+        panel = lgbm_cache.binned_dataset(
+            features, {key:booster_params[key] for key in LGBM_DATASET_PARAMS
+                       if key in booster_params},
+            categorical_indices, cache_dir=lgbm_cache.CACHE_DIR if binned_cache is True
+                                 else binned_cache or None)
+        folds = _fit_lgbm_binned(panel, features, targets_smoothed, holdout_features, splits,
+                                 walk_forward=walk_forward, **fold_options)
+    else:
+        folds = run_folds(_fit_lgbm_fold, splits, features, targets_smoothed,
+                          holdout_features, fold_jobs=fold_jobs, **fold_options)
 
-        # Generate a bst model given the optimal parameters established in grid search
-        if param_search:
-            bst = LGBMClassifier(**gsearch_model.best_params_)
-        else:
-            bst = LGBMClassifier(n_estimators=10000, objective='binary',
-                                 class_weight='balanced', learning_rate=0.1,
-                                 max_bin = 25, num_leaves = 25, 
-                                 max_depth = 2,
-                                 reg_alpha=0.1, reg_lambda=0.1,
-                                 subsample=0.8
-                                )
-
-        # Train the bst
-        bst.fit(train_features, train_targets, eval_metric=['auc'],
-                eval_set=[(test_features, expected), (train_features, train_targets)],
-                eval_names=['test', 'train'], early_stopping_rounds=100, verbose=0)
-
-        # Record the best iteration
-        best_iteration = bst.best_iteration_
+    # Merge the splits in order
+    for fold in folds:
+        test_indices = fold['test_indices']
 
         # Record the feature importances
-        feature_importance_values += bst.feature_importances_ / n_splits
+        feature_importance_values += fold['importances'] / n_splits
 
-        # Make predictions
         if holdout_method == "distributed":
-            test_predictions += (bst.predict_proba(holdout_features,
-                                                   num_iteration=best_iteration)[:, 1] /
-                                 n_splits)
+            test_predictions += fold['holdout_probs'] / n_splits
 
-        # Record the out of fold predictions
-        out_of_fold[test_indices] = bst.predict_proba(test_features,
-                                                      num_iteration=best_iteration)[:, 1]
-        split_nums[test_indices] = split_counter
-
-        probs = bst.predict_proba(test_features, num_iteration=best_iteration)[:, 1]
-
-        # Dynamic classification threshold selection
-        if threshold_search:
-            opt_threshold = discrimination_threshold_search(probs, expected)
-            thresholds[test_indices] = opt_threshold
-        else:
-            opt_threshold = 0.5
-            thresholds[test_indices] = opt_threshold
-
-        predicted = np.array([1 if y >= opt_threshold else 0 for y in probs])
-        predicted_out_of_fold[test_indices] = predicted
+        # Record the out of fold predictions and thresholds
+        out_of_fold[test_indices] = fold['probs']
+        split_nums[test_indices] = fold['split_number']
+        thresholds[test_indices] = fold['threshold']
+        predicted_out_of_fold[test_indices] = fold['predicted']
 
         # Record the best score
-        test_score = bst.best_score_['test']['auc']
-        train_score = bst.best_score_['train']['auc']
-
-        test_scores.append(test_score)
-        train_scores.append(train_score)
+        test_scores.append(fold['test_score'])
+        train_scores.append(fold['train_score'])
 
-        split_counter += 1
+    split_counter = len(folds) + 1
 
     # Adjust distributed metrics
     if 'recur' in cv_method or 'window' in cv_method:
@@ -534,7 +910,7 @@ def fit_lgbm_classifier(X, y, holdout, ticker="", ema_gamma=1, n_splits=12,
     # Create a dataframe for model evaluation
     cols = ["split_number", "expected", "predicted_prob", "threshold", "predicted"]
     vals = [split_nums, targets_smoothed, out_of_fold, thresholds, predicted_out_of_fold]
-    preds = pd.DataFrame().from_items(zip(cols, vals))
+    preds = pd.DataFrame(dict(zip(cols, vals)), columns=cols)
     preds['ticker'] = ticker
     preds['model'] = label
 
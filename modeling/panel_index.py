@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Panel index for the ticker/date modeling panel
+
+Built once from a frame sorted by (ticker, date_of_transaction); maps each ticker
+to its contiguous row range and each row to its position within the ticker and
+to the integer position of its date. Per-ticker work (betas, smoothing, lags,
+targets) then uses slices and array arithmetic instead of repeated
+df['ticker'] == t scans or groupby passes.
+"""
+import numpy as np
+import pandas as pd
+
+
+class PanelIndex(object):
+    """
+    Row layout of a panel sorted by ticker, then date.
+
+    tickers         ticker labels, in panel order
+    starts, ends    row range [start, end) of each ticker
+    codes           ticker number of every row
+    positions       position of every row within its ticker
+    dates           sorted unique dates (None when built without dates)
+    date_positions  position of every row's date in dates
+    """
+
+    def __init__(self, tickers, dates=None):
+        tickers = np.asarray(tickers)
+        n_rows = len(tickers)
+        changes = np.flatnonzero(tickers[1:] != tickers[:-1]) + 1
+        self.starts = np.r_[0, changes] if n_rows else np.array([], dtype=np.int64)
+        self.ends = np.r_[changes, n_rows] if n_rows else np.array([], dtype=np.int64)
+        self.tickers = tickers[self.starts].tolist()
+        if len(set(self.tickers)) != len(self.tickers):
+            raise ValueError("Panel must be sorted by ticker and date to build a PanelIndex")
+
+        lengths = self.ends - self.starts
+        self.codes = np.repeat(np.arange(len(self.starts)), lengths)
+        self.positions = np.arange(n_rows) - np.repeat(self.starts, lengths)
+        self.lengths = lengths
+        self.shape = (int(lengths.max()) if n_rows else 0, len(self.starts))
+        self._ticker_codes = {t: i for i, t in enumerate(self.tickers)}
+
+        self.dates, self.date_positions = None, None
+        if dates is not None:
+            self.dates, self.date_positions = np.unique(np.asarray(dates), return_inverse=True)
+
+    @classmethod
+    def from_frame(cls, df, group_var='ticker', date_var='date_of_transaction'):
+        return cls(df[group_var].values, df[date_var].values)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def slice(self, ticker):
+        """
+        Contiguous row range of one ticker
+        """
+        code = self._ticker_codes[ticker]
+        return slice(int(self.starts[code]), int(self.ends[code]))
+
+    def to_matrix(self, values, fill=np.nan):
+        """
+        Lay a row-aligned column out as an (observations x tickers) matrix,
+        each column holding one ticker's rows in date order, padded with fill
+        """
+        matrix = np.full(self.shape, fill, dtype=float)
+        matrix[self.positions, self.codes] = np.asarray(values, dtype=float)
+        return matrix
+
+    def from_matrix(self, matrix):
+        """
+        Inverse of to_matrix: back to an array aligned with the panel rows
+        """
+        return matrix[self.positions, self.codes]
+
+    def shift(self, values, n):
+        """
+        Shift a row-aligned column by n rows within each ticker (negative n
+        leads), as groupby(ticker).shift(n) does; missing where out of range
+        """
+        values = np.asarray(values, dtype=float)
+        shifted = np.full(len(values), np.nan)
+        source = self.positions - n
+        valid = (source >= 0) & (source < self.lengths[self.codes])
+        shifted[valid] = values[np.flatnonzero(valid) - n]
+        return shifted
+
+    def rolling_mean(self, values, window):
+        """
+        Trailing mean over `window` rows within each ticker; missing until the
+        window is full or when it contains a missing value, like
+        groupby(ticker).rolling(window).mean()
+        """
+        matrix = self.to_matrix(values)
+        means = pd.DataFrame(matrix).rolling(window).mean().values
+        return self.from_matrix(means)
@@ -7,34 +7,45 @@ Jared Berry
 """
 
 # Import necessary libraries for data preparation/EDA
-from sqlalchemy import create_engine
+import os
+import sys
 import pandas as pd
 import numpy as np
-from collections import defaultdict
+from scipy import sparse
 import pickle
+import betas
+import smoothing
+import targets
+import model_dataset
+from panel_index import PanelIndex
+
+# Shared, pooled database engine lives with the feature engineering scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'feature-engineering'))
+import dbConnection
+import dataframeHandling as dfhandle
 
 # SET-UP ----------------------------------------------------------------------
 
-# Connect to PostgresDB and pull in datasets
-engine = create_engine("postgresql://postgres:dfdk#418!@@35.237.73.115/postgres")
+# Pull in datasets from the database (DATABASE_URL, or the local SQLite fallback),
+# or from the parquet store when STORAGE_BACKEND=parquet
 
 # Yahoo! Finance
-yahoo=pd.read_sql_query('select * from stock_price', con=engine)
+yahoo=dfhandle.read_table('stock_price')
 print("Yahoo! Finance features:")
 print(yahoo.columns.tolist())
 
 # SimFin Fundamentals
-simfindaily=pd.read_sql_query('select * from daily_simfin', con=engine)
+simfindaily=dfhandle.read_table('daily_simfin')
 print("SimFin features:")
 print(simfindaily.columns.tolist())
 
 # Derived momentum features
-momentum=pd.read_sql_query('select * from momentum_features', con=engine)
+momentum=dfhandle.read_table('momentum_features')
 print("Derived features")
 print(momentum.columns.tolist())
 
 # S&P 500 index
-snp = pd.read_sql_query('select * from spy_stock_price', con = engine)
+snp = dfhandle.read_table('spy_stock_price')
 print("S&P 500")
 print(snp.columns.tolist())
 
@@ -65,6 +76,9 @@ df.head()
 # Pull out the tickers
 tickers = df['ticker'].unique().tolist()
 
+# Index the sorted panel once: ticker -> contiguous row range, date -> position
+panel = PanelIndex.from_frame(df)
+
 # COMBINED DATA SET FEATURE ENGINEERING ---------------------------------------
 
 # Replace some missing values
@@ -86,44 +100,24 @@ df['debt_to_equity'] = df['total_liabilities'] / df['total_equity']
 df['roa'] = df['net_income_y'] / df['total_assets']
 
 # Construct some additional ticker-level returns features
-df['open_l1'] = df.groupby('ticker')['Open'].shift(1)
-df['open_l5'] = df.groupby('ticker')['Open'].shift(5)
-df['open_l10'] = df.groupby('ticker')['Open'].shift(10)
+df['open_l1'] = panel.shift(df['Open'], 1)
+df['open_l5'] = panel.shift(df['Open'], 5)
+df['open_l10'] = panel.shift(df['Open'], 10)
 
 df['return_prev1_open_raw'] = 100*(df['Open'] - df['open_l1']) / df['open_l1']
 df['return_prev5_open_raw'] = 100*(df['Open'] - df['open_l5']) / df['open_l5']
 df['return_prev10_open_raw'] = 100*(df['Open'] - df['open_l10']) / df['open_l10']
 
-df['close_l1'] = df.groupby('ticker')['AdjClose'].shift(1)
-df['close_l5'] = df.groupby('ticker')['AdjClose'].shift(5)
-df['close_l10'] = df.groupby('ticker')['AdjClose'].shift(10)
+df['close_l1'] = panel.shift(df['AdjClose'], 1)
+df['close_l5'] = panel.shift(df['AdjClose'], 5)
+df['close_l10'] = panel.shift(df['AdjClose'], 10)
 
 df['return_prev1_close_raw'] = 100*(df['AdjClose'] - df['close_l1']) / df['close_l1']
 df['return_prev5_close_raw'] = 100*(df['AdjClose'] - df['close_l5']) / df['close_l5']
 df['return_prev10_close_raw'] = 100*(df['AdjClose'] - df['close_l10']) / df['close_l10']
 
-# Compute market betas
-betas = np.empty(df.shape[0])
-for t in tickers:
-    idx = df['ticker'].loc[df['ticker'] == t].index.tolist()
-    x_t = df[['date_of_transaction', 'AdjClose']].iloc[idx]
-
-    x_t = pd.merge(x_t, snp, on='date_of_transaction').sort_values('date_of_transaction')
-
-    market_return = np.array(x_t['snp500_close'].tolist())
-    asset_return = np.array(x_t['AdjClose'].tolist())
-
-    beta_vector = np.empty(len(asset_return)) * np.nan
-    i = 21
-    while i < len(beta_vector):
-        beta_vector[i] = (np.cov(market_return[:(i-1)], 
-                                 asset_return[:(i-1)])[0,1] / 
-                          np.var(market_return[:(i-1)]))
-        i += 1
-        
-    betas[idx] = beta_vector
-
-df['beta'] = betas
+# Compute expanding market betas for all tickers at once
+df['beta'] = betas.compute_market_betas(df, snp, index=panel)
 
 # Features to smooth
 to_smooth = ['High', 'Low', 'Open', 'Close', 'Volume', 'AdjClose', 'Pct_Change_Daily',
@@ -138,130 +132,44 @@ to_smooth = ['High', 'Low', 'Open', 'Close', 'Volume', 'AdjClose', 'Pct_Change_D
             'Momentum_Quality_Yearly', 'SPY_Trailing_Month_Return'
             ]
 
-# Create smoothed variants of specified features
-for feature in to_smooth:
-    print("Smoothing '{}'".format(feature))
-    x_to_smooth = np.array(df[feature].tolist())
-    col = feature + "_smoothed"
-    for t in tickers:
-        idx = df['ticker'].loc[df['ticker'] == t].index.tolist()
-        x_t = np.array(x_to_smooth[idx].tolist())
-
-        # Compute EMA smoothing of target within ticker
-        ema = 0
-        gamma_ = 0.1
-        for t_i in range(len(x_t)):
-            ema = gamma_*x_t[t_i] + (1-gamma_)*ema
-            x_t[t_i] = ema
-
-        x_to_smooth[idx] = x_t
-    df[col] = x_to_smooth
-
-# Hash the ticker to create a categorical feature
-from sklearn.feature_extraction import FeatureHasher
-h = FeatureHasher(n_features = len(tickers), input_type = 'string')
-f = h.transform(df['ticker'])
-ticker_features = f.toarray()
+# Create smoothed variants of specified features, all tickers at once
+smoothing.smooth_features(df, to_smooth, gamma=0.1, index=panel)
 
 # Remove the quarter of pre-SimFin data
 train = df[df['date_of_transaction'] >= '2011-03-31'].reset_index(drop=True)
 
+# Encode the ticker as a categorical feature: integer codes (into tickers) for
+# LightGBM's native categorical handling, and a sparse one-hot matrix for
+# models that need indicators, in place of a dense hashed matrix
+train['ticker_code'] = pd.Categorical(train['ticker'], categories=tickers).codes.astype('int32')
+ticker_features = sparse.csr_matrix((np.ones(train.shape[0]),
+                                     (np.arange(train.shape[0]), train['ticker_code'].values)),
+                                    shape=(train.shape[0], len(tickers)))
+
 # At the ticker level, lead the AdjClose column by n-trading days
 target_gen = train[['ticker', 'date_of_transaction', 'AdjClose', 
                     'Monthly_Return_Rank', 'SPY_Trailing_Month_Return', 
                     'Pct_Change_Monthly', 'beta']]
-target_gen = pd.merge(target_gen, snp, on='date_of_transaction')
-target_gen = target_gen.sort_values(['ticker', 'date_of_transaction'])
-
-# Loop over specified horizons to generate a number of possible targets
-horizons = [1,5,10,21]
-rank_threshold = 100
-target_dict = defaultdict(list)
-for h in horizons:
-    n = h # n-day ahead return
-    q = h # q-day window
-
-    # At the ticker level, lead the AdjClose column n-trading days
-    AdjClose_ahead = target_gen.groupby('ticker')['AdjClose'].shift(-n)
-    AdjClose_ahead.name = 'AdjClose_ahead'
-    
-    snp_ahead = target_gen.groupby('ticker')['snp500_close'].shift(-n)
-    snp_ahead.name = 'snp_ahead'
-
-    # Raw returns
-    target_return = np.array(100*((AdjClose_ahead - target_gen['AdjClose']) /
-                                  target_gen['AdjClose']))
-
-    # Market residualized returns
-    target_return_res = target_return - np.array(target_gen['beta'].tolist())*target_return
-
-    # Computing all of the returns for the next 21 days (month) relative to today
-    aheads = []
-    for i in range(0,n+1):
-        AdjClose_ahead_i = target_gen.groupby('ticker')['AdjClose'].shift(-i)
-        aheads.append(np.array(100*((AdjClose_ahead_i - target_gen['AdjClose']) /
-                                    target_gen['AdjClose'])))
-
-    # Composite, average returns
-    target_composite = np.array(pd.DataFrame(aheads).mean(axis=0, skipna=False).tolist())
-
-    # q-day moving average of n-day ahead returns, where n=q
-    target_gen['returns_ahead'] = 100*((AdjClose_ahead - target_gen['AdjClose']) /
-                                       target_gen['AdjClose'])
-    target_average = np.array(target_gen.groupby('ticker')['returns_ahead'].rolling(q).mean())
-
-    # Rank target, binarized
-    target_rank = target_gen.groupby('ticker')['Monthly_Return_Rank'].shift(-n)
-    target_rank = np.where(np.isnan(target_rank), np.nan,
-                  np.where(target_rank < rank_threshold, 1, 0))
-    target_rank = target_rank.tolist()
-
-    # Simple 'up' target, relative to today
-    target_up = np.where(np.isnan(AdjClose_ahead), np.nan,
-                np.where(AdjClose_ahead > target_gen['AdjClose'], 1, 0))
-    target_up = target_up.tolist()
-
-    # Returns, relative to the S&P 500
-    snp_return = np.array(100*((snp_ahead - target_gen['snp500_close']) /
-                               target_gen['snp500_close']))
-    target_rel_return = target_return - snp_return
-
-    # S&P Month Return
-    target_snp_return = target_gen.groupby('ticker')['SPY_Trailing_Month_Return'].shift(-n)
-
-    # Month Return
-    target_month_return = target_gen.groupby('ticker')['Pct_Change_Monthly'].shift(-n)
-
-    # 'Up' target, relative to today
-    target_rel_up = np.where(np.isnan(target_month_return), np.nan,
-                    np.where(target_month_return > target_snp_return, 1, 0))
-    target_rel_up = target_rel_up.tolist()
-
-    # Generate keys based on horizon
-    return_key = "target_{}_return".format(n)
-    return_res_key = "target_{}_return_res".format(n)
-    composite_key = "target_{}_composite".format(n)
-    average_key = "target_{}_average".format(n)
-    rank_key = "target_{}_rank".format(n)
-    up_key = "target_{}_up".format(n)
-    rel_return_key = "target_{}_rel_return".format(n)
-    rel_up_key = "target_{}_rel_up".format(n)
-
-    # Store
-    target_dict[return_key] = target_return
-    target_dict[return_res_key] = target_return_res
-    target_dict[composite_key] = target_composite
-    target_dict[average_key] = target_average
-    target_dict[rank_key] = target_rank
-    target_dict[up_key] = target_up
-    target_dict[rel_return_key] = target_rel_return
-    target_dict[rel_up_key] = target_rel_up
-
-# Add features to dictionary prior to export
-target_dict['features'] = train
-target_dict['ticker_features'] = ticker_features
-
-# Export
-outpath = "model_dictionary.pickle"
-with open(outpath, 'wb') as f:
-    pickle.dump(target_dict, f)
+target_gen = pd.merge(target_gen, snp, how='left', on='date_of_transaction')
+target_gen = target_gen.sort_values(['ticker', 'date_of_transaction']).reset_index(drop=True)
+target_panel = PanelIndex.from_frame(target_gen)
+
+# Generate every target for every horizon in one pass over the panel
+target_dict = targets.generate_targets(target_gen, horizons=[1,5,10,21],
+                                       rank_threshold=100, index=target_panel)
+
+# Export as a memory-mappable model dataset (one .npy file per column and target);
+# the single model_dictionary.pickle is only written with -pickle
+model_dataset.write_model_dataset("model_dataset", train, target_dict,
+                                  arrays={'ticker_features': ticker_features})
+
+if '-pickle' in sys.argv:
+    target_dict['features'] = train
+    target_dict['ticker_features'] = ticker_features
+    target_dict['tickers'] = tickers
+
+    outpath = "model_dictionary.pickle"
+    with open(outpath, 'wb') as f:
+        pickle.dump(target_dict, f)
+
+dbConnection.print_stats()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Grouped exponential moving average smoothing
+
+Smooths any number of panel columns within ticker using the recursive filter
+    ema_t = gamma * x_t + (1 - gamma) * ema_{t-1},   ema_{-1} = 0
+as scipy.signal.lfilter([gamma], [1, gamma - 1]) with a zero initial state.
+Each column is laid out as an (observations x tickers) matrix through a shared
+PanelIndex and filtered down axis 0 in a single call, so every ticker is
+smoothed at once.
+"""
+import numpy as np
+from scipy.signal import lfilter
+from panel_index import PanelIndex
+
+
+def ema_filter(x, gamma, axis=0):
+    """
+    EMA of x along axis with a zero initial state. A missing value carries
+    forward as missing for the rest of the series, as in the scalar loop
+    """
+    return lfilter([gamma], [1.0, gamma - 1.0], np.asarray(x, dtype=float), axis=axis)
+
+
+def grouped_ema(values, index, gamma):
+    """
+    EMA smoothing of one row-aligned column within each ticker of a PanelIndex
+    """
+    return index.from_matrix(ema_filter(index.to_matrix(values), gamma, axis=0))
+
+
+def smooth_series(values, gamma, groups=None):
+    """
+    EMA smoothing of a row-aligned array: within each ticker when groups (the
+    ticker of each row, rows sorted by ticker) is given, otherwise straight
+    through the array
+    """
+    if groups is None:
+        return ema_filter(values, gamma)
+    return grouped_ema(values, PanelIndex(groups), gamma)
+
+
+def smooth_features(df, columns, gamma=0.1, index=None, suffix='_smoothed'):
+    """
+    Add <column><suffix> EMA smoothed variants of each column, within ticker,
+    to df (sorted by ticker and date). Reuses index, a PanelIndex of df, when
+    given. Returns df
+    """
+    if index is None:
+        index = PanelIndex.from_frame(df)
+    for feature in columns:
+        print("Smoothing '{}'".format(feature))
+        df[feature + suffix] = grouped_ema(df[feature], index, gamma)
+    return df
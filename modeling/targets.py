@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-horizon target generation
+
+Every target of every horizon is read off a handful of (observations x tickers)
+matrices laid out once through a PanelIndex: AdjClose, the S&P 500 close, the
+monthly return rank, the monthly return and the S&P trailing month return.
+Leading a column by n trading days is then a row slice of its matrix, and the
+composite target (the mean of the 0..n-day ahead returns) is the mean forward
+price over the next n+1 rows taken from one cumulative sum, rather than n+1
+grouped shifts stacked into a DataFrame.
+"""
+import numpy as np
+import pandas as pd
+from collections import defaultdict
+from panel_index import PanelIndex
+
+HORIZONS = [1, 5, 10, 21]
+RANK_THRESHOLD = 100
+
+
+def _lead(matrix, n):
+    """
+    Rows of matrix moved up by n (n-day ahead values), NaN padded at the end
+    """
+    led = np.full(matrix.shape, np.nan)
+    if n < matrix.shape[0]:
+        led[:matrix.shape[0] - n] = matrix[n:]
+    return led
+
+
+def _lag(matrix, n):
+    """
+    Rows of matrix moved down by n, NaN padded at the start
+    """
+    lagged = np.full(matrix.shape, np.nan)
+    if n < matrix.shape[0]:
+        lagged[n:] = matrix[:matrix.shape[0] - n]
+    return lagged
+
+
+def _forward_mean(matrix, width):
+    """
+    Mean of rows t..t+width-1 of each column, from one cumulative sum; NaN when
+    the window runs past the end of the column or contains a missing value.
+    Columns are centered on their first row first to keep the sums well
+    conditioned
+    """
+    n_obs = matrix.shape[0]
+    means = np.full(matrix.shape, np.nan)
+    if width > n_obs:
+        return means
+
+    offset = np.nan_to_num(matrix[0])
+    missing = np.isnan(matrix)
+    sums = np.zeros((n_obs + 1, matrix.shape[1]))
+    np.cumsum(np.where(missing, 0.0, matrix - offset), axis=0, out=sums[1:])
+    counts = np.zeros((n_obs + 1, matrix.shape[1]), dtype=np.int64)
+    np.cumsum(missing, axis=0, out=counts[1:])
+
+    window_sum = sums[width:] - sums[:-width]
+    window_missing = counts[width:] - counts[:-width]
+    means[:n_obs - width + 1] = np.where(window_missing > 0, np.nan, window_sum / width + offset)
+    return means
+
+
+def _pct_change(ahead, current):
+    return 100 * (ahead - current) / current
+
+
+def _binarize(condition, missing):
+    return np.where(missing, np.nan, np.where(condition, 1, 0))
+
+
+def generate_targets(target_gen, horizons=HORIZONS, rank_threshold=RANK_THRESHOLD, index=None):
+    """
+    Build every target for every horizon n in horizons from target_gen, the
+    ticker/date panel (sorted by ticker and date) carrying AdjClose,
+    snp500_close, beta, Monthly_Return_Rank, Pct_Change_Monthly and
+    SPY_Trailing_Month_Return. index is a PanelIndex of target_gen to reuse.
+    Returns a dict keyed target_<n>_<kind>, each value aligned with the rows
+    of target_gen
+    """
+    if index is None:
+        index = PanelIndex.from_frame(target_gen)
+    if target_gen.shape[0] == 0:
+        return defaultdict(list)
+
+    price = index.to_matrix(target_gen['AdjClose'])
+    snp_close = index.to_matrix(target_gen['snp500_close'])
+    rank = index.to_matrix(target_gen['Monthly_Return_Rank'])
+    month_return = index.to_matrix(target_gen['Pct_Change_Monthly'])
+    snp_month_return = index.to_matrix(target_gen['SPY_Trailing_Month_Return'])
+    beta = np.asarray(target_gen['beta'], dtype=float)
+
+    target_dict = defaultdict(list)
+    for n in horizons:
+        q = n  # q-day window of n-day ahead returns
+
+        price_ahead = _lead(price, n)
+        returns_ahead = _pct_change(price_ahead, price)
+
+        # Raw and market residualized returns
+        target_return = index.from_matrix(returns_ahead)
+        target_return_res = target_return - beta*target_return
+
+        # Composite: average of the 0..n-day ahead returns, i.e. the return
+        # to the mean price over the next n+1 rows
+        target_composite = index.from_matrix(_pct_change(_forward_mean(price, n + 1), price))
+
+        # q-day trailing moving average of n-day ahead returns
+        target_average = index.from_matrix(_lag(_forward_mean(returns_ahead, q), q - 1))
+
+        # Rank target, binarized
+        rank_ahead = _lead(rank, n)
+        target_rank = index.from_matrix(_binarize(rank_ahead < rank_threshold, np.isnan(rank_ahead)))
+
+        # Simple 'up' target, relative to today
+        target_up = index.from_matrix(_binarize(price_ahead > price, np.isnan(price_ahead)))
+
+        # Returns, relative to the S&P 500
+        snp_return = index.from_matrix(_pct_change(_lead(snp_close, n), snp_close))
+        target_rel_return = target_return - snp_return
+
+        # 'Up' target: month return against the S&P month return, n days ahead
+        month_ahead = _lead(month_return, n)
+        target_rel_up = index.from_matrix(_binarize(month_ahead > _lead(snp_month_return, n),
+                                                    np.isnan(month_ahead)))
+
+        target_dict["target_{}_return".format(n)] = target_return
+        target_dict["target_{}_return_res".format(n)] = target_return_res
+        target_dict["target_{}_composite".format(n)] = target_composite
+        target_dict["target_{}_average".format(n)] = target_average
+        target_dict["target_{}_rank".format(n)] = target_rank.tolist()
+        target_dict["target_{}_up".format(n)] = target_up.tolist()
+        target_dict["target_{}_rel_return".format(n)] = target_rel_return
+        target_dict["target_{}_rel_up".format(n)] = target_rel_up.tolist()
+
+    return target_dict
+
+
+def generate_targets_by_shift(target_gen, horizons=HORIZONS, rank_threshold=RANK_THRESHOLD):
+    """
+    The original target loop: grouped shifts per horizon, and n+1 grouped
+    shifts stacked into a DataFrame for each composite. Kept as the reference
+    for generate_targets
+    """
+    target_gen = target_gen.copy()
+    grouped = target_gen.groupby('ticker')
+    target_dict = defaultdict(list)
+    for n in horizons:
+        q = n
+
+        AdjClose_ahead = grouped['AdjClose'].shift(-n)
+        snp_ahead = grouped['snp500_close'].shift(-n)
+
+        target_return = np.array(100*((AdjClose_ahead - target_gen['AdjClose']) /
+                                      target_gen['AdjClose']))
+        target_return_res = target_return - np.array(target_gen['beta'].tolist())*target_return
+
+        aheads = []
+        for i in range(0, n+1):
+            AdjClose_ahead_i = grouped['AdjClose'].shift(-i)
+            aheads.append(np.array(100*((AdjClose_ahead_i - target_gen['AdjClose']) /
+                                        target_gen['AdjClose'])))
+        target_composite = np.array(pd.DataFrame(aheads).mean(axis=0, skipna=False).tolist())
+
+        target_gen['returns_ahead'] = 100*((AdjClose_ahead - target_gen['AdjClose']) /
+                                           target_gen['AdjClose'])
+        target_average = np.array(target_gen.groupby('ticker')['returns_ahead']
+                                  .rolling(q).mean().tolist())
+
+        target_rank = grouped['Monthly_Return_Rank'].shift(-n)
+        target_rank = np.where(np.isnan(target_rank), np.nan,
+                      np.where(target_rank < rank_threshold, 1, 0)).tolist()
+
+        target_up = np.where(np.isnan(AdjClose_ahead), np.nan,
+                    np.where(AdjClose_ahead > target_gen['AdjClose'], 1, 0)).tolist()
+
+        snp_return = np.array(100*((snp_ahead - target_gen['snp500_close']) /
+                                   target_gen['snp500_close']))
+        target_rel_return = target_return - snp_return
+
+        target_snp_return = grouped['SPY_Trailing_Month_Return'].shift(-n)
+        target_month_return = grouped['Pct_Change_Monthly'].shift(-n)
+        target_rel_up = np.where(np.isnan(target_month_return), np.nan,
+                        np.where(target_month_return > target_snp_return, 1, 0)).tolist()
+
+        target_dict["target_{}_return".format(n)] = target_return
+        target_dict["target_{}_return_res".format(n)] = target_return_res
+        target_dict["target_{}_composite".format(n)] = target_composite
+        target_dict["target_{}_average".format(n)] = target_average
+        target_dict["target_{}_rank".format(n)] = target_rank
+        target_dict["target_{}_up".format(n)] = target_up
+        target_dict["target_{}_rel_return".format(n)] = target_rel_return
+        target_dict["target_{}_rel_up".format(n)] = target_rel_up
+
+    return target_dict
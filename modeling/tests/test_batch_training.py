@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the multi-target batch trainer
+"""
+import numpy as np
+import batch_training
+import modeling_funcs as mf
+from test_lgbm_folds import synthetic_panel
+
+
+def synthetic_targets(n_holdout=50):
+    """
+    The synthetic panel with its last n_holdout targets unknown, as the most
+    recent days of a real panel
+    """
+    X, y = synthetic_panel()
+    y = y.copy()
+    y[-n_holdout:] = np.nan
+    return X, y
+
+
+def test_binary_targets_keep_their_labels():
+    X, y = synthetic_targets()
+    binary = np.where(y > 0, 1, np.where(np.isnan(y), np.nan, 0))
+    batch = batch_training.fit_target_batch(X, {'target_binary':binary, 'target_return':y},
+                                            ema_gamma=0.5, n_splits=3, results_path=None)
+
+    known = batch['known_rows']
+    labels = batch['labels']
+    assert np.array_equal(labels['target_binary'], binary[known])
+    assert 0 < labels['target_binary'].mean() < 1
+    smoothed = np.where(mf.smooth_targets(y[known], 0.5) > 0, 1, 0)
+    assert np.array_equal(labels['target_return'], smoothed)
+
+
+def test_lgbm_batch_matches_fit_lgbm_classifier():
+    X, y = synthetic_targets()
+    batch = batch_training.fit_target_batch(X, {'target_return':y}, n_splits=3,
+                                            results_path=None)
+    known = batch['known_rows']
+    single = mf.fit_lgbm_classifier(X[known], y[known], X[~known], n_splits=3)
+
+    assert np.allclose(batch['out_of_fold']['target_return'],
+                       single['preds_df']['predicted_prob'], rtol=0, atol=1e-12)
+    assert np.allclose(batch['holdout_probs']['target_return'],
+                       single['holdout_probs'], rtol=0, atol=1e-12)
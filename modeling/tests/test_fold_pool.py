@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Fold fitting on the process pool against the serial loop
+"""
+import os
+import time
+import numpy as np
+from lightgbm import LGBMClassifier
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+import fold_pool
+import modeling_funcs as mf
+from test_lgbm_folds import synthetic_panel
+
+
+def _slow_square(features, targets, holdout_features, job, delay):
+    # The first jobs finish last
+    time.sleep(delay)
+    return job, job ** 2, features.shape
+
+
+def _thread_params(features, targets, holdout_features, model, params):
+    return fold_pool.worker_params(model, params)
+
+
+def test_run_jobs_returns_results_in_job_order():
+    features = np.zeros((4, 2))
+    jobs = [(job, 0.01 * (6 - job)) for job in range(6)]
+    serial = fold_pool.run_jobs(_slow_square, jobs, features, None)
+    parallel = fold_pool.run_jobs(_slow_square, jobs, features, None, n_jobs=3)
+    assert parallel == serial == [(job, job ** 2, (4, 2)) for job in range(6)]
+
+
+def test_workers_share_the_cores():
+    share = max(1, (os.cpu_count() or 1) // 2)
+    jobs = [(LGBMClassifier, {}), (RandomForestClassifier, {'n_jobs':3}),
+            (GradientBoostingClassifier, {})]
+    assert fold_pool.run_jobs(_thread_params, jobs, None, None, n_jobs=2) == \
+        [{'n_jobs':share}, {'n_jobs':3}, {}]
+    # Serial fits keep the estimator's own default
+    assert fold_pool.run_jobs(_thread_params, jobs, None, None) == [{}, {'n_jobs':3}, {}]
+
+
+def test_parallel_lgbm_folds_match_serial():
+    X, y = synthetic_panel()
+    serial = mf.fit_lgbm_classifier(X, y, X.iloc[:50], n_splits=3)
+    parallel = mf.fit_lgbm_classifier(X, y, X.iloc[:50], n_splits=3, fold_jobs=2)
+
+    assert np.array_equal(parallel['preds_df']['predicted_prob'],
+                          serial['preds_df']['predicted_prob'])
+    assert np.array_equal(parallel['holdout_probs'], serial['holdout_probs'])
+    assert parallel['validation_auc'] == serial['validation_auc']
+
+
+def test_parallel_sklearn_folds_match_serial():
+    X, y = synthetic_panel(n_rows=600)
+    options = dict(n_estimators=20, max_depth=3, random_state=0)
+    serial = mf.fit_sklearn_classifier(X, y, X.iloc[:50], "", 1, 3, RandomForestClassifier,
+                                       "Random Forest", **options)
+    parallel = mf.fit_sklearn_classifier(X, y, X.iloc[:50], "", 1, 3, RandomForestClassifier,
+                                         "Random Forest", fold_jobs=3, **options)
+
+    assert np.array_equal(parallel['preds_df']['predicted_prob'],
+                          serial['preds_df']['predicted_prob'])
+    assert np.array_equal(parallel['holdout_probs'], serial['holdout_probs'])
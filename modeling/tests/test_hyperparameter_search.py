@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Grid and successive-halving search with the persistent score table
+"""
+import os
+import numpy as np
+import pandas as pd
+from sklearn import metrics
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from lightgbm import LGBMClassifier
+import hyperparameter_search as hpsearch
+from test_lgbm_binned import expanding_splits
+from test_lgbm_folds import synthetic_panel
+
+
+class CountingLogisticRegression(LogisticRegression):
+    """
+    Logistic regression counting its fits (the search runs serially here)
+    """
+    fits = 0
+
+    def fit(self, X, y, sample_weight=None):
+        CountingLogisticRegression.fits += 1
+        return super(CountingLogisticRegression, self).fit(X, y, sample_weight)
+
+
+def search_data(n_splits=3):
+    X, y = synthetic_panel(n_rows=600)
+    return X.values, np.where(y > 0, 1, 0), expanding_splits(len(y), n_splits)
+
+
+def table_rows(path):
+    return pd.read_csv(path).shape[0]
+
+
+def test_models_with_the_same_grid_do_not_share_scores(tmpdir):
+    features, targets, splits = search_data()
+    path = os.path.join(str(tmpdir), 'results.csv')
+    grid = {'n_estimators':[5, 10], 'max_depth':[2]}
+    options = dict(base_params={'random_state':0}, target='target_1', split_scheme='ts_3')
+
+    hpsearch.search_params(RandomForestClassifier, grid, features, targets, splits,
+                           results_path=path, **options)
+    assert table_rows(path) == 6
+    _, cached = hpsearch.search_params(ExtraTreesClassifier, grid, features, targets, splits,
+                                       results_path=path, **options)
+    assert table_rows(path) == 12
+    _, fresh = hpsearch.search_params(ExtraTreesClassifier, grid, features, targets, splits,
+                                      results_path=None, **options)
+    pd.testing.assert_frame_equal(cached, fresh)
+
+    # A different scoring function is a new fit too
+    hpsearch.search_params(ExtraTreesClassifier, grid, features, targets, splits,
+                           scoring=metrics.average_precision_score, results_path=path, **options)
+    assert table_rows(path) == 18
+
+
+def test_fit_params_are_part_of_the_key(tmpdir):
+    features, targets, splits = search_data()
+    path = os.path.join(str(tmpdir), 'results.csv')
+    grid = {'n_estimators':[5], 'verbose':[-1]}
+    for fit_params, rows in [({'categorical_feature':'auto'}, 3),
+                             ({'categorical_feature':[0]}, 6),
+                             ({'categorical_feature':[0]}, 6)]:
+        hpsearch.search_params(LGBMClassifier, grid, features, targets, splits,
+                               fit_params=fit_params, target='target_1', split_scheme='ts_3',
+                               results_path=path)
+        assert table_rows(path) == rows
+
+def test_halving_promotes_the_best_and_resumes(tmpdir):
+    features, targets, splits = search_data(n_splits=9)
+    path = os.path.join(str(tmpdir), 'results.csv')
+    grid = {'C':list(np.logspace(-6, 2, 9))}
+    options = dict(method='halving', factor=3, target='target_1', split_scheme='ts_9')
+
+    CountingLogisticRegression.fits = 0
+    best, table = hpsearch.search_params(CountingLogisticRegression, grid, features, targets,
+                                         splits, results_path=path, **options)
+    # 9 candidates on 1 split, the best 3 on 3 splits, the best 1 on all 9
+    assert sorted(table['n_splits'].tolist()) == [1] * 6 + [3] * 2 + [9]
+    assert CountingLogisticRegression.fits == 9 * 1 + 3 * 2 + 1 * 6
+    first = table[table['n_splits'] == 1]['mean_score'].max()
+    promoted = table[table['n_splits'] > 1]
+    later = pd.read_csv(path)
+    first_split = later[later['split_number'] == 1].set_index('params')['score']
+    assert first_split[promoted['params']].min() >= np.sort(first_split.values)[-3]
+    assert first_split.max() >= first
+    assert hpsearch.params_key(best) == table['params'][0]
+
+    # A second session reads every score back
+    resumed_best, resumed = hpsearch.search_params(CountingLogisticRegression, grid, features,
+                                                   targets, splits, results_path=path, **options)
+    assert CountingLogisticRegression.fits == 21
+    assert resumed_best == best
+    pd.testing.assert_frame_equal(resumed, table)
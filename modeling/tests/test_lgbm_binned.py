@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+LightGBM training on the binned panel: walk-forward and cached paths
+"""
+import numpy as np
+import pytest
+import lgbm_cache
+import modeling_funcs as mf
+from test_lgbm_folds import synthetic_panel
+
+
+def expanding_splits(n_rows, n_splits):
+    bounds = np.linspace(0, n_rows, n_splits + 2).astype(int)
+    return [(np.arange(bounds[i]), np.arange(bounds[i], bounds[i + 1]))
+            for i in range(1, n_splits + 1)]
+
+
+def test_walk_forward_importances_count_each_split_once():
+    X, y = synthetic_panel()
+    features, targets = X.values, np.where(y > 0, 1, 0)
+    # Stumps: every tree adds one split to the importances
+    params = dict(mf.LGBM_DEFAULT_PARAMS, max_depth=1, num_leaves=2)
+    panel = lgbm_cache.binned_dataset(features, {'max_bin':params['max_bin']})
+
+    folds = mf._fit_lgbm_binned(panel, features, targets, features[:50],
+                                expanding_splits(len(targets), 3), walk_forward=True,
+                                params=params, verbose=False)
+
+    for fold in folds:
+        assert fold['importances'].sum() == fold['best_iteration']
+
+
+def test_binned_cache_matches_uncached(tmpdir):
+    X, y = synthetic_panel()
+    uncached = mf.fit_lgbm_classifier(X, y, X.iloc[:50], n_splits=3)
+    cached = mf.fit_lgbm_classifier(X, y, X.iloc[:50], n_splits=3, binned_cache=str(tmpdir))
+
+    assert np.allclose(cached['preds_df']['predicted_prob'],
+                       uncached['preds_df']['predicted_prob'], rtol=0, atol=1e-12)
+    assert np.allclose(cached['holdout_probs'], uncached['holdout_probs'], rtol=0, atol=1e-12)
+    assert cached['validation_auc'] == uncached['validation_auc']
+
+
+def test_binned_cache_is_serial():
+    X, y = synthetic_panel()
+    with pytest.raises(ValueError):
+        mf.fit_lgbm_classifier(X, y, X.iloc[:50], n_splits=3, binned_cache=True, fold_jobs=2)
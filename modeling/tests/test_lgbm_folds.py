@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+LightGBM fold fitting on a small synthetic panel
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import modeling_funcs as mf
+
+
+def synthetic_panel(n_rows=2000, n_features=8, seed=0):
+    """
+    Integer features (fewer values than max_bin, so every row subset bins
+    them the same way) and a continuous target driven by the first two
+    """
+    rng = np.random.RandomState(seed)
+    X = pd.DataFrame(rng.randint(0, 10, size=(n_rows, n_features)).astype(float),
+                     columns=['f{}'.format(i) for i in range(n_features)])
+    y = X['f0'] - X['f1'] + rng.normal(0, 3, size=n_rows)
+    return X, y.values
+
+
+def test_fit_lgbm_fold():
+    X, y = synthetic_panel()
+    features = X.values
+    targets = np.where(y > 0, 1, 0)
+    train_indices, test_indices = np.arange(1500), np.arange(1500, 2000)
+
+    fold = mf._fit_lgbm_fold(features, targets, features[:50], 1, train_indices,
+                             test_indices, verbose=False)
+
+    assert fold['probs'].shape == (500,)
+    assert fold['holdout_probs'].shape == (50,)
+    assert fold['importances'].shape == (8,)
+    assert 0.6 < fold['test_score'] <= 1
+
+
+def test_fit_lgbm_classifier():
+    X, y = synthetic_panel()
+    results = mf.fit_lgbm_classifier(X, y, X.iloc[:50], n_splits=3)
+
+    assert len(results['validation_auc']) == 3
+    assert results['preds_df'].shape[0] == X.shape[0]
+    assert results['holdout_probs'].shape == (50,)
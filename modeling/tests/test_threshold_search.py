@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Discrimination threshold search against the per-threshold sci-kit learn loop
+"""
+import warnings
+
+import numpy as np
+import pytest
+from sklearn import metrics
+import modeling_funcs as mf
+
+
+def loop_threshold_search(predicted, expected, metric, search_min=0.25, search_max=0.75):
+    thresholds = list(np.arange(search_min, search_max, 0.05))
+    scores = [metric(expected, [1 if y >= t else 0 for y in predicted]) for t in thresholds]
+    return thresholds[scores.index(max(scores))]
+
+
+@pytest.mark.parametrize('metric', [metrics.precision_score, metrics.recall_score,
+                                    metrics.f1_score, metrics.accuracy_score,
+                                    metrics.matthews_corrcoef, metrics.balanced_accuracy_score])
+def test_threshold_search_matches_loop(metric):
+    rng = np.random.RandomState(0)
+    expected = rng.randint(0, 2, size=500)
+    predicted = np.clip(0.5 * expected + rng.uniform(0, 0.6, size=500), 0, 1)
+
+    assert mf.discrimination_threshold_search(predicted, expected, metric=metric) == \
+        pytest.approx(loop_threshold_search(predicted, expected, metric))
+
+
+def test_threshold_search_by_name():
+    predicted = np.array([0.1, 0.4, 0.6, 0.9])
+    expected = np.array([0, 0, 1, 1])
+    assert mf.discrimination_threshold_search(predicted, expected, metric='specificity',
+                                              thresholds=[0.3, 0.5]) == 0.5
+
+
+@pytest.mark.parametrize('metric', [metrics.precision_score, metrics.recall_score,
+                                    metrics.f1_score, metrics.accuracy_score,
+                                    metrics.matthews_corrcoef, metrics.balanced_accuracy_score])
+@pytest.mark.parametrize('positive_rate', [0.0, 0.3, 1.0])
+def test_count_metrics_match_sklearn(metric, positive_rate):
+    rng = np.random.RandomState(1)
+    expected = (rng.uniform(size=200) < positive_rate).astype(int)
+    predicted = rng.uniform(size=200)
+    # Thresholds past either end predict a single class
+    thresholds = np.array([-0.1, 0.1, 0.35, 0.5, 0.8, 1.1])
+
+    counts = mf.threshold_confusion_counts(predicted, expected, thresholds)
+    with warnings.catch_warnings():
+        # sci-kit learn warns, then scores 0, where a ratio is undefined
+        warnings.simplefilter('ignore')
+        sklearn_scores = [metric(expected, (predicted >= t).astype(int)) for t in thresholds]
+
+    np.testing.assert_allclose(mf.CONFUSION_METRICS[mf.SKLEARN_METRICS[metric]](*counts),
+                               sklearn_scores, atol=1e-12)
+
+
+def test_threshold_search_with_counts_function():
+    rng = np.random.RandomState(2)
+    expected = rng.randint(0, 2, size=300)
+    predicted = np.clip(0.4 * expected + rng.uniform(0, 0.6, size=300), 0, 1)
+
+    def youden_j(tp, fp, fn, tn):
+        return tp / (tp + fn) + tn / (tn + fp) - 1
+
+    def youden_j_labels(y_true, y_pred):
+        return metrics.recall_score(y_true, y_pred) + metrics.recall_score(y_true, y_pred, pos_label=0) - 1
+
+    assert mf.discrimination_threshold_search(predicted, expected, metric=youden_j) == \
+        pytest.approx(loop_threshold_search(predicted, expected, youden_j_labels))
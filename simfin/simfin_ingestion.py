@@ -6,7 +6,15 @@ Code to stack SimFin intermediaries/load into Postgres DB
 Jared Berry
 """
 
+import os
+import sys
 import pandas as pd
+import driver
+
+# Columnar store and the storage backend switch live with the feature engineering scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'feature-engineering'))
+import columnarStore
+import dataframeHandling as dfhandle
 
 # Set up connection to Postgres DB
 # from sqlalchemy import create_engine
@@ -49,3 +57,10 @@ shares_data = pd.read_csv('simfin_shares.csv')
 pd.concat(pls, axis=0).to_csv('qtrly_simfin_pl.csv', index=False)
 pd.concat(cfs, axis=0).to_csv('qtrly_simfin_cf.csv', index=False)
 pd.concat(bss, axis=0).to_csv('qtrly_simfin_bs.csv', index=False)
+
+# Also store typed parquet copies for the wrangling step when STORAGE_BACKEND=parquet
+if dfhandle.use_parquet():
+    columnarStore.write_dataset(pd.concat(pls, axis=0), 'qtrly_simfin_pl', date_column=None, if_exists='replace')
+    columnarStore.write_dataset(pd.concat(cfs, axis=0), 'qtrly_simfin_cf', date_column=None, if_exists='replace')
+    columnarStore.write_dataset(pd.concat(bss, axis=0), 'qtrly_simfin_bs', date_column=None, if_exists='replace')
+    columnarStore.write_dataset(shares_data, 'simfin_shares', date_column=None, if_exists='replace')
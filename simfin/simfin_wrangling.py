@@ -10,11 +10,18 @@ TO-DO:
 Jared Berry
 """
 from functools import reduce
+import os
+import sys
 import re
 import pandas as pd
 import simfin_setup
 import driver
 
+# Columnar store and the storage backend switch live with the feature engineering scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'feature-engineering'))
+import columnarStore
+import dataframeHandling as dfhandle
+
 # from sqlalchemy import create_engine
 
 def slugify(value):
@@ -40,6 +47,11 @@ def main():
     if driver.PULL_SQL:
         print("Not hooked up")
         quit()
+    elif dfhandle.use_parquet():
+        cf_data = columnarStore.read_dataset('qtrly_simfin_cf')
+        pl_data = columnarStore.read_dataset('qtrly_simfin_pl')
+        bs_data = columnarStore.read_dataset('qtrly_simfin_bs')
+        shares_data = columnarStore.read_dataset('simfin_shares')
     else:
         cf_data = pd.read_csv('qtrly_simfin_cf.csv')
         pl_data = pd.read_csv('qtrly_simfin_pl.csv')
@@ -178,6 +190,8 @@ def main():
                                       
     # Export
     daily_simfin.to_csv('daily_simfin.csv', index=False)
+    if dfhandle.use_parquet():
+        columnarStore.write_dataset(daily_simfin, 'daily_simfin', date_column='date', if_exists='replace')
     # daily_simfin.to_sql('daily_simfin', con=engine, if_exists='replace')
 
 if __name__ == '__main__':